@@ -0,0 +1,123 @@
+"""
+Compare the vectorized analytics engine with the original row-wise
+DataService analytics (one pass over the record dicts per metric), which
+this module keeps as the reference the engine's output must equal.
+
+Usage: python -m benchmarks.analytics_engine [--data-dir DIR] [--repeat N]
+"""
+
+import argparse
+import time
+
+from src.services.analytics_engine import CountBy, CountByYear, Mean, Sum
+from src.services.columnar_store import ColumnarDataset
+from src.services.data_analytics_service import DataService
+
+
+def count_by(metric, records):
+    counts = {}
+    for record in records:
+        value = record.get(metric.field, "Unknown")
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+def count_by_year(metric, records):
+    year_counts = {}
+    for record in records:
+        date_str = record.get(metric.field)
+        if date_str:
+            try:
+                # Handle different date formats
+                if " " in date_str:
+                    date_part = date_str.split(" ")[0]
+                else:
+                    date_part = date_str
+
+                year = date_part.split("-")[0]
+                year_counts[year] = year_counts.get(year, 0) + 1
+            except Exception:
+                continue
+    return year_counts
+
+
+def total(metric, records):
+    return sum(metric.cast(r.get(metric.field, 0)) for r in records)
+
+
+def mean(metric, records):
+    total = 0
+    count = 0
+    for record in records:
+        value = record.get(metric.field)
+        if value and str(value).isdigit():
+            total += int(value)
+            count += 1
+    return total / count if count > 0 else 0
+
+
+ROW_WISE = {CountBy: count_by, CountByYear: count_by_year, Sum: total, Mean: mean}
+
+
+def evaluate_records(engine, dataset_name, records):
+    """The analytics of a dataset computed row-wise, one scan per metric"""
+    analytics = {}
+    for metric in engine.specs.get(dataset_name, []):
+        target = analytics
+        for key in metric.path[:-1]:
+            target = target.setdefault(key, {})
+        target[metric.path[-1]] = ROW_WISE[type(metric)](metric, records)
+    return analytics
+
+
+def best_of(func, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            result = func()
+        except Exception as e:
+            result = type(e)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    service = DataService(data_dir=args.data_dir)
+    engine = service.analytics_engine
+    print(
+        f"{'dataset':<40}{'records':>9}{'row-wise':>12}{'vectorized':>12}{'speedup':>10}"
+    )
+    for dataset_name in service.get_available_datasets():
+        opened = service.open_dataset(dataset_name)
+        if opened is None:
+            continue
+        _, dataset = opened
+
+        def row_wise():
+            return evaluate_records(engine, dataset_name, dataset.rows())
+
+        def vectorized():
+            # Start from undecoded columns so decoding is part of the timing
+            fresh = ColumnarDataset(dataset.fields, dataset.columns)
+            return engine.evaluate(dataset_name, fresh)
+
+        slow, expected = best_of(row_wise, args.repeat)
+        fast, actual = best_of(vectorized, args.repeat)
+        if actual != expected:
+            raise AssertionError(f"Vectorized analytics differ for {dataset_name}")
+
+        print(
+            f"{dataset_name:<40}{len(dataset):>9}"
+            f"{slow * 1000:>10.2f}ms{fast * 1000:>10.2f}ms{slow / fast:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare per-vertex and batched coordinate reprojection in HeatmapService.
+
+Usage: python -m benchmarks.heatmap_reprojection [--repeat N]
+"""
+
+import argparse
+import json
+import time
+
+from src.services.heatmap_service import HeatmapService
+
+
+def per_vertex(service, geometries):
+    """Reference path: one transformer call and one dict per vertex"""
+    points = []
+    for geom in geometries:
+        coords = service.parse_coordinates(geom)
+        for i in range(0, len(coords), 2):
+            converted = service.convert_to_latlon(coords[i], coords[i + 1])
+            if converted:
+                points.append(converted)
+    return points
+
+
+def batched(service, geometries):
+    """Batched path: a single transformer call over contiguous arrays"""
+    lat, lng, _ = service.reproject_geometries(geometries)
+    return service.to_points(lat, lng)
+
+
+def best_of(func, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    service = HeatmapService()
+    print(
+        f"{'dataset':<40}{'vertices':>10}{'per-vertex':>14}{'batched':>12}{'speedup':>10}"
+    )
+    for file_path in sorted(service.data_dir.glob("*.json")):
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        field_names = [field["id"] for field in data["fields"]]
+        if "GEOMETRIA" not in field_names:
+            continue
+        index = field_names.index("GEOMETRIA")
+        geometries = [record[index] for record in data["records"]]
+
+        slow, expected = best_of(lambda: per_vertex(service, geometries), args.repeat)
+        fast, actual = best_of(lambda: batched(service, geometries), args.repeat)
+        if actual != expected:
+            raise AssertionError(f"Batched output differs for {file_path.name}")
+
+        print(
+            f"{file_path.stem:<40}{len(actual):>10}"
+            f"{slow * 1000:>12.2f}ms{fast * 1000:>10.2f}ms{slow / fast:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
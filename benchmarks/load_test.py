@@ -0,0 +1,132 @@
+"""
+Load-test /get_heatmap_data and /get_dataset under gunicorn at several worker
+counts, reporting requests per second and p50/p99 latency per endpoint.
+
+Usage: python -m benchmarks.load_test [--workers 1 2 4] [--duration S]
+                                      [--concurrency N] [--url BASE_URL]
+
+With --url the running server at BASE_URL is measured instead of starting
+gunicorn for each worker count.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+import numpy as np
+
+PATHS = [
+    "/get_heatmap_data?type=speed-reducer",
+    "/get_heatmap_data?type=traffic-light-signaling&format=columnar",
+    "/get_heatmap_data?type=short-term-parking&agg=grid&cell=200m",
+    "/get_dataset/sinalizacao_semaforica?page=1&per_page=100",
+    "/get_dataset/posto_venda_rotativo?page=2&per_page=50",
+]
+
+
+def start_server(workers, port):
+    """Start gunicorn with the production profile and wait until it answers"""
+    env = dict(
+        os.environ,
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        GUNICORN_ACCESS_LOG="",
+        GUNICORN_LOG_LEVEL="warning",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            urllib.request.urlopen(base_url + PATHS[-1], timeout=1).read()
+            return server, base_url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.25)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def run_load(base_url, duration, concurrency):
+    """Hit every path round-robin from concurrency threads for duration seconds"""
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(offset):
+        i = offset
+        while time.monotonic() < deadline:
+            path = PATHS[i % len(PATHS)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(base_url + path, timeout=30).read()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies[path].append(elapsed)
+            except (urllib.error.URLError, OSError):
+                with lock:
+                    errors[path] += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def report(label, latencies, errors, duration):
+    total = sum(len(v) for v in latencies.values())
+    print(f"\n{label}: {total / duration:.1f} req/s overall")
+    print(f"{'path':<66}{'req/s':>9}{'p50':>10}{'p99':>10}{'errors':>8}")
+    for path in PATHS:
+        samples = np.asarray(latencies.get(path, [])) * 1000
+        p50, p99 = (
+            np.percentile(samples, [50, 99]) if len(samples) else (np.nan, np.nan)
+        )
+        print(
+            f"{path:<66}{len(samples) / duration:>9.1f}{p50:>8.1f}ms{p99:>8.1f}ms"
+            f"{errors.get(path, 0):>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="measure an already running server")
+    args = parser.parse_args()
+
+    if args.url:
+        latencies, errors = run_load(args.url, args.duration, args.concurrency)
+        report(args.url, latencies, errors, args.duration)
+        return
+
+    for workers in args.workers:
+        server, base_url = start_server(workers, args.port)
+        try:
+            latencies, errors = run_load(base_url, args.duration, args.concurrency)
+        finally:
+            server.terminate()
+            server.wait()
+        report(f"{workers} worker(s)", latencies, errors, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Measure road graph build time and point-to-point routing latency of the
+offline routing backend on random origin/destination pairs.
+
+Usage: python -m benchmarks.local_routing [--pairs N] [--seed S]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from src.services.local_routing import LocalRoutingService
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pairs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    service = LocalRoutingService()
+    start = time.perf_counter()
+    graph = service.graph
+    build = time.perf_counter() - start
+    print(
+        f"graph: {graph.node_count} nodes, {graph.edge_count} edges, "
+        f"built in {build * 1000:.1f}ms"
+    )
+    if not graph.node_count:
+        return
+
+    rng = np.random.default_rng(args.seed)
+    nodes = rng.integers(0, graph.node_count, size=(args.pairs, 2))
+    lat, lng = service.to_latlon.transform(graph.x[nodes], graph.y[nodes])
+    locations = [
+        (f"{lat[i, 0]},{lng[i, 0]}", f"{lat[i, 1]},{lng[i, 1]}")
+        for i in range(args.pairs)
+    ]
+
+    timings, found = [], 0
+    for origin, destination in locations:
+        start = time.perf_counter()
+        route = service.get_route(origin, destination, "driving")
+        timings.append(time.perf_counter() - start)
+        found += route is not None
+
+    timings = np.asarray(timings) * 1000
+    p50, p99 = np.percentile(timings, [50, 99])
+    print(
+        f"{args.pairs} routes ({found} connected): p50 {p50:.2f}ms, "
+        f"p99 {p99:.2f}ms, {args.pairs / timings.sum() * 1000:.0f} routes/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
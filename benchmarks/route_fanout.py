@@ -0,0 +1,146 @@
+"""
+Compare serial and concurrent route planning against a local fake
+Directions API that answers every request after a fixed delay.
+
+Usage: python -m benchmarks.route_fanout [--latency MS] [--stops N] [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from src.services.google_maps_api import GoogleMapsService
+from src.services.route_cache import RouteCache
+from src.services.route_planner import RoutePlanner, split_itinerary
+from src.services.wire_format import encode_polyline
+
+
+def fake_location(address):
+    """Deterministic coordinates for an address"""
+    seed = zlib.crc32(address.encode("utf-8"))
+    return -19.9 + (seed % 1000) / 10_000, -43.9 + (seed // 1000 % 1000) / 10_000
+
+
+class FakeDirectionsHandler(BaseHTTPRequestHandler):
+    """Answers /maps/api/directions/json with one leg per stop-to-stop hop"""
+
+    latency = 0.1
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        stops = [query["origin"][0]]
+        if "waypoints" in query:
+            stops += [
+                w for w in query["waypoints"][0].split("|") if w != "optimize:true"
+            ]
+        stops.append(query["destination"][0])
+
+        legs = []
+        for start, end in zip(stops[:-1], stops[1:]):
+            meters = 500 + zlib.crc32(f"{start}|{end}".encode("utf-8")) % 5000
+            legs.append(
+                {
+                    "start_address": start,
+                    "end_address": end,
+                    "distance": {"text": f"{meters / 1000:.1f} km", "value": meters},
+                    "duration": {
+                        "text": f"{meters // 250} mins",
+                        "value": meters * 0.24,
+                    },
+                }
+            )
+
+        lat, lng = zip(*(fake_location(stop) for stop in stops))
+        body = {
+            "status": "OK",
+            "routes": [
+                {
+                    "legs": legs,
+                    "overview_polyline": {
+                        "points": encode_polyline(np.array(lat), np.array(lng))
+                    },
+                }
+            ],
+        }
+
+        time.sleep(self.latency)
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=100.0, help="milliseconds")
+    parser.add_argument("--stops", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    FakeDirectionsHandler.latency = args.latency / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeDirectionsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ["GOOGLE_MAPS_SERVER_KEY"] = "AIzaFAKEKEYFORBENCHMARKS"
+    os.environ["GOOGLE_MAPS_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    # A zero TTL keeps every run going to the fake server
+    service = GoogleMapsService(route_cache=RouteCache(ttl=0))
+    planner = RoutePlanner(service)
+
+    addresses = [f"Stop {i}, Belo Horizonte" for i in range(args.stops)]
+    modes = ["driving", "transit", "walking"]
+
+    def serial():
+        return {
+            mode: [
+                service.get_route(part[0], part[-1], mode, part[1:-1] or None)
+                for part in split_itinerary(addresses, mode)
+            ]
+            for mode in modes
+        }
+
+    requests = sum(len(split_itinerary(addresses, mode)) for mode in modes)
+    serial_time, _ = best_of(args.repeat, serial)
+    parallel_time, results = best_of(
+        args.repeat, lambda: planner.compare(addresses, modes)
+    )
+    assert all(results.values()), "fake server returned no route"
+
+    print(
+        f"{args.stops} stops, modes {modes}: {requests} upstream requests "
+        f"of {args.latency:.0f}ms"
+    )
+    print(f"  serial     {serial_time * 1000:>9.1f}ms")
+    print(f"  concurrent {parallel_time * 1000:>9.1f}ms")
+    for mode, result in results.items():
+        route = result["route"]
+        print(
+            f"  {mode:<10} {len(route['segments'])} segments, "
+            f"{route['total_distance_km']} km, {route['total_duration_mins']} mins"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
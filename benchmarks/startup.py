@@ -0,0 +1,106 @@
+"""
+Measure how quickly a fresh worker process serves its first requests.
+
+Each run starts a new interpreter that creates the app (without a Google
+Maps key), optionally loads a BOOT_SNAPSHOT of pre-built caches, and then
+times its first "/" and its first heatmap layer through the test client.
+The "snapshot" scenario writes the snapshot once beforehand.
+
+Usage: python -m benchmarks.startup [--runs N] [--layer TYPE] [--budget S]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from src.main.app import create_app, load_snapshot, save_snapshot, warm_caches
+app = create_app()
+created = time.perf_counter()
+mode, path, layer = sys.argv[1:4]
+if mode == "write":
+    warm_caches(app)
+    save_snapshot(app, path)
+    raise SystemExit(0)
+if mode == "snapshot":
+    load_snapshot(app, path)
+booted = time.perf_counter()
+client = app.test_client()
+assert client.get("/").status_code == 200
+home = time.perf_counter()
+heavy = sorted(m for m in ("pyproj", "googlemaps", "pandas", "geopandas") if m in sys.modules)
+assert client.get("/get_heatmap_data?type=" + layer).status_code == 200
+served = time.perf_counter()
+print(json.dumps({
+    "create_app": created - start,
+    "boot": booted - start,
+    "home": home - start,
+    "layer": served - start,
+    "heavy_imports": heavy,
+}))
+"""
+
+
+def run_child(mode, snapshot, layer):
+    env = {k: v for k, v in os.environ.items() if k != "GOOGLE_MAPS_SERVER_KEY"}
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, mode, str(snapshot), layer],
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    ).stdout.decode("utf-8")
+    lines = output.strip().splitlines()
+    return json.loads(lines[-1]) if lines else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--layer", default="traffic-light-signaling")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=1.0,
+        help="Seconds within which the first layer must be served",
+    )
+    args = parser.parse_args()
+
+    snapshot = Path(tempfile.gettempdir()) / "smart_cities_startup.snapshot"
+    run_child("write", snapshot, args.layer)
+
+    print(
+        f"{'scenario':<12}{'create_app':>12}{'boot':>10}{'first /':>10}"
+        f"{'layer':>10}  heavy imports before the layer"
+    )
+    over_budget = False
+    for scenario in ("cold", "snapshot"):
+        results = [run_child(scenario, snapshot, args.layer) for _ in range(args.runs)]
+        median = {
+            key: float(np.median([r[key] for r in results]))
+            for key in ("create_app", "boot", "home", "layer")
+        }
+        print(
+            f"{scenario:<12}{median['create_app'] * 1000:>10.0f}ms"
+            f"{median['boot'] * 1000:>8.0f}ms{median['home'] * 1000:>8.0f}ms"
+            f"{median['layer'] * 1000:>8.0f}ms  {', '.join(results[-1]['heavy_imports']) or '-'}"
+        )
+        over_budget |= scenario == "snapshot" and median["layer"] > args.budget
+
+    snapshot.unlink(missing_ok=True)
+    if over_budget:
+        print(f"First layer took longer than {args.budget:g}s with a snapshot")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Benchmark suite over synthetic datasets at several city scales.
+
+For each scale the datasets are generated once (see benchmarks.synthetic)
+under --work-dir, then measured in a fresh process so that peak RSS is
+per scale: HeatmapService.load_data (cold and warm), DataService.load_dataset
+(cold), the analytics engine, rollup cube queries, and the Flask endpoints
+through the test client. Latency is reported as p50/p95 over --repeat runs, throughput as
+operations per second.
+
+With --baseline FILE the results are compared against a previous run and
+the exit status is 1 if any case's p50 latency or a scale's peak RSS grew
+by more than --threshold (a fraction). --save-baseline writes FILE instead.
+
+Usage: python -m benchmarks.suite [--scales 10 100 1000] [--repeat N]
+                                  [--work-dir DIR] [--ingest]
+                                  [--baseline FILE [--save-baseline]]
+                                  [--threshold 0.25]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic import generate
+
+# p50 changes smaller than this (ms) are never reported as regressions
+MIN_REGRESSION_MS = 1.0
+
+
+def timings(func, repeat, setup=None):
+    """
+    Seconds taken by repeat calls of func, each after setup() if given, or
+    None if func raises (the case is then left out of the results).
+    """
+    try:
+        if setup is not None:
+            setup()
+        func()
+    except Exception as e:
+        print(f"Skipping {func}: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples, records=None):
+    if samples is None:
+        return None
+    samples = np.asarray(samples)
+    summary = {
+        "p50_ms": round(float(np.percentile(samples, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(samples, 95)) * 1000, 3),
+        "ops_per_s": round(len(samples) / float(samples.sum()), 2),
+    }
+    if records is not None:
+        summary["records"] = records
+    return summary
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(data_dir, repeat):
+    """Run every case against the datasets in data_dir; returns {case: summary}"""
+    os.environ.setdefault("GOOGLE_MAPS_SERVER_KEY", "AIzaFAKEKEYFORBENCHMARKS")
+    from src.main.app import create_app
+    from src.main.routes import routes
+    from src.services.columnar_store import ColumnarDataset
+    from src.services.data_analytics_service import DataService
+    from src.services.heatmap_service import FILE_MAPPING, HeatmapService
+    from src.services.rollup_cube import CubeService
+
+    heatmap_service = HeatmapService(data_dir=data_dir)
+    data_service = DataService(data_dir=data_dir)
+    cube_service = CubeService(data_service)
+    cases = {}
+
+    def clear_heatmap():
+        heatmap_service.cache.clear()
+        heatmap_service._datasets.clear()
+        heatmap_service._indexes.clear()
+        heatmap_service._bitmaps.clear()
+
+    for heatmap_type, filename in FILE_MAPPING.items():
+        if not (Path(data_dir) / filename).exists():
+            continue
+        load = partial(heatmap_service.load_data, heatmap_type)
+        cases[f"heatmap.load_cold[{heatmap_type}]"] = summarize(
+            timings(load, repeat, clear_heatmap)
+        )
+        cases[f"heatmap.load_warm[{heatmap_type}]"] = summarize(timings(load, repeat))
+
+    def clear_datasets():
+        data_service._datasets.clear()
+        data_service._analytics.clear()
+        data_service._indexes.clear()
+
+    engine = data_service.analytics_engine
+    for dataset_name in data_service.get_available_datasets():
+        if not (Path(data_dir) / f"{dataset_name}.json").exists():
+            continue
+        load = partial(data_service.load_dataset, dataset_name)
+        _, dataset = data_service.open_dataset(dataset_name)
+        cases[f"dataset.load_cold[{dataset_name}]"] = summarize(
+            timings(load, repeat, clear_datasets), len(dataset)
+        )
+
+        def evaluate():
+            # Undecoded columns, so column decoding is part of the timing
+            fresh = ColumnarDataset(dataset.fields, dataset.columns)
+            return engine.evaluate(dataset_name, fresh)
+
+        cases[f"analytics.evaluate[{dataset_name}]"] = summarize(
+            timings(evaluate, repeat), len(dataset)
+        )
+
+        cube = cube_service.cube(dataset_name)
+        if cube is not None and cube.dimensions:
+            query = partial(cube_service.query, dataset_name, cube.dimensions[:2])
+            cases[f"analytics.query[{dataset_name}]"] = summarize(
+                timings(query, repeat), len(dataset)
+            )
+
+    # Point the blueprint at the synthetic data
+    routes.heatmap_service = heatmap_service
+    routes.data_service = data_service
+    client = create_app().test_client()
+    paths = [
+        f"/get_heatmap_data?type={heatmap_type}"
+        for heatmap_type, filename in FILE_MAPPING.items()
+        if (Path(data_dir) / filename).exists()
+    ] + [
+        f"/get_dataset/{dataset_name}?page=1&per_page=100"
+        for dataset_name in data_service.get_available_datasets()
+        if (Path(data_dir) / f"{dataset_name}.json").exists()
+    ]
+
+    def fetch(path):
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        return response.get_data()
+
+    for path in paths:
+        cases[f"endpoint[{path}]"] = summarize(timings(partial(fetch, path), repeat))
+    return {case: summary for case, summary in cases.items() if summary is not None}
+
+
+def run_scale(data_dir, repeat, ingest):
+    """Measure one scale in a child process; returns its result dict"""
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.suite",
+        "--measure",
+        str(data_dir),
+        "--repeat",
+        str(repeat),
+    ]
+    if ingest:
+        command.append("--ingest")
+    output = subprocess.run(
+        command, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    ).stdout
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def prepare(work_dir, scale, seed):
+    """Directory holding the datasets of a scale, generated on first use"""
+    data_dir = Path(work_dir) / f"x{scale:g}"
+    marker = data_dir / "generated.json"
+    if marker.exists() and json.loads(marker.read_text()).get("seed") == seed:
+        return data_dir
+    print(f"Generating {scale:g}x datasets in {data_dir}", file=sys.stderr)
+    written = generate(data_dir, scale, seed)
+    marker.write_text(json.dumps({"scale": scale, "seed": seed, "records": written}))
+    return data_dir
+
+
+def regressions(baseline, results, threshold):
+    """Descriptions of every case or scale that got slower or bigger"""
+    found = []
+    for scale, result in results.items():
+        base = baseline.get(scale)
+        if base is None:
+            continue
+        if result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold):
+            found.append(
+                f"{scale}x peak RSS {base['peak_rss_mb']:.1f} -> "
+                f"{result['peak_rss_mb']:.1f} MB"
+            )
+        for case, summary in result["cases"].items():
+            before = base["cases"].get(case)
+            if before is None:
+                continue
+            slower = summary["p50_ms"] - before["p50_ms"]
+            if (
+                summary["p50_ms"] > before["p50_ms"] * (1 + threshold)
+                and slower > MIN_REGRESSION_MS
+            ):
+                found.append(
+                    f"{scale}x {case} p50 {before['p50_ms']:.2f} -> "
+                    f"{summary['p50_ms']:.2f} ms"
+                )
+    return found
+
+
+def report(results):
+    print(f"{'scale':>6}  {'case':<78}{'p50':>11}{'p95':>11}{'ops/s':>10}")
+    for scale, result in results.items():
+        for case, summary in result["cases"].items():
+            print(
+                f"{scale:>5}x  {case:<78}{summary['p50_ms']:>9.2f}ms"
+                f"{summary['p95_ms']:>9.2f}ms{summary['ops_per_s']:>10.1f}"
+            )
+        print(f"{scale:>5}x  peak RSS {result['peak_rss_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scales", type=float, nargs="+", default=[10, 100])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--work-dir",
+        default=str(Path(tempfile.gettempdir()) / "smart_cities_benchmarks"),
+    )
+    parser.add_argument(
+        "--ingest",
+        action="store_true",
+        help="Compile the columnar store before measuring",
+    )
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        if args.ingest:
+            from ingest import ingest
+
+            ingest(args.measure)
+        cases = measure(args.measure, args.repeat)
+        print(json.dumps({"peak_rss_mb": round(peak_rss_mb(), 1), "cases": cases}))
+        return
+
+    results = {}
+    for scale in args.scales:
+        data_dir = prepare(args.work_dir, scale, args.seed)
+        results[f"{scale:g}"] = run_scale(data_dir, args.repeat, args.ingest)
+    report(results)
+
+    if not args.baseline:
+        return
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    found = regressions(baseline, results, args.threshold)
+    for regression in found:
+        print(f"REGRESSION {regression}")
+    if found:
+        sys.exit(1)
+    print(f"No regressions beyond {args.threshold:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
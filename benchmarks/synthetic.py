@@ -0,0 +1,151 @@
+"""
+Generate synthetic, larger-city copies of the datasets for benchmarking.
+
+Every dataset of DataService.available_datasets is scaled to factor times
+its record count. New records are copies of randomly chosen real records
+with fresh _id / ID_* values and their geometry moved to another part of
+the city (within the bounds of the source layer, in EPSG:32723 metres),
+so field distributions and POINT/LINESTRING shapes stay realistic.
+
+Usage: python -m benchmarks.synthetic --scale 10 --out DIR [--seed N]
+"""
+
+import argparse
+import json
+import random
+import re
+from pathlib import Path
+
+from src.services.data_analytics_service import DataService
+
+# Where the source exports are looked up, in order
+SOURCE_DIRS = ("data", "dammy data")
+
+# Largest distance (metres) a copied geometry is moved from its template
+MAX_SHIFT = 3000.0
+# Per-vertex noise (metres) so copies are not exact translations
+VERTEX_JITTER = 2.0
+
+_COORDINATE = re.compile(r"(-?\d+(?:\.\d+)?) (-?\d+(?:\.\d+)?)")
+
+
+def find_source(dataset_name, source_dirs=SOURCE_DIRS):
+    """Path of the first export of a dataset found in source_dirs, or None"""
+    for source_dir in source_dirs:
+        path = Path(source_dir) / f"{dataset_name}.json"
+        if path.exists():
+            return path
+    return None
+
+
+def layer_bounds(geometries):
+    """(min_x, min_y, max_x, max_y) of every vertex of some WKT geometries"""
+    xs, ys = [], []
+    for geometry in geometries:
+        if isinstance(geometry, str):
+            for x, y in _COORDINATE.findall(geometry):
+                xs.append(float(x))
+                ys.append(float(y))
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def shift_geometry(geometry, dx, dy, rng, jitter=VERTEX_JITTER):
+    """A WKT geometry moved by (dx, dy) metres, each vertex jittered slightly"""
+
+    def move(match):
+        x = float(match.group(1)) + dx + rng.uniform(-jitter, jitter)
+        y = float(match.group(2)) + dy + rng.uniform(-jitter, jitter)
+        return f"{x:.2f} {y:.2f}"
+
+    return _COORDINATE.sub(move, geometry)
+
+
+def synthetic_records(raw_data, factor, rng):
+    """Yield factor * len(records) records modelled on the given CKAN export"""
+    field_ids = [field["id"] for field in raw_data["fields"]]
+    records = raw_data["records"]
+    if not records:
+        return
+
+    geometry_index = field_ids.index("GEOMETRIA") if "GEOMETRIA" in field_ids else None
+    id_indices = [
+        i
+        for i, field in enumerate(raw_data["fields"])
+        if field["id"] == "_id"
+        or (field["id"].startswith("ID_") and field.get("type") == "int")
+    ]
+    bounds = None
+    if geometry_index is not None:
+        bounds = layer_bounds(record[geometry_index] for record in records)
+
+    for n in range(int(len(records) * factor)):
+        record = list(rng.choice(records))
+        for i in id_indices:
+            record[i] = n + 1
+        geometry = record[geometry_index] if geometry_index is not None else None
+        if isinstance(geometry, str) and bounds is not None:
+            # Keep the moved geometry inside the layer's extent
+            first = _COORDINATE.search(geometry)
+            if first is not None:
+                x, y = float(first.group(1)), float(first.group(2))
+                dx = rng.uniform(
+                    max(-MAX_SHIFT, bounds[0] - x), min(MAX_SHIFT, bounds[2] - x)
+                )
+                dy = rng.uniform(
+                    max(-MAX_SHIFT, bounds[1] - y), min(MAX_SHIFT, bounds[3] - y)
+                )
+                record[geometry_index] = shift_geometry(geometry, dx, dy, rng)
+        yield record
+
+
+def write_dataset(raw_data, factor, out_path, seed=0):
+    """Write a scaled copy of a CKAN export, streaming the records to disk"""
+    rng = random.Random(seed)
+    count = 0
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write('{"fields": ')
+        json.dump(raw_data["fields"], f, ensure_ascii=False)
+        f.write(', "records": [')
+        for record in synthetic_records(raw_data, factor, rng):
+            if count:
+                f.write(",\n")
+            json.dump(record, f, ensure_ascii=False)
+            count += 1
+        f.write("]}")
+    return count
+
+
+def generate(out_dir, factor, seed=0, source_dirs=SOURCE_DIRS):
+    """Scale every available dataset into out_dir; returns {name: records}"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = {}
+    for i, dataset_name in enumerate(DataService().get_available_datasets()):
+        source = find_source(dataset_name, source_dirs)
+        if source is None:
+            continue
+        with open(source, "r", encoding="utf-8") as f:
+            raw_data = json.load(f)
+        if not isinstance(raw_data, dict) or "records" not in raw_data:
+            continue
+        written[dataset_name] = write_dataset(
+            raw_data, factor, out_dir / f"{dataset_name}.json", seed + i
+        )
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=float, required=True)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for dataset_name, count in generate(args.out, args.scale, args.seed).items():
+        print(f"{dataset_name:<40}{count:>10} records")
+
+
+if __name__ == "__main__":
+    main()
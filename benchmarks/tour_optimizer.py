@@ -0,0 +1,44 @@
+"""
+Time the tour solver on random Euclidean instances and compare its tour
+length with the plain nearest-neighbour tour.
+
+Usage: python -m benchmarks.tour_optimizer [--stops 100 300 500] [--seed S]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from src.services.tour_optimizer import nearest_neighbour, path_cost, solve_tour
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stops", type=int, nargs="+", default=[100, 300, 500])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'stops':>6}{'solve':>11}{'nearest':>12}{'optimized':>12}{'saving':>9}")
+    for n in args.stops:
+        points = rng.uniform(0, 10_000, size=(n, 2))
+        cost = np.hypot(
+            points[:, None, 0] - points[None, :, 0],
+            points[:, None, 1] - points[None, :, 1],
+        )
+
+        start = time.perf_counter()
+        order = solve_tour(cost)
+        elapsed = time.perf_counter() - start
+
+        greedy = path_cost(cost, np.append(nearest_neighbour(cost), 0))
+        optimized = path_cost(cost, np.asarray(order))
+        print(
+            f"{n:>6}{elapsed * 1000:>9.1f}ms{greedy / 1000:>10.1f}km"
+            f"{optimized / 1000:>10.1f}km{1 - optimized / greedy:>9.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
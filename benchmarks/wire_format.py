@@ -0,0 +1,50 @@
+"""
+Compare serialization time and payload size of the heatmap wire formats.
+
+Usage: python -m benchmarks.wire_format [--repeat N]
+"""
+
+import argparse
+import json
+import time
+
+from src.services.heatmap_service import FILE_MAPPING, HeatmapService
+from src.services.wire_format import FORMATS, encode_layer
+
+
+def serialize(fmt, lat, lng, details):
+    """Encode a layer and turn it into response bytes, as the route does"""
+    layer = encode_layer(fmt, lat, lng, details)
+    if isinstance(layer, bytes):
+        return layer
+    return json.dumps(layer).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    service = HeatmapService()
+    header = "".join(f"{fmt:>22}" for fmt in FORMATS)
+    print(f"{'layer':<32}{'points':>8}{header}")
+    for heatmap_type, filename in FILE_MAPPING.items():
+        if not (service.data_dir / filename).exists():
+            continue
+
+        _, lat, lng, details = service.layer_points(heatmap_type)
+
+        cells = []
+        for fmt in FORMATS:
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                payload = serialize(fmt, lat, lng, details)
+                best = min(best, time.perf_counter() - start)
+            cells.append(f"{best * 1000:>9.2f}ms {len(payload) / 1024:>8.1f}KB")
+
+        print(f"{heatmap_type:<32}{len(lat):>8}" + "".join(f"{c:>22}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
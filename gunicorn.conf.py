@@ -0,0 +1,23 @@
+# Production serving profile: gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Recycle workers now and then to cap memory growth; jitter avoids restarting
+# them all at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "500"))
+
+# Import the app (and warm its caches, see wsgi.py) once in the master so the
+# parsed data is shared copy-on-write by every worker
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() not in ("0", "false", "no")
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
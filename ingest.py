@@ -0,0 +1,302 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+import numpy as np
+from src.services.columnar_store import ColumnarDataset, ColumnarStore, row_hash
+from src.services.data_analytics_service import DataService
+from src.services.heatmap_service import HeatmapService
+from src.services.proximity import NEAREST_TABLES, ProximityService
+from src.services.rollup_cube import CubeService
+from src.services.vector_tiles import TileService
+
+
+def ingest(data_dir, dataset_names=None):
+    """
+    Compile data/*.json exports into the columnar store under data/store,
+    with typed columns and GEOMETRIA pre-reprojected to WGS84, and drop the
+    tile pyramids of the versions it replaces.
+    """
+    log = logging.getLogger("ingest")
+    data_service = DataService(data_dir=data_dir)
+    heatmap_service = HeatmapService(data_dir=data_dir)
+    store = ColumnarStore(Path(data_dir) / "store")
+
+    for dataset_name in dataset_names or data_service.get_available_datasets():
+        file_path = Path(data_dir) / f"{dataset_name}.json"
+        if not file_path.exists():
+            log.warning(f"Skipping {dataset_name}: {file_path} not found")
+            continue
+
+        source_version = store.source_version(file_path)
+        with open(file_path, "r", encoding="utf-8") as f:
+            raw_data = json.load(f)
+        write_dataset(store, heatmap_service, dataset_name, raw_data, source_version)
+
+    write_proximity_tables(data_dir, dataset_names)
+    write_cubes(data_dir, dataset_names)
+    prune_tiles(data_dir, dataset_names)
+
+
+def write_dataset(store, heatmap_service, dataset_name, raw_data, source_version):
+    """Encode a decoded CKAN export and publish it as the dataset's live version"""
+    dataset = ColumnarDataset.from_json(
+        raw_data, reproject=heatmap_service.reproject_geometries, hash_rows=True
+    )
+    version = store.write(dataset_name, dataset, source_version)
+    logging.getLogger("ingest").info(
+        f"Ingested {dataset_name}: {len(dataset)} records -> {version}"
+    )
+    return dataset
+
+
+def write_proximity_tables(data_dir, dataset_names=None):
+    """Refresh the nearest-neighbour tables involving the given datasets (default: all)"""
+    proximity_service = ProximityService(DataService(data_dir=data_dir))
+    for source, target in NEAREST_TABLES:
+        if dataset_names is None or {source, target} & set(dataset_names):
+            proximity_service.write_table(source, target)
+
+
+def write_cubes(data_dir, dataset_names=None):
+    """Materialize the analytics rollup cubes of the given datasets (default: all)"""
+    data_service = DataService(data_dir=data_dir)
+    cube_service = CubeService(data_service)
+    for dataset_name in dataset_names or data_service.get_available_datasets():
+        if (Path(data_dir) / f"{dataset_name}.json").exists():
+            cube_service.write_cube(dataset_name)
+
+
+def prerender_tiles(data_dir, max_zoom=None):
+    """Write the vector tile pyramid of every tile layer up to max_zoom"""
+    data_service = DataService(data_dir=data_dir)
+    tile_service = TileService(
+        HeatmapService(data_dir=data_dir), data_service.get_available_datasets()
+    )
+    for name in tile_service.datasets():
+        tile_service.prerender(name, max_zoom)
+
+
+def prune_tiles(data_dir, dataset_names=None):
+    """Drop the tile pyramids of older versions of the given datasets (default: all)"""
+    data_service = DataService(data_dir=data_dir)
+    tile_service = TileService(
+        HeatmapService(data_dir=data_dir), data_service.get_available_datasets()
+    )
+    for name in tile_service.datasets():
+        if dataset_names is None or name in dataset_names:
+            tile_service.prune(name)
+
+
+def update_proximity_tables(data_dir, dataset_name, previous, old_to_new, changed):
+    """Update the nearest-neighbour tables involving a refreshed dataset"""
+    proximity_service = ProximityService(DataService(data_dir=data_dir))
+    for source, target in NEAREST_TABLES:
+        if dataset_name in (source, target):
+            proximity_service.update_table(
+                source, target, dataset_name, previous, old_to_new, changed
+            )
+
+
+def diff_records(dataset, raw_data):
+    """
+    Match the records of a new CKAN dump against a stored dataset by _id and
+    content hash. Returns (matched, same, hashes): matched[i] is the stored
+    row with the _id of record i or -1, same[i] whether that row holds
+    record i unchanged. Returns None when the dump cannot be diffed (other
+    fields, no hashes).
+    """
+    fields = raw_data.get("fields", [])
+    if fields != dataset.fields or dataset.row_hashes is None:
+        return None
+    try:
+        id_index = [field["id"] for field in fields].index("_id")
+    except ValueError:
+        return None
+
+    records = raw_data.get("records", [])
+    stored = {row_id: i for i, row_id in enumerate(dataset.column("_id"))}
+    matched = np.fromiter(
+        (
+            stored.get(record[id_index] if id_index < len(record) else None, -1)
+            for record in records
+        ),
+        dtype=np.int64,
+        count=len(records),
+    )
+    hashes = np.fromiter(
+        (row_hash(record) for record in records), dtype=np.uint64, count=len(records)
+    )
+    same = matched >= 0
+    same[same] = np.asarray(dataset.row_hashes)[matched[same]] == hashes[same]
+    return matched, same, hashes
+
+
+def refresh(data_dir, dataset_name, dump_path=None):
+    """
+    Apply a new open-data portal dump of a dataset to the columnar store.
+    Diffing reads the dump once and hashes each record. After that the cost
+    follows the changes: only inserted and updated records are parsed and
+    reprojected, only the columns they touch are rewritten (the others are
+    hard-linked from the live version), the proximity tables and cubes are
+    updated from the changed records, and tile pyramids of older versions
+    are dropped. The result is published as a new version, so readers keep
+    the old one until the CURRENT swap; dump_path, when given, replaces
+    data/<dataset>.json only after that swap. Falls back to a full ingest
+    when the live version cannot be diffed.
+    """
+    log = logging.getLogger("ingest")
+    file_path = Path(data_dir) / f"{dataset_name}.json"
+    source_path = file_path
+    if dump_path is not None:
+        # Staged next to the data file, whose (mtime, size) the rename keeps
+        source_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}")
+        shutil.copyfile(dump_path, source_path)
+    elif not file_path.exists():
+        log.warning(f"Skipping {dataset_name}: {file_path} not found")
+        return None
+
+    try:
+        result = _refresh_store(data_dir, dataset_name, source_path)
+        if source_path != file_path:
+            os.replace(source_path, file_path)
+    finally:
+        if source_path != file_path:
+            source_path.unlink(missing_ok=True)
+
+    if result is None:
+        write_proximity_tables(data_dir, [dataset_name])
+        write_cubes(data_dir, [dataset_name])
+        prune_tiles(data_dir, [dataset_name])
+        return None
+
+    counts, current, dataset, old_to_new, changed = result
+    previous = ("store", current.version)
+    update_proximity_tables(data_dir, dataset_name, previous, old_to_new, changed)
+    cube_service = CubeService(DataService(data_dir=data_dir))
+    cube_service.update_cube(
+        dataset_name,
+        previous,
+        current.take(np.flatnonzero(old_to_new < 0)),
+        dataset.take(changed),
+    )
+    prune_tiles(data_dir, [dataset_name])
+    return counts
+
+
+def _refresh_store(data_dir, dataset_name, source_path):
+    """
+    Publish the dump at source_path as the next version of a dataset.
+    Returns (counts, previous dataset, new dataset, old_to_new, changed),
+    where old_to_new maps the previous rows to their new row (-1 if updated
+    or deleted) and changed lists the new rows of updated and inserted
+    records; None after a full ingest.
+    """
+    log = logging.getLogger("ingest")
+    store = ColumnarStore(Path(data_dir) / "store")
+    current = store.open(dataset_name)
+    source_version = store.source_version(source_path)
+    with open(source_path, "r", encoding="utf-8") as f:
+        raw_data = json.load(f)
+
+    diff = diff_records(current, raw_data) if current is not None else None
+    if diff is None:
+        log.info(f"Cannot diff {dataset_name} against the store, ingesting it fully")
+        heatmap_service = HeatmapService(data_dir=data_dir)
+        write_dataset(store, heatmap_service, dataset_name, raw_data, source_version)
+        return None
+    matched, same, hashes = diff
+    changed = np.flatnonzero(~same)
+
+    # The dump's records stay in dump order, so record i becomes row i
+    old_to_new = np.full(len(current), -1, dtype=np.int64)
+    old_to_new[matched[same]] = np.flatnonzero(same)
+    survivors = matched[matched >= 0]
+    inserted = int(np.count_nonzero(matched < 0))
+    counts = {
+        "inserted": inserted,
+        "updated": len(changed) - inserted,
+        "deleted": len(current) - len(np.unique(survivors)),
+    }
+
+    if not len(changed) and not counts["deleted"] and np.all(np.diff(matched) > 0):
+        log.info(f"{dataset_name} is unchanged ({len(current)} records)")
+        store.write(dataset_name, current, source_version, base=current)
+        return counts, current, current, old_to_new, changed
+
+    records = raw_data["records"]
+    heatmap_service = HeatmapService(data_dir=data_dir)
+    delta = ColumnarDataset.from_json(
+        {"fields": raw_data["fields"], "records": [records[i] for i in changed]},
+        reproject=heatmap_service.reproject_geometries,
+    )
+    delta.row_hashes = hashes[changed]
+
+    # In the usual case the surviving records keep their relative order and
+    # new ones come last: patch the live version in place. Otherwise rebuild
+    # the order from the live rows and the delta.
+    last_survivor = np.flatnonzero(matched >= 0)[-1:]
+    in_order = np.all(np.diff(survivors) > 0) and not np.any(
+        np.flatnonzero(matched < 0) < (last_survivor[0] if len(last_survivor) else 0)
+    )
+    if in_order:
+        is_update = matched[changed] >= 0
+        deleted = np.setdiff1d(np.arange(len(current)), survivors)
+        dataset = current.patch(
+            matched[changed][is_update],
+            delta.take(np.flatnonzero(is_update)),
+            deleted,
+            delta.take(np.flatnonzero(~is_update)),
+        )
+    else:
+        # Unchanged rows point into the live version, changed ones past its end
+        rows = np.where(same, matched, -1)
+        rows[changed] = len(current) + np.arange(len(changed))
+        dataset = current.append(delta).take(rows)
+    version = store.write(dataset_name, dataset, source_version, base=current)
+
+    log.info(
+        f"Refreshed {dataset_name}: {counts['inserted']} inserted, "
+        f"{counts['updated']} updated, {counts['deleted']} deleted -> {version}"
+    )
+    return counts, current, dataset, old_to_new, changed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Compile data/*.json into the columnar binary store"
+    )
+    parser.add_argument("datasets", nargs="*", help="Datasets to ingest (default: all)")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Apply only the records that changed since the live version",
+    )
+    parser.add_argument(
+        "--dump", help="New portal dump to refresh a single dataset from"
+    )
+    parser.add_argument(
+        "--tiles",
+        type=int,
+        metavar="MAX_ZOOM",
+        help="Also pre-render the vector tile pyramid up to MAX_ZOOM",
+    )
+    args = parser.parse_args()
+    if args.dump and len(args.datasets) != 1:
+        parser.error("--dump needs exactly one dataset")
+    if args.incremental or args.dump:
+        names = (
+            args.datasets
+            or DataService(data_dir=args.data_dir).get_available_datasets()
+        )
+        for name in names:
+            refresh(args.data_dir, name, args.dump)
+    else:
+        ingest(args.data_dir, args.datasets)
+    if args.tiles is not None:
+        prerender_tiles(args.data_dir, args.tiles)
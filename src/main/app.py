@@ -1,5 +1,7 @@
 import logging
 import os
+import pickle
+import uuid
 from logging.handlers import RotatingFileHandler
 from flask import Flask
 from dotenv import load_dotenv
@@ -26,6 +28,95 @@ def create_app():
     return app
 
 
+def warm_caches(app):
+    """
+    Load every dataset and full heatmap layer into the process-wide caches,
+    so that workers forked afterwards share them instead of each parsing the
+    data on its first requests.
+    """
+    from src.main.routes.routes import data_service, heatmap_service
+    from src.services.heatmap_service import FILE_MAPPING
+
+    for dataset_name in data_service.get_available_datasets():
+        data_service.load_dataset(dataset_name, page=1, per_page=1)
+
+    for heatmap_type in FILE_MAPPING:
+        try:
+            heatmap_service.load_data(heatmap_type)
+        except Exception:
+            # Already logged; the layer is built again on its first request
+            continue
+
+    app.logger.info(
+        f"Warmed caches for {len(data_service.get_available_datasets())} datasets "
+        f"and {len(FILE_MAPPING)} heatmap layers"
+    )
+
+
+# Bump when the layout of the cached values changes
+SNAPSHOT_FORMAT = 2
+
+# First line of a snapshot file, checked before anything is unpickled
+SNAPSHOT_HEADER = f"smart-cities-snapshot {SNAPSHOT_FORMAT}\n".encode("ascii")
+
+
+def _snapshot_caches():
+    """name -> (snapshot, restore) of the caches kept in boot snapshots"""
+    from src.main.routes.routes import data_service, heatmap_service
+
+    return {
+        "heatmap_layers": (
+            heatmap_service.cache.snapshot,
+            heatmap_service.cache.restore,
+        ),
+        "dataset_analytics": (
+            data_service.analytics_snapshot,
+            data_service.restore_analytics,
+        ),
+    }
+
+
+def save_snapshot(app, path):
+    """
+    Write the built heatmap layers and dataset analytics to path, so later
+    boots can load them instead of rebuilding them from the data files.
+    """
+    caches = {name: snapshot() for name, (snapshot, _) in _snapshot_caches().items()}
+    tmp = f"{path}.{uuid.uuid4().hex}"
+    with open(tmp, "wb") as f:
+        f.write(SNAPSHOT_HEADER)
+        pickle.dump(caches, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    app.logger.info(f"Wrote cache snapshot to {path}")
+
+
+def load_snapshot(app, path):
+    """
+    Restore caches written by save_snapshot. A snapshot written in another
+    format is ignored without unpickling it. Entries keep their source
+    version, so those built from older data are never served. Returns False
+    if there is no usable snapshot at path.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.readline(len(SNAPSHOT_HEADER)) != SNAPSHOT_HEADER:
+                app.logger.warning(f"Ignoring cache snapshot {path} in another format")
+                return False
+            caches = pickle.load(f)
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        app.logger.error(f"Error reading cache snapshot {path}: {str(e)}")
+        return False
+
+    restores = _snapshot_caches()
+    for name, entries in caches.items():
+        if name in restores:
+            restores[name][1](entries)
+    app.logger.info(f"Loaded cache snapshot from {path}")
+    return True
+
+
 def configure_logging(app):
     """
     Configure logging for the Flask application.
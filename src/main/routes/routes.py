@@ -1,16 +1,137 @@
 import logging
-from flask import Blueprint, render_template, request, jsonify, current_app
+import os
+import time
+from functools import partial
+from flask import (
+    Blueprint,
+    Response,
+    g,
+    render_template,
+    request,
+    jsonify,
+    current_app,
+)
+from src.services.density import (
+    GRID_MIMETYPE,
+    PNG_MIMETYPE,
+    DensityService,
+    parse_bandwidth,
+)
 from src.services.google_maps_api import GoogleMapsService
-from src.models.trecho import CompleteRoute, RouteSegment
 from src.services.heatmap_service import HeatmapService
+from src.services.http_cache import ResponseCache, make_etag, request_arguments
+from src.services.aggregation import (
+    AGGREGATIONS,
+    MAX_CELL_SIZE,
+    MIN_CELL_SIZE,
+    parse_cell_size,
+)
+from src.services.bitmap_index import parse_filter
+from src.services.lazy import LazyService
+from src.services.local_routing import LocalRoutingService
+from src.services import metrics
+from src.services.proximity import MAX_DISTANCE, PROXIMITY_MODES, ProximityService
+from src.services.rollup_cube import CubeService, parse_group_by
+from src.services.route_planner import TRAVEL_MODES, RoutePlanner
+from src.services.spatial_index import cell_size_for_zoom, parse_bbox
+from src.services.streaming import STREAM_MIMETYPES, encode_stream, parse_stream
+from src.services.vector_tiles import MAX_ZOOM, MVT_MIMETYPE, TileService, valid_tile
+from src.services.wire_format import MIMETYPES, negotiate_format
 from src.services.data_analytics_service import DataService
 
+# Largest number of stops /optimize_tour accepts. A tour over the Google
+# backend bills stops^2 Distance Matrix elements, so it is capped far lower;
+# larger tours need ROUTING_BACKEND=local
+MAX_TOUR_STOPS = 500
+MAX_GOOGLE_TOUR_STOPS = int(os.getenv("MAX_GOOGLE_TOUR_STOPS", "25"))
+
 routes_bp = Blueprint("routes", __name__)
 logger = logging.getLogger(__name__)
 
-maps_service = GoogleMapsService()
+# Services are built on first use, so the app starts (and serves pages)
+# quickly and without a Google Maps key
+maps_service = LazyService(GoogleMapsService)
+
+
+def _local_routing():
+    # ROUTING_BACKEND=local routes offline over the road network in data/
+    return os.getenv("ROUTING_BACKEND", "google").lower() == "local"
+
+
+def _route_backend():
+    if _local_routing():
+        return LocalRoutingService(data_dir="data")
+    return maps_service.get()
+
+
+route_backend = LazyService(_route_backend)
+
+route_planner = RoutePlanner(
+    route_backend, max_workers=int(os.getenv("ROUTE_PLANNER_WORKERS", "8"))
+)
+
+data_service = LazyService(lambda: DataService(data_dir="data"), "DataService")
+
+heatmap_service = LazyService(HeatmapService)
+
+proximity_service = LazyService(
+    lambda: ProximityService(data_service.get()), "ProximityService"
+)
+
+density_service = LazyService(
+    lambda: DensityService(heatmap_service.get()), "DensityService"
+)
+
+cube_service = LazyService(lambda: CubeService(data_service.get()), "CubeService")
+
+tile_service = LazyService(
+    lambda: TileService(heatmap_service.get(), data_service.get_available_datasets()),
+    "TileService",
+)
+
+# Conditional, precompressed responses of the data endpoints
+response_cache = ResponseCache()
+
+# Caches of services not built yet are left out of /metrics
+metrics.REGISTRY.register_cache("heatmap_layers", lambda: heatmap_service.peek("cache"))
+metrics.REGISTRY.register_cache("tiles", lambda: tile_service.peek("cache"))
+metrics.REGISTRY.register_cache(
+    "density_surfaces", lambda: density_service.peek("surfaces")
+)
+metrics.REGISTRY.register_cache("density_tiles", lambda: density_service.peek("cache"))
+metrics.REGISTRY.register_cache("cubes", lambda: cube_service.peek("cache"))
+metrics.REGISTRY.register_cache("responses", response_cache.cache)
+metrics.REGISTRY.register_cache("routes", lambda: maps_service.peek("route_cache"))
+metrics.REGISTRY.register_cache(
+    "distance_matrix",
+    lambda: maps_service.peek("matrix_planner") and maps_service.matrix_planner.cache,
+)
+
 
-data_service = DataService(data_dir="data")
+@routes_bp.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@routes_bp.after_request
+def record_metrics(response):
+    """Record the latency and body size of every response for /metrics"""
+    start = g.pop("request_start", None)
+    if start is not None and request.endpoint != "routes.metrics_endpoint":
+        size = None if response.is_streamed else response.calculate_content_length()
+        metrics.observe_response(
+            request.endpoint,
+            response.status_code,
+            time.perf_counter() - start,
+            size,
+        )
+    return response
+
+
+@routes_bp.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint: stage timings, upstream calls, caches, payloads"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @routes_bp.route("/")
@@ -32,6 +153,8 @@ def home():
 def calculate_route():
     """
     Calculate a route between multiple addresses using Google Maps API.
+    Long transit itineraries are split into legs fetched concurrently, and
+    "modes": [...] instead of "mode" compares several modes in parallel.
     """
     logger.info("Route calculation request received")
     try:
@@ -42,67 +165,104 @@ def calculate_route():
 
         addresses = data.get("addresses", [])
         mode = data.get("mode")
+        modes = data.get("modes")
 
-        logger.debug(f"Calculating route for {len(addresses)} addresses (mode: {mode})")
+        logger.debug(
+            f"Calculating route for {len(addresses)} addresses (mode: {modes or mode})"
+        )
 
         if len(addresses) < 2:
             logger.warning("Insufficient addresses provided")
             return jsonify({"error": "At least two addresses are required"}), 400
 
-        # Special handling for transit mode
-        if mode == "transit" and len(addresses) > 3:
-            return (
-                jsonify(
-                    {
-                        "error": "Transit mode supports maximum 3 points (origin, destination, and one waypoint)"
+        if modes is not None:
+            if not isinstance(modes, list) or not modes:
+                return jsonify({"error": "modes must be a non-empty list"}), 400
+            if not all(isinstance(m, str) and m in TRAVEL_MODES for m in modes):
+                allowed = ", ".join(TRAVEL_MODES)
+                return jsonify({"error": f"every mode must be one of: {allowed}"}), 400
+
+            results = route_planner.compare(addresses, list(dict.fromkeys(modes)))
+            logger.info("Route comparison completed")
+            return jsonify(
+                {
+                    "routes": {
+                        m: result or {"error": "Could not calculate route"}
+                        for m, result in results.items()
                     }
-                ),
-                400,
+                }
             )
 
-        # Get origin, destination, and waypoints
-        origin = addresses[0]
-        destination = addresses[-1]
-        waypoints = addresses[1:-1] if len(addresses) > 2 else None
+        result = route_planner.plan(addresses, mode)
+        if not result:
+            return jsonify({"error": "Could not calculate route"}), 400
 
-        logger.debug(
-            f"Processing route: {origin} to {destination} with waypoints: {waypoints}"
-        )
+        logger.info("Route calculation completed successfully")
+        return jsonify(result)
 
-        route = maps_service.get_route(origin, destination, mode, waypoints)
-        if not route:
-            error_msg = "Could not calculate route"
-            if mode == "transit" and waypoints and len(waypoints) != 1:
-                error_msg = "Transit mode supports exactly one waypoint between origin and destination"
-            return jsonify({"error": error_msg}), 400
-
-        segments = []
-        for leg in route["legs"]:
-            segments.append(
-                RouteSegment(
-                    start_address=leg["start_address"],
-                    end_address=leg["end_address"],
-                    distance=leg["distance"],
-                    duration=leg["duration"],
-                    mode=mode,
-                )
-            )
+    except Exception as e:
+        logger.error(f"Error calculating route: {str(e)}", exc_info=True)
+        return jsonify({"error": "Internal server error"}), 500
 
-        complete_route = CompleteRoute(segments)
-        logger.info("Route calculation completed successfully")
 
-        return jsonify(
-            {
-                "route": complete_route.get_summary(),
-                "polyline": route["overview_polyline"]["points"],
-            }
-        )
+@routes_bp.route("/optimize_tour", methods=["POST"])
+def optimize_tour():
+    """
+    Order many stops into the cheapest tour (e.g. an inspection round).
+    Takes "addresses": [...] or "dataset": <name> (its features' locations,
+    at most "limit" of them), plus "mode" and "return_to_start". Tours over
+    the Google backend take at most MAX_GOOGLE_TOUR_STOPS stops.
+    """
+    logger.info("Tour optimization request received")
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+
+        max_stops = MAX_TOUR_STOPS if _local_routing() else MAX_GOOGLE_TOUR_STOPS
+        mode = data.get("mode") or "driving"
+        return_to_start = bool(data.get("return_to_start", True))
+        addresses = data.get("addresses")
+        if addresses is None and data.get("dataset"):
+            try:
+                limit = int(data.get("limit", max_stops))
+            except (TypeError, ValueError):
+                return jsonify({"error": "limit must be an integer"}), 400
+            addresses = _dataset_locations(data["dataset"])
+            if addresses is None:
+                return jsonify({"error": "Dataset not found"}), 404
+            addresses = addresses[: max(limit, 0)]
+
+        if not isinstance(addresses, list) or len(addresses) < 2:
+            return jsonify({"error": "At least two addresses are required"}), 400
+        if len(addresses) > max_stops:
+            message = f"A tour may have at most {max_stops} stops"
+            if not _local_routing():
+                message += " with the Google backend; use ROUTING_BACKEND=local"
+            return jsonify({"error": message}), 400
+
+        result = route_planner.plan_tour(addresses, mode, return_to_start)
+        if not result:
+            return jsonify({"error": "Could not plan a tour through every stop"}), 400
+
+        logger.info(f"Tour of {len(addresses)} stops planned")
+        return jsonify(result)
 
     except Exception as e:
-        logger.error(f"Error calculating route: {str(e)}", exc_info=True)
+        logger.error(f"Error optimizing tour: {str(e)}", exc_info=True)
         return jsonify({"error": "Internal server error"}), 500
 
 
+def _dataset_locations(dataset_name):
+    """Locations ("lat,lng") of the first vertex of every feature of a dataset"""
+    geometries = data_service.get_column(dataset_name, "GEOMETRIA")
+    if geometries is None:
+        return None
+    lat, lng, offsets = heatmap_service.reproject_geometries(geometries)
+    features = offsets[:-1][offsets[1:] > offsets[:-1]]
+    return [f"{lat[i]:.6f},{lng[i]:.6f}" for i in features.tolist()]
+
+
 @routes_bp.route("/heatmap")
 def heatmap():
     """
@@ -122,28 +282,324 @@ def heatmap():
 def get_heatmap_data():
     """
     Get heatmap data for specific type from JSON files with optional filters.
+    Pass agg=grid|hex and cell=<size>[m|km] to get weighted cells instead of points,
+    and bbox=minLat,minLng,maxLat,maxLng (optionally zoom) to limit it to a viewport.
+    format=json|columnar|polyline|binary (or Accept: application/octet-stream)
+    selects a compact encoding of the coordinates.
+    stream=1 (NDJSON) or stream=array streams the points as they are built.
+    Responses carry an ETag of the data version and arguments (If-None-Match
+    gets a 304) and are served gzip/brotli-compressed when accepted.
+    filter=field:value[|value][,field:value][;...] combines further filters
+    (e.g. filter=year:2019|2020,fatality:sim;bairro:centro).
     """
 
     heatmap_type = request.args.get("type")
     year_filter = request.args.get("year")
     fatality_filter = request.args.get("fatality")
+    agg = request.args.get("agg")
 
     if not heatmap_type:
         return jsonify({"error": "Heatmap type parameter is required"}), 400
 
+    try:
+        filters = parse_filter(request.args.get("filter"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        stream = parse_stream(request.args.get("stream"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream and (agg or request.args.get("format") not in (None, "json")):
+        return jsonify({"error": "stream only supports json point layers"}), 400
+
+    try:
+        output_format = negotiate_format(
+            request.args.get("format"), request.accept_mimetypes
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    bbox = None
+    if request.args.get("bbox"):
+        try:
+            bbox = parse_bbox(request.args.get("bbox"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    zoom = request.args.get("zoom")
+    if zoom is not None:
+        try:
+            zoom = int(zoom)
+        except ValueError:
+            return jsonify({"error": f"Invalid zoom: {zoom}"}), 400
+        if not 0 <= zoom <= 22:
+            return jsonify({"error": "zoom must be between 0 and 22"}), 400
+
+    cell_size = None
+    if agg:
+        if agg not in AGGREGATIONS:
+            return (
+                jsonify({"error": f"agg must be one of: {', '.join(AGGREGATIONS)}"}),
+                400,
+            )
+        if request.args.get("cell") is None and zoom is not None:
+            # Size cells to a few screen pixels at the requested zoom
+            latitude = (bbox[0] + bbox[2]) / 2 if bbox else 0.0
+            cell_size = cell_size_for_zoom(zoom, latitude)
+            cell_size = min(max(cell_size, MIN_CELL_SIZE), MAX_CELL_SIZE)
+        else:
+            try:
+                cell_size = parse_cell_size(request.args.get("cell"))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
     logger.info(
-        f"Heatmap data request received for type: {heatmap_type} with filters year={year_filter}, fatality={fatality_filter}"
+        f"Heatmap data request received for type: {heatmap_type} with filters year={year_filter}, fatality={fatality_filter}, filter={filters}"
     )
-    try:
+    if stream:
+        batches = heatmap_service.iter_layer(
+            heatmap_type, year_filter, fatality_filter, bbox, filters=filters
+        )
+        return Response(
+            encode_stream(_point_batches(batches), stream),
+            mimetype=STREAM_MIMETYPES[stream],
+        )
 
-        heatmap_service = HeatmapService()
-        data = heatmap_service.load_data(heatmap_type, year_filter, fatality_filter)
-        return jsonify(data)
+    build = partial(
+        _heatmap_response,
+        heatmap_type,
+        year_filter,
+        fatality_filter,
+        agg,
+        cell_size,
+        bbox,
+        output_format,
+        filters,
+    )
+    version = heatmap_service.layer_version(heatmap_type)
+    if version is None:
+        return build()
+    etag = make_etag(request.path, version, request_arguments(), output_format)
+    # Viewport responses vary continuously, so only whole layers are stored
+    return response_cache.respond(etag, build, store=bbox is None)
+
+
+def _heatmap_response(
+    heatmap_type,
+    year_filter,
+    fatality_filter,
+    agg,
+    cell_size,
+    bbox,
+    output_format,
+    filters,
+):
+    try:
+        data = heatmap_service.load_data(
+            heatmap_type,
+            year_filter,
+            fatality_filter,
+            agg,
+            cell_size,
+            bbox,
+            output_format,
+            filters,
+        )
+        if isinstance(data, bytes):
+            return Response(data, mimetype=MIMETYPES[output_format])
+        with metrics.timed("serialize"):
+            return jsonify(data)
     except Exception as e:
         logger.error(f"Error getting heatmap data: {str(e)}", exc_info=True)
         return jsonify({"error": "Internal server error"}), 500
 
 
+@routes_bp.route("/tiles/<layer>/<int:z>/<int:x>/<int:y>", methods=["GET"])
+@routes_bp.route("/tiles/<layer>/<int:z>/<int:x>/<int:y>.mvt", methods=["GET"])
+def get_tile(layer, z, x, y):
+    """
+    Mapbox Vector Tile z/x/y of a heatmap layer (type) or of a dataset with
+    geometries, clipped to the tile and simplified for its zoom. Empty tiles
+    have an empty body. The MVT layer is named after the dataset, so a
+    heatmap type and its dataset (speed-reducer, redutor_velocidade) serve
+    the same tiles.
+    """
+    if not valid_tile(z, x, y):
+        return jsonify({"error": f"z must be 0-{MAX_ZOOM} and x, y within 0-2^z"}), 400
+
+    try:
+        tile = tile_service.get_tile(layer, z, x, y)
+        if tile is None:
+            return jsonify({"error": "Layer not found"}), 404
+        return Response(tile, mimetype=MVT_MIMETYPE)
+    except Exception as e:
+        logger.error(
+            f"Error rendering tile {layer}/{z}/{x}/{y}: {str(e)}", exc_info=True
+        )
+        return jsonify({"error": "Internal server error"}), 500
+
+
+def _density_arguments():
+    """(year, fatality, filters, bandwidth) of a density request; raises ValueError"""
+    return (
+        request.args.get("year"),
+        request.args.get("fatality"),
+        parse_filter(request.args.get("filter")),
+        parse_bandwidth(request.args.get("bandwidth")),
+    )
+
+
+@routes_bp.route("/density/<heatmap_type>/<int:z>/<int:x>/<int:y>.png", methods=["GET"])
+def get_density_tile(heatmap_type, z, x, y):
+    """
+    PNG tile z/x/y of the kernel density of a heatmap layer, rendered on the
+    server. Takes the year, fatality and filter arguments of
+    /get_heatmap_data and bandwidth=<metres> (the Gaussian's sigma).
+    """
+    if not valid_tile(z, x, y):
+        return jsonify({"error": f"z must be 0-{MAX_ZOOM} and x, y within 0-2^z"}), 400
+    try:
+        arguments = _density_arguments()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def build():
+        try:
+            tile = density_service.get_tile(heatmap_type, z, x, y, *arguments)
+            if tile is None:
+                return jsonify({"error": "Layer not found"}), 404
+            return Response(tile, mimetype=PNG_MIMETYPE)
+        except Exception as e:
+            logger.error(
+                f"Error rendering density tile {heatmap_type}/{z}/{x}/{y}: {str(e)}",
+                exc_info=True,
+            )
+            return jsonify({"error": "Internal server error"}), 500
+
+    version = heatmap_service.layer_version(heatmap_type)
+    if version is None:
+        return jsonify({"error": "Layer not found"}), 404
+    etag = make_etag(request.path, version, request_arguments())
+    # Tiles are cached by the density service, so only ETags are added here
+    return response_cache.respond(etag, build, store=False)
+
+
+@routes_bp.route("/density/<heatmap_type>/grid", methods=["GET"])
+def get_density_grid(heatmap_type):
+    """
+    The whole kernel density surface of a heatmap layer as little-endian
+    float16 points per hectare, rows from north to south. Its shape, UTM 23S
+    bounds and cell size are in the X-Grid-* headers. Takes the arguments
+    of the density tiles.
+    """
+    try:
+        arguments = _density_arguments()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def build():
+        try:
+            opened = density_service.surface(heatmap_type, *arguments)
+            if opened is None:
+                return jsonify({"error": "Layer not found"}), 404
+            surface = opened[1]
+            if surface is None:
+                return Response(b"", mimetype=GRID_MIMETYPE)
+            rows, columns = surface.density.shape
+            response = Response(surface.float16_grid(), mimetype=GRID_MIMETYPE)
+            response.headers["X-Grid-Shape"] = f"{rows},{columns}"
+            response.headers["X-Grid-Bounds"] = ",".join(
+                f"{v:.2f}" for v in surface.bounds
+            )
+            response.headers["X-Grid-Cell-Size"] = f"{surface.cell_size:g}"
+            response.headers["X-Grid-CRS"] = "EPSG:32723"
+            return response
+        except Exception as e:
+            logger.error(
+                f"Error building density grid of {heatmap_type}: {str(e)}",
+                exc_info=True,
+            )
+            return jsonify({"error": "Internal server error"}), 500
+
+    version = heatmap_service.layer_version(heatmap_type)
+    if version is None:
+        return jsonify({"error": "Layer not found"}), 404
+    etag = make_etag(request.path, version, request_arguments())
+    return response_cache.respond(etag, build)
+
+
+def _point_batches(batches):
+    """
+    Turn streamed (lat, lng, details) layer batches into point dicts. Errors
+    raised mid-stream are logged and re-raised, so the chunked response is
+    aborted instead of ending as a valid but truncated document.
+    """
+    try:
+        for lat, lng, details in batches:
+            points = heatmap_service.to_points(lat, lng)
+            for point, detail in zip(points, details):
+                point.update(detail)
+            yield points
+    except Exception as e:
+        logger.error(f"Error streaming heatmap data: {str(e)}", exc_info=True)
+        raise
+
+
+def _record_batches(dataset_name, batches):
+    """Pass dataset batches through, logging and re-raising mid-stream errors"""
+    try:
+        yield from batches
+    except Exception as e:
+        logger.error(f"Error streaming dataset {dataset_name}: {str(e)}", exc_info=True)
+        raise
+
+
+@routes_bp.route("/proximity", methods=["GET"])
+def proximity():
+    """
+    Cross-dataset proximity query between the features of source and target:
+    mode=nearest (optionally within distance), mode=within (all pairs at most
+    distance metres apart) or mode=count (targets within distance per source).
+    """
+    source = request.args.get("source")
+    target = request.args.get("target")
+    mode = request.args.get("mode", "nearest")
+    distance = request.args.get("distance", type=float)
+
+    if not source or not target:
+        return jsonify({"error": "source and target parameters are required"}), 400
+    if mode not in PROXIMITY_MODES:
+        return (
+            jsonify({"error": f"mode must be one of: {', '.join(PROXIMITY_MODES)}"}),
+            400,
+        )
+    if distance is None and mode != "nearest":
+        return jsonify({"error": "distance is required for this mode"}), 400
+    if distance is not None and not 0 <= distance <= MAX_DISTANCE:
+        return (
+            jsonify({"error": f"distance must be between 0 and {MAX_DISTANCE:g}"}),
+            400,
+        )
+
+    logger.info(f"Proximity request: {mode} {source} -> {target} ({distance})")
+    try:
+        if mode == "nearest":
+            result = proximity_service.nearest(source, target, distance)
+        elif mode == "within":
+            result = proximity_service.within(source, target, distance)
+        else:
+            result = proximity_service.count_within(source, target, distance)
+
+        if result is None:
+            return jsonify({"error": "Dataset not found"}), 404
+        return jsonify({"source": source, "target": target, "mode": mode, **result})
+    except Exception as e:
+        logger.error(f"Error answering proximity query: {str(e)}", exc_info=True)
+        return jsonify({"error": "Internal server error"}), 500
+
+
 @routes_bp.route("/analytics")
 def analytics():
     """Render the analytics dashboard page with Google Maps API key."""
@@ -160,9 +616,42 @@ def analytics():
         raise
 
 
+@routes_bp.route("/analytics/<dataset_name>/query", methods=["GET"])
+def analytics_query(dataset_name: str):
+    """
+    Ad-hoc aggregate over a dataset's rollup cube:
+    group_by=DIM[,DIM...] (e.g. BAIRRO,year), metric=count|sum:FIELD and
+    optionally filter=dim:value[|value][,...][;...] over cube dimensions.
+    """
+    try:
+        group_by = parse_group_by(request.args.get("group_by"))
+        filters = parse_filter(request.args.get("filter"))
+        result = cube_service.query(
+            dataset_name, group_by, request.args.get("metric", "count"), filters
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(
+            f"Error querying {dataset_name} analytics: {str(e)}", exc_info=True
+        )
+        return jsonify({"error": "Internal server error"}), 500
+
+    if result is None:
+        return jsonify({"error": "Dataset not found"}), 404
+    with metrics.timed("serialize"):
+        return jsonify(result)
+
+
 @routes_bp.route("/get_dataset/<dataset_name>", methods=["GET"])
 def get_dataset(dataset_name: str):
-    """API endpoint to get dataset content with pagination"""
+    """
+    API endpoint to get dataset content with pagination. stream=1 (NDJSON) or
+    stream=array streams the records instead, the whole dataset unless page or
+    per_page is given. filter=field:value[|value][,field:value][;...] keeps
+    only the matching records (see /get_heatmap_data). Pages are cached and
+    conditional like /get_heatmap_data.
+    """
     page = request.args.get("page", default=1, type=int)
     per_page = request.args.get("per_page", default=100, type=int)
 
@@ -171,10 +660,41 @@ def get_dataset(dataset_name: str):
     )
 
     try:
-        data = data_service.load_dataset(dataset_name, page, per_page)
+        stream = parse_stream(request.args.get("stream"))
+        filters = parse_filter(request.args.get("filter"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        start, stop = 0, None
+        if "page" in request.args or "per_page" in request.args:
+            start = max(page - 1, 0) * per_page
+            stop = start + per_page
+        result = data_service.stream_dataset(dataset_name, start, stop, filters=filters)
+        if result is None:
+            return jsonify({"error": "Dataset not found"}), 404
+        total_records, batches = result
+        return Response(
+            encode_stream(_record_batches(dataset_name, batches), stream),
+            mimetype=STREAM_MIMETYPES[stream],
+            headers={"X-Total-Records": str(total_records)},
+        )
+
+    version = data_service.dataset_version(dataset_name)
+    build = partial(_dataset_response, dataset_name, page, per_page, filters)
+    if version is None:
+        return build()
+    etag = make_etag(request.path, version, request_arguments())
+    return response_cache.respond(etag, build)
+
+
+def _dataset_response(dataset_name, page, per_page, filters):
+    try:
+        data = data_service.load_dataset(dataset_name, page, per_page, filters)
         if data is None:
             return jsonify({"error": "Dataset not found"}), 404
-        return jsonify(data)
+        with metrics.timed("serialize"):
+            return jsonify(data)
     except Exception as e:
         logger.error(f"Error getting dataset {dataset_name}: {str(e)}", exc_info=True)
         return jsonify({"error": "Internal server error"}), 500
@@ -3,6 +3,9 @@ document.addEventListener('DOMContentLoaded', function() {
     let heatmap;
     let heatmapData = [];
     let currentRadius = 25; // Default radius
+    // Bin points server-side into weighted cells and receive them as
+    // parallel lat/lng/weight columns to keep payloads small
+    const AGGREGATION_PARAMS = 'agg=grid&cell=50m&format=columnar';
     
     // Initialize map
     function initMap() {
@@ -53,14 +56,14 @@ document.addEventListener('DOMContentLoaded', function() {
         const loadingElement = document.getElementById('loading');
         loadingElement.style.display = 'flex';
         
-        fetch('/get_heatmap_data?type=traffic-accident-with-victims')
+        fetch(`/get_heatmap_data?type=traffic-accident-with-victims&${AGGREGATION_PARAMS}`)
             .then(response => response.json())
             .then(data => {
                 loadingElement.style.display = 'none';
                 
-                if (data.details && data.details.length > 0) {
+                if (data.details && data.details.year && data.details.year.length > 0) {
                     // Extract unique years
-                    const years = [...new Set(data.details.map(item => item.year))].filter(Boolean).sort();
+                    const years = [...new Set(data.details.year)].filter(Boolean).sort();
                     const yearSelect = document.getElementById('year-filter');
                     
                     // Clear existing options except the first one
@@ -87,7 +90,7 @@ document.addEventListener('DOMContentLoaded', function() {
         const loadingElement = document.getElementById('loading');
         loadingElement.style.display = 'flex';
         
-        let url = `/get_heatmap_data?type=traffic-accident-with-victims`;
+        let url = `/get_heatmap_data?type=traffic-accident-with-victims&${AGGREGATION_PARAMS}`;
         if (year) url += `&year=${year}`;
         if (fatality) url += `&fatality=${fatality}`;
         
@@ -95,7 +98,7 @@ document.addEventListener('DOMContentLoaded', function() {
             .then(response => response.json())
             .then(data => {
                 loadingElement.style.display = 'none';
-                updateHeatmap(data.points);
+                updateHeatmap(data);
                 
                 // You could also display the details data if needed
                 console.log('Filtered accident details:', data.details);
@@ -154,7 +157,7 @@ document.addEventListener('DOMContentLoaded', function() {
         const loadingElement = document.getElementById('loading');
         loadingElement.style.display = 'flex';
         
-        fetch('/get_heatmap_data?type=speed-reducer')
+        fetch(`/get_heatmap_data?type=speed-reducer&${AGGREGATION_PARAMS}`)
             .then(handleResponse)
             .then(handleData)
             .catch(handleError);
@@ -169,15 +172,13 @@ document.addEventListener('DOMContentLoaded', function() {
         function handleData(data) {
             loadingElement.style.display = 'none';
             
-            if (!data.points || data.points.length === 0) {
+            const rows = data.lat || data.cells || data.points;
+            if (!rows || rows.length === 0) {
                 showMessage('No heatmap data available. Please ensure JSON files are placed in the data directory.');
                 return;
             }
             
-            // Filter out invalid points
-            heatmapData = data.points
-                .filter(point => isValidLatLng(point.lat, point.lng))
-                .map(point => new google.maps.LatLng(point.lat, point.lng));
+            heatmapData = toHeatmapData(data);
             
             if (heatmapData.length === 0) {
                 showMessage('No valid coordinates found in the data.');
@@ -199,6 +200,27 @@ document.addEventListener('DOMContentLoaded', function() {
     function isValidLatLng(lat, lng) {
         return lat >= -90 && lat <= 90 && lng >= -180 && lng <= 180;
     }
+
+    // Convert a response to heatmap locations: weighted locations for
+    // columnar (lat/lng/weight arrays) or aggregated ([lat, lng, weight])
+    // responses, plain points otherwise
+    function toHeatmapData(data) {
+        if (data.lat) {
+            return data.lat
+                .map((lat, i) => [lat, data.lng[i], data.weight ? data.weight[i] : 1])
+                .filter(([lat, lng]) => isValidLatLng(lat, lng))
+                .map(([lat, lng, weight]) => ({location: new google.maps.LatLng(lat, lng), weight: weight}));
+        }
+        if (data.cells) {
+            return data.cells
+                .filter(([lat, lng]) => isValidLatLng(lat, lng))
+                .map(([lat, lng, weight]) => ({location: new google.maps.LatLng(lat, lng), weight: weight}));
+        }
+        // Filter out invalid points
+        return (data.points || [])
+            .filter(point => isValidLatLng(point.lat, point.lng))
+            .map(point => new google.maps.LatLng(point.lat, point.lng));
+    }
    
     function initHeatmap() {
         heatmap = new google.maps.visualization.HeatmapLayer({
@@ -219,18 +241,15 @@ document.addEventListener('DOMContentLoaded', function() {
     
     function fitMapToBounds() {
         const bounds = new google.maps.LatLngBounds();
-        heatmapData.forEach(point => bounds.extend(point));
+        heatmapData.forEach(point => bounds.extend(point.location || point));
         map.fitBounds(bounds);
         
         // Add some padding if needed
         map.panToBounds(bounds);
     }
 
-    function updateHeatmap(points) {
-        // Filter out invalid points
-        const validPoints = points
-            .filter(point => isValidLatLng(point.lat, point.lng))
-            .map(point => new google.maps.LatLng(point.lat, point.lng));
+    function updateHeatmap(data) {
+        const validPoints = toHeatmapData(data);
         
         if (validPoints.length === 0) {
             showMessage('No valid coordinates found in the data.');
@@ -254,14 +273,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 
                 try {
                     const heatmapType = this.id.replace('heatmap-', '');
-                    const response = await fetch(`/get_heatmap_data?type=${heatmapType}`);
+                    const response = await fetch(`/get_heatmap_data?type=${heatmapType}&${AGGREGATION_PARAMS}`);
                     
                     if (!response.ok) {
                         throw new Error(`HTTP error! status: ${response.status}`);
                     }
                     
                     const data = await response.json();
-                    updateHeatmap(data.points);
+                    updateHeatmap(data);
                 } catch (error) {
                     console.error('Error loading heatmap data:', error);
                     showMessage(`Error loading heatmap data: ${error.message}`);
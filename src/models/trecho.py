@@ -7,13 +7,25 @@ class RouteSegment:
     """
 
     def __init__(self, start_address, end_address, distance, duration, mode):
-        self.log = logging.getLogger(__name__)
         self.start_address = start_address
         self.end_address = end_address
         self.distance = distance
         self.duration = duration
         self.mode = mode
-        self.log.debug(f"Created RouteSegment: {start_address} to {end_address}")
+
+    @classmethod
+    def from_values(cls, start_address, end_address, meters, seconds, mode):
+        """Build a segment from raw metres/seconds, formatted like the Directions API"""
+        return cls(
+            start_address=start_address,
+            end_address=end_address,
+            distance={"text": f"{meters / 1000:.1f} km", "value": round(meters)},
+            duration={
+                "text": f"{max(1, round(seconds / 60))} mins",
+                "value": round(seconds),
+            },
+            mode=mode,
+        )
 
 
 class CompleteRoute:
@@ -26,10 +38,9 @@ class CompleteRoute:
         self.segments = segments
         self.total_distance = sum(seg.distance["value"] for seg in segments) / 1000
         self.total_duration = sum(seg.duration["value"] for seg in segments) / 60
-        self.log.info(f"Created CompleteRoute with {len(segments)} segments")
+        self.log.debug(f"Created CompleteRoute with {len(segments)} segments")
 
     def get_summary(self):
-        self.log.debug("Generating route summary")
         return {
             "total_distance_km": round(self.total_distance, 2),
             "total_duration_mins": round(self.total_duration, 2),
@@ -0,0 +1,99 @@
+import math
+import re
+import numpy as np
+
+# Supported server-side aggregation modes for heatmap layers
+AGGREGATIONS = ("grid", "hex")
+
+DEFAULT_CELL_SIZE = 100.0
+MIN_CELL_SIZE = 1.0
+MAX_CELL_SIZE = 100_000.0
+
+# Metres per degree of latitude (WGS84 mean)
+METERS_PER_DEGREE = 111_320.0
+
+_CELL_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(m|km)?\s*$", re.IGNORECASE)
+
+
+def parse_cell_size(value):
+    """
+    Parse a cell size such as "100", "100m" or "0.5km" into metres.
+    Raises ValueError for malformed or out-of-range sizes.
+    """
+    if value is None or value == "":
+        return DEFAULT_CELL_SIZE
+
+    match = _CELL_PATTERN.match(str(value))
+    if not match:
+        raise ValueError(f"Invalid cell size: {value}")
+
+    size = float(match.group(1))
+    if (match.group(2) or "m").lower() == "km":
+        size *= 1000
+
+    if not MIN_CELL_SIZE <= size <= MAX_CELL_SIZE:
+        raise ValueError(
+            f"Cell size must be between {MIN_CELL_SIZE:g}m and {MAX_CELL_SIZE:g}m"
+        )
+    return size
+
+
+def _to_local_meters(lat, lng):
+    """Equirectangular projection around the centre of the points"""
+    lat0 = math.radians(float(np.mean(lat)))
+    x = np.asarray(lng) * (METERS_PER_DEGREE * math.cos(lat0))
+    y = np.asarray(lat) * METERS_PER_DEGREE
+    return x, y
+
+
+def _grid_cells(x, y, cell_size):
+    return np.floor(x / cell_size).astype(np.int64), np.floor(y / cell_size).astype(
+        np.int64
+    )
+
+
+def _hex_cells(x, y, cell_size):
+    """Axial (q, r) coordinates of pointy-top hexagons cell_size apart"""
+    radius = cell_size / math.sqrt(3)
+    q = (math.sqrt(3) / 3 * x - y / 3) / radius
+    r = (2 / 3 * y) / radius
+
+    # Round fractional cube coordinates to the nearest hexagon
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def bin_points(lat, lng, agg="grid", cell_size=DEFAULT_CELL_SIZE):
+    """
+    Bin points into square ("grid") or hexagonal ("hex") cells of cell_size
+    metres. Returns (lat, lng, weight) arrays with one entry per non-empty
+    cell, positioned at the centroid of the points it holds.
+    """
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation: {agg}")
+
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    finite = np.isfinite(lat) & np.isfinite(lng)
+    lat, lng = lat[finite], lng[finite]
+    if not len(lat):
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+
+    x, y = _to_local_meters(lat, lng)
+    binner = _grid_cells if agg == "grid" else _hex_cells
+    col, row = binner(x, y, cell_size)
+
+    cells = np.stack([col, row], axis=1)
+    _, index, weights = np.unique(
+        cells, axis=0, return_inverse=True, return_counts=True
+    )
+    index = index.ravel()
+    cell_lat = np.bincount(index, weights=lat) / weights
+    cell_lng = np.bincount(index, weights=lng) / weights
+    return cell_lat, cell_lng, weights
@@ -0,0 +1,222 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict
+import numpy as np
+from src.services.columnar_store import byte_keys, factorize_keys
+
+
+class MetricColumn:
+    """
+    A dataset column as the metrics see it: its distinct values in order of
+    first occurrence, the code of every row and the number of rows per code.
+    The column is factorized on first use and shared by every metric reading
+    it. column is None when the dataset lacks the field.
+    """
+
+    def __init__(self, column):
+        self.column = column
+        self._factorized = None
+        self._counts = None
+
+    @property
+    def labels(self):
+        return self._factorize()[0]
+
+    @property
+    def codes(self):
+        return self._factorize()[1]
+
+    @property
+    def counts(self):
+        """Rows per label, as Python ints"""
+        if self._counts is None:
+            counts = np.bincount(self.codes, minlength=len(self.labels))
+            self._counts = counts.tolist()
+        return self._counts
+
+    def _factorize(self):
+        if self._factorized is None:
+            self._factorized = self.column.factorize()
+        return self._factorized
+
+
+class Metric(ABC):
+    """
+    One analytics output computed from a single dataset column. path is the
+    key (or tuple of nested keys) the result is stored under.
+    """
+
+    def __init__(self, path, field: str):
+        self.path = path if isinstance(path, tuple) else (path,)
+        self.field = field
+
+    @abstractmethod
+    def evaluate(self, column: MetricColumn, count: int):
+        """Aggregate a whole column of a dataset of count rows"""
+
+
+class CountBy(Metric):
+    """Number of records per distinct value of a field"""
+
+    def evaluate(self, column, count):
+        if column.column is None:
+            return {"Unknown": count} if count else {}
+        return dict(zip(column.labels, column.counts))
+
+
+class CountByYear(Metric):
+    """Number of records per year of a "YYYY-MM-DD[ HH:MM:SS]" field"""
+
+    def evaluate(self, column, count):
+        if column.column is None:
+            return {}
+        if column.column.kind != "text":
+            # Only the text values of a mixed (JSON) column have a year
+            years = {}
+            for label, n in zip(column.labels, column.counts):
+                if label and isinstance(label, str):
+                    year = label.split(" ")[0].split("-")[0]
+                    years[year] = years.get(year, 0) + n
+            return years
+        # The year is what precedes the first "-" or " "; both are ASCII, so
+        # cutting the UTF-8 bytes there keeps whole characters
+        matrix, lengths = column.column.fixed_width()
+        separator = (matrix == ord("-")) | (matrix == ord(" "))
+        cut = np.where(separator.any(axis=1), separator.argmax(axis=1), lengths)
+        matrix[np.arange(matrix.shape[1]) >= cut[:, None]] = 0
+
+        keys = byte_keys(matrix)
+        dated = column.column.valid & (lengths > 0)
+        codes, first = factorize_keys(keys, dated)
+        counts = np.bincount(codes, minlength=len(first)).tolist()
+        return {
+            keys[row].decode("utf-8"): n
+            for row, n in zip(first.tolist(), counts)
+            if dated[row]
+        }
+
+
+class Sum(Metric):
+    """Sum of a field after casting every value with cast (int or float)"""
+
+    def __init__(self, path, field: str, cast=int):
+        super().__init__(path, field)
+        self.cast = cast
+
+    def evaluate(self, column, count):
+        if column.column is None:
+            return self.cast(0) * count if count else 0
+        if not count:
+            return 0
+        # Each distinct value is cast once
+        values = np.array([self.cast(label) for label in column.labels])
+        if values.dtype.kind == "f":
+            # Accumulated left to right like sum(), for the same rounding
+            return float(np.add.accumulate(values[column.codes])[-1])
+        return sum(int(v) * n for v, n in zip(values.tolist(), column.counts))
+
+
+class Mean(Metric):
+    """Mean of the non-negative integer values of a field (0 if there are none)"""
+
+    def evaluate(self, column, count):
+        if column.column is None:
+            return 0
+        total = 0
+        digits = 0
+        for label, n in zip(column.labels, column.counts):
+            if label and str(label).isdigit():
+                total += int(label) * n
+                digits += n
+        return total / digits if digits else 0
+
+
+# Metrics served with each dataset by /get_dataset
+ANALYTICS_SPECS = {
+    # Older-Adult Parking analytics
+    "estacionamento_publico_pessoa_idosa": [
+        CountBy("bairro_counts", "BAIRRO"),
+        CountBy("tempo_permanencia_counts", "TEMPO_PERMANENCIA"),
+        Sum(("vagas_comparison", "fisicas"), "NUMERO_VAGAS_FISICAS", int),
+        Sum(("vagas_comparison", "rotativas"), "NUMERO_VAGAS_ROTATIVAS", int),
+    ],
+    # Paid/Rotative Parking analytics
+    "estacionamento_rotativo": [
+        CountBy("bairro_counts", "BAIRRO"),
+        CountBy("tempo_permanencia_counts", "TEMPO_PERMANENCIA"),
+        CountBy("dia_operacao_counts", "DIA_REGRA_OPERACAO"),
+        Sum(("vagas_comparison", "fisicas"), "NUMERO_VAGAS_FISICAS", int),
+        Sum(("vagas_comparison", "rotativas"), "NUMERO_VAGAS_ROTATIVAS", int),
+    ],
+    # Electronic Enforcement analytics
+    "fiscalizacao_eletronica": [
+        CountBy("tipo_controlador_counts", "DESC_TIPO_CONTROLADOR_TRANSITO"),
+        CountBy("sentido_counts", "SENTIDO"),
+    ],
+    # Rotative Ticket Booths analytics
+    "posto_venda_rotativo": [
+        CountBy("endereco_counts", "ENDERECO"),
+    ],
+    # Bus Priority Network analytics
+    "rede_prioritaria_onibus": [
+        CountBy("infraestrutura_counts", "INFRAESTRUTURA_PREDOMINANTE"),
+        Sum("total_extensao", "EXTENSAO_TRECHO", float),
+        CountBy("ano_implantacao_counts", "ANO_IMPLANT_INFRA_ATUAL"),
+    ],
+    # Speed Humps analytics
+    "redutor_velocidade": [
+        CountBy("bairro_counts", "BAIRRO"),
+        CountByYear("implantacao_years", "DATA_IMPLANTACAO"),
+        CountByYear("manutencao_years", "DATA_ULTIMA_MANUTENCAO"),
+    ],
+    # Traffic Signals analytics
+    "sinalizacao_semaforica": [
+        CountBy("tipo_travessia_counts", "TP_TRAVESSIA_PEDESTRE"),
+        CountBy("botoeira_counts", "BOTOEIRA"),
+        CountBy("botoeira_sonora_counts", "BOTOEIRA_SONORA"),
+        Mean("media_faixas_veiculo", "QTD_TR_C_FOCO"),
+        Mean("media_faixas_pedestre", "QTD_TR_S_FOCO"),
+    ],
+    # Traffic Accidents analytics
+    "sinistro_transito_vitima": [
+        CountBy("tipo_acidente_counts", "DESCRICAO_TIPO_ACIDENTE"),
+        CountBy("regional_counts", "DESCRICAO_REGIONAL"),
+        CountBy("fatalidade_counts", "INDICADOR_FATALIDADE"),
+        CountByYear("acidentes_por_ano", "DATA_HORA_BOLETIM"),
+    ],
+    # Non-Circulating Road Segments analytics: just need the points for mapping
+    "trecho_no_circulacao": [],
+}
+
+
+class AnalyticsEngine:
+    """
+    Evaluates the declared metrics of a dataset over its columns. Each column
+    a metric reads is factorized once with NumPy (distinct values, row codes,
+    counts per value) and every metric on it aggregates those arrays, so the
+    per-row work is vectorized and shared instead of one Python pass over
+    the records per metric.
+    """
+
+    def __init__(self, specs=None):
+        self.log = logging.getLogger(__name__)
+        self.specs = ANALYTICS_SPECS if specs is None else specs
+
+    def evaluate(self, dataset_name: str, dataset) -> Dict:
+        """Compute the analytics of a ColumnarDataset"""
+        count = len(dataset)
+        columns = {}
+        analytics = {}
+        for metric in self.specs.get(dataset_name, []):
+            column = columns.get(metric.field)
+            if column is None:
+                column = MetricColumn(dataset.columns.get(metric.field))
+                columns[metric.field] = column
+            self._store(analytics, metric.path, metric.evaluate(column, count))
+        return analytics
+
+    @staticmethod
+    def _store(analytics, path, value):
+        for key in path[:-1]:
+            analytics = analytics.setdefault(key, {})
+        analytics[path[-1]] = value
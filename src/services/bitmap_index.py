@@ -0,0 +1,230 @@
+import threading
+import numpy as np
+
+# Fields indexed as soon as a dataset's index is built; other fields are
+# indexed on first use
+DEFAULT_FIELDS = (
+    "year",
+    "INDICADOR_FATALIDADE",
+    "BAIRRO",
+    "DESCRICAO_REGIONAL",
+    "TEMPO_PERMANENCIA",
+)
+
+# Short names accepted in filter expressions
+FIELD_ALIASES = {
+    "fatality": "INDICADOR_FATALIDADE",
+    "fatalidade": "INDICADOR_FATALIDADE",
+    "bairro": "BAIRRO",
+    "regional": "DESCRICAO_REGIONAL",
+    "tempo": "TEMPO_PERMANENCIA",
+}
+
+# Fields with at most this many distinct values get every per-value bitmap
+# built up front; the bitmaps of other fields are built per queried value
+EAGER_CARDINALITY = 64
+
+
+def normalize(value):
+    """Index key of a value: case-insensitive text, None for missing values"""
+    if value is None:
+        return None
+    return str(value).lower()
+
+
+def boletim_year(boletim):
+    """Year prefix of a NUMERO_BOLETIM such as "2017-017062839-001", or None"""
+    if isinstance(boletim, str) and "-" in boletim:
+        return boletim.split("-")[0]
+    return None
+
+
+def parse_filter(value):
+    """
+    Parse a filter expression in disjunctive normal form: groups separated
+    by ";" are OR-ed, "field:value" clauses within a group separated by ","
+    are AND-ed, and values separated by "|" are alternatives. For example
+    "year:2019|2020,fatality:sim;BAIRRO:centro" means
+    ((year 2019 or 2020) and fatality sim) or BAIRRO centro.
+    Returns [[(field, [values])]]. Raises ValueError when malformed.
+    """
+    if value is None or not value.strip():
+        return None
+    groups = []
+    for group in value.split(";"):
+        clauses = []
+        for clause in group.split(","):
+            field, sep, values = clause.partition(":")
+            field = field.strip()
+            values = [v.strip() for v in values.split("|") if v.strip()]
+            if not sep or not field or not values:
+                raise ValueError(
+                    "filter must be field:value[|value][,field:value][;...]"
+                )
+            clauses.append((FIELD_ALIASES.get(field.lower(), field), values))
+        groups.append(clauses)
+    return groups
+
+
+def filter_groups(year=None, fatality=None, expression=None):
+    """
+    Combine the legacy year/fatality filters with a parsed filter expression:
+    the legacy clauses are AND-ed into every group.
+    """
+    legacy = []
+    if year:
+        legacy.append(("year", [str(year)]))
+    if fatality:
+        legacy.append(("INDICADOR_FATALIDADE", [fatality]))
+    if expression is None:
+        return [legacy] if legacy else None
+    return [legacy + group for group in expression]
+
+
+def filter_key(groups):
+    """Hashable, case-insensitive form of filter groups, for cache keys"""
+    if groups is None:
+        return None
+    return tuple(
+        tuple((field.lower(), tuple(map(normalize, values))) for field, values in group)
+        for group in groups
+    )
+
+
+def record_matches(record, groups):
+    """Whether a plain {field: value} record matches filter groups"""
+
+    def value(field):
+        if field == "year":
+            return boletim_year(record.get("NUMERO_BOLETIM"))
+        if field in record:
+            return record[field]
+        # Same case-insensitive field match as BitmapIndex
+        for name in record:
+            if name.lower() == field.lower():
+                return record[name]
+        return None
+
+    return any(
+        all(
+            normalize(value(field)) in {normalize(v) for v in values}
+            for field, values in group
+        )
+        for group in groups
+    )
+
+
+class BitmapIndex:
+    """
+    Inverted index over a dataset's categorical fields: every row gets the
+    code of its (case-insensitive) value, and every value a bitmap of its
+    rows packed 8 rows per byte. Filters combine bitmaps with bitwise
+    AND/OR instead of scanning rows. The derived field "year" is the
+    NUMERO_BOLETIM year.
+    """
+
+    def __init__(self, dataset, fields=DEFAULT_FIELDS):
+        self.dataset = dataset
+        self.length = len(dataset)
+        self._codes = {}
+        self._bitmaps = {}
+        self._lock = threading.Lock()
+        for field in fields:
+            name = self._resolve(field)
+            if name is not None:
+                self._field(name)
+
+    def _resolve(self, field):
+        """Column a filter field refers to (matched case-insensitively), or None"""
+        if field == "year":
+            return "year" if "NUMERO_BOLETIM" in self.dataset.columns else None
+        if field in self.dataset.columns:
+            return field
+        for name in self.dataset.columns:
+            if name.lower() == field.lower():
+                return name
+        return None
+
+    def _field(self, field):
+        """(value -> code, row codes) of a field, built on first use"""
+        with self._lock:
+            entry = self._codes.get(field)
+        if entry is not None:
+            return entry
+
+        if field == "year":
+            values = [boletim_year(b) for b in self.dataset.column("NUMERO_BOLETIM")]
+        else:
+            values = self.dataset.column(field)
+        lookup = {}
+        # Code 0 is reserved for missing values
+        codes = np.fromiter(
+            (
+                0 if key is None else lookup.setdefault(key, len(lookup) + 1)
+                for key in map(normalize, values)
+            ),
+            dtype=np.int32,
+            count=self.length,
+        )
+        entry = (lookup, codes)
+        bitmaps = {}
+        if len(lookup) <= EAGER_CARDINALITY:
+            for key, code in lookup.items():
+                bitmaps[key] = np.packbits(codes == code)
+        with self._lock:
+            self._codes[field] = entry
+            self._bitmaps[field] = bitmaps
+        return entry
+
+    def _empty(self):
+        return np.zeros((self.length + 7) // 8, dtype=np.uint8)
+
+    def bitmap(self, field, value):
+        """Packed bitmap of the rows whose field equals value"""
+        field = self._resolve(field)
+        if field is None:
+            return self._empty()
+        lookup, codes = self._field(field)
+        key = normalize(value)
+        with self._lock:
+            bitmap = self._bitmaps[field].get(key)
+        if bitmap is None:
+            code = lookup.get(key)
+            if code is None:
+                return self._empty()
+            bitmap = np.packbits(codes == code)
+            with self._lock:
+                self._bitmaps[field][key] = bitmap
+        return bitmap
+
+    def evaluate(self, groups):
+        """Packed bitmap of the rows matching filter groups (see parse_filter)"""
+        result = self._empty()
+        for group in groups:
+            matched = None
+            for field, values in group:
+                clause = self._empty()
+                for value in values:
+                    clause |= self.bitmap(field, value)
+                matched = clause if matched is None else matched & clause
+            if matched is None:
+                # An empty group matches every row
+                matched = np.packbits(np.ones(self.length, dtype=bool))
+            result |= matched
+        return result
+
+    def mask(self, groups):
+        """Boolean row mask of the rows matching filter groups"""
+        bits = self.evaluate(groups)
+        return np.unpackbits(bits, count=self.length).astype(bool)
+
+    def rows(self, groups):
+        """Sorted indices of the rows matching filter groups"""
+        return np.flatnonzero(self.mask(groups))
+
+    def values(self, field):
+        """Distinct (normalized) values of a field"""
+        field = self._resolve(field)
+        if field is None:
+            return []
+        return list(self._field(field)[0])
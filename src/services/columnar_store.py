@@ -0,0 +1,735 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+import numpy as np
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+# Bumped whenever the on-disk layout changes, so older versions read as stale
+STORE_FORMAT = 2
+
+
+def gather_vertices(offsets, rows):
+    """
+    Indices of the vertices of the given features, where the vertices of
+    feature i are [offsets[i], offsets[i + 1]), plus each feature's length.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(int(lengths.sum()), dtype=np.int64) + shift, lengths
+
+
+def splice_ragged(offsets, arrays, rows, new_offsets=None, new_arrays=None):
+    """
+    Replace the items at sorted rows of ragged arrays, where item i of an
+    array is array[offsets[i]:offsets[i + 1]], by the items of new_arrays
+    (in row order); without new_offsets, delete them. Only the spans between
+    the rows are copied. Returns the new (offsets, arrays).
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int64)
+    lengths = np.diff(offsets)
+    if new_offsets is None:
+        lengths = np.delete(lengths, rows)
+    else:
+        new_offsets = np.asarray(new_offsets, dtype=np.int64)
+        lengths[rows] = np.diff(new_offsets)
+    spliced_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=spliced_offsets[1:])
+
+    # Spans of kept items: before the first row, between rows, after the last
+    kept = zip(
+        np.concatenate([offsets[:1], offsets[rows + 1]]).tolist(),
+        np.concatenate([offsets[rows], offsets[-1:]]).tolist(),
+    )
+    kept = [slice(start, end) for start, end in kept]
+    if new_offsets is not None:
+        new_offsets = new_offsets.tolist()
+        replaced = [slice(a, b) for a, b in zip(new_offsets[:-1], new_offsets[1:])]
+    spliced = []
+    for k, array in enumerate(arrays):
+        pieces = [array[kept[0]]]
+        for j in range(len(rows)):
+            if new_offsets is not None:
+                pieces.append(new_arrays[k][replaced[j]])
+            pieces.append(array[kept[j + 1]])
+        spliced.append(np.concatenate(pieces))
+    return spliced_offsets, spliced
+
+
+def byte_keys(matrix):
+    """One comparable bytes key per row of a uint8 matrix"""
+    return np.ascontiguousarray(matrix).view(f"S{matrix.shape[1]}").ravel()
+
+
+def factorize_keys(keys, valid):
+    """
+    Number the distinct keys in order of first occurrence, with all rows
+    that are not valid sharing one code. Returns (codes, first) where
+    first[c] is the first row with code c.
+    """
+    rows = np.flatnonzero(valid)
+    _, first, inverse = np.unique(keys[rows], return_index=True, return_inverse=True)
+    first = rows[first]
+    codes = np.empty(len(valid), dtype=np.int64)
+    codes[rows] = inverse.ravel()
+    if len(rows) < len(valid):
+        missing = np.flatnonzero(~np.asarray(valid))
+        codes[missing] = len(first)
+        first = np.append(first, missing[0])
+
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[codes], first[order]
+
+
+# Reused across records: building an encoder per json.dumps call dominates
+# the cost of hashing a dump
+_ROW_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def row_hash(record):
+    """64-bit content hash of a raw CKAN record, used to detect changed rows"""
+    encoded = _ROW_ENCODER.encode(record)
+    digest = hashlib.blake2b(encoded.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+INT64_RANGE = (-(2**63), 2**63 - 1)
+
+
+def _common_kind(column, other):
+    """
+    column and other as columns of one kind: a column without values takes
+    the other's kind, and columns holding values of different types both
+    become JsonColumns, so that no value changes type.
+    """
+    if other.kind == column.kind:
+        return column, other
+    if not other.valid.any():
+        return column, type(column).from_values(other.slice(0, None))
+    if column.kind != "json" and column.valid.any():
+        column = JsonColumn.from_values(column.slice(0, None))
+    elif column.kind != "json":
+        return type(other).from_values(column.slice(0, None)), other
+    if other.kind != "json":
+        other = JsonColumn.from_values(other.slice(0, None))
+    return column, other
+
+
+class IntColumn:
+    """
+    Nullable integer column backed by an int64 array and a validity mask.
+    """
+
+    kind = "int"
+    dtype = np.int64
+    parts = ("values", "valid")
+
+    def __init__(self, values, valid):
+        self.values = values
+        self.valid = valid
+
+    @classmethod
+    def from_values(cls, values):
+        valid = np.array([v is not None for v in values], dtype=bool)
+        data = np.array([v if v is not None else 0 for v in values], dtype=cls.dtype)
+        return cls(data, valid)
+
+    def __len__(self):
+        return len(self.values)
+
+    def slice(self, start, stop):
+        values = self.values[start:stop].tolist()
+        valid = self.valid[start:stop].tolist()
+        return [v if ok else None for v, ok in zip(values, valid)]
+
+    def arrays(self):
+        return {"values": self.values, "valid": self.valid}
+
+    def factorize(self):
+        """(distinct values in order of first occurrence, code of every row)"""
+        codes, first = factorize_keys(self.values, self.valid)
+        return self.take(first).slice(0, None), codes
+
+    def take(self, rows):
+        return type(self)(self.values[rows], self.valid[rows])
+
+    def append(self, other):
+        column, other = _common_kind(self, other)
+        if column is not self:
+            return column.append(other)
+        return type(self)(
+            np.concatenate([self.values, other.values]),
+            np.concatenate([self.valid, other.valid]),
+        )
+
+    def patch(self, rows, other):
+        """New column with the values at rows replaced by those of other"""
+        column, other = _common_kind(self, other)
+        if column is not self:
+            return column.patch(rows, other)
+        values = np.array(self.values)
+        valid = np.array(self.valid)
+        values[rows] = other.values
+        valid[rows] = other.valid
+        return type(self)(values, valid)
+
+    def delete(self, rows):
+        return type(self)(np.delete(self.values, rows), np.delete(self.valid, rows))
+
+
+class FloatColumn(IntColumn):
+    """
+    Nullable float column backed by a float64 array and a validity mask.
+    """
+
+    kind = "float"
+    dtype = np.float64
+
+
+class TextColumn:
+    """
+    Nullable UTF-8 text column stored Arrow-style as one byte buffer plus
+    (n + 1) offsets, so a row range decodes without touching other rows.
+    """
+
+    kind = "text"
+    parts = ("data", "offsets", "valid")
+
+    def __init__(self, data, offsets, valid):
+        self.data = data
+        self.offsets = offsets
+        self.valid = valid
+
+    @staticmethod
+    def encode(value):
+        return value.encode("utf-8")
+
+    @staticmethod
+    def decode(encoded):
+        return encoded.decode("utf-8")
+
+    @classmethod
+    def from_values(cls, values):
+        encoded = [cls.encode(v) if v is not None else b"" for v in values]
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        valid = np.array([v is not None for v in values], dtype=bool)
+        return cls(data, offsets, valid)
+
+    def __len__(self):
+        return len(self.valid)
+
+    def slice(self, start, stop):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if stop <= start:
+            return []
+
+        end = stop + 1
+        offsets = self.offsets[start:end]
+        valid = self.valid[start:stop].tolist()
+        first, last = int(offsets[0]), int(offsets[-1])
+        buffer = self.data[first:last].tobytes()
+        relative = (offsets - first).tolist()
+        decode = self.decode
+        return [
+            decode(buffer[a:b]) if ok else None
+            for a, b, ok in zip(relative[:-1], relative[1:], valid)
+        ]
+
+    def arrays(self):
+        return {"data": self.data, "offsets": self.offsets, "valid": self.valid}
+
+    def fixed_width(self):
+        """
+        The values as a zero-padded (rows, longest value) byte matrix plus
+        each value's length in bytes, for vectorized comparisons
+        """
+        lengths = np.diff(self.offsets)
+        width = max(int(lengths.max(initial=0)), 1)
+        first, last = int(self.offsets[0]), int(self.offsets[-1])
+        # Row and position within the value of every byte of the buffer
+        rows = np.repeat(np.arange(len(self)), lengths)
+        within = np.arange(last - first) - np.repeat(self.offsets[:-1] - first, lengths)
+        matrix = np.zeros((len(self), width), dtype=np.uint8)
+        matrix[rows, within] = self.data[first:last]
+        return matrix, lengths
+
+    def factorize(self):
+        """(distinct values in order of first occurrence, code of every row)"""
+        matrix, _ = self.fixed_width()
+        codes, first = factorize_keys(byte_keys(matrix), self.valid)
+        return self.take(first).slice(0, None), codes
+
+    def take(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        positions, lengths = gather_vertices(self.offsets, rows)
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return type(self)(self.data[positions], offsets, self.valid[rows])
+
+    def append(self, other):
+        column, other = _common_kind(self, other)
+        if column is not self:
+            return column.append(other)
+        return type(self)(
+            np.concatenate([self.data, other.data]),
+            np.concatenate([self.offsets, other.offsets[1:] + self.offsets[-1]]),
+            np.concatenate([self.valid, other.valid]),
+        )
+
+    def patch(self, rows, other):
+        """New column with the values at sorted rows replaced by those of other"""
+        column, other = _common_kind(self, other)
+        if column is not self:
+            return column.patch(rows, other)
+        offsets, (data,) = splice_ragged(
+            self.offsets, [self.data], rows, other.offsets, [other.data]
+        )
+        valid = np.array(self.valid)
+        valid[rows] = other.valid
+        return type(self)(data, offsets, valid)
+
+    def delete(self, rows):
+        offsets, (data,) = splice_ragged(self.offsets, [self.data], rows)
+        return type(self)(data, offsets, np.delete(self.valid, rows))
+
+
+class JsonColumn(TextColumn):
+    """
+    Nullable column of values of mixed or structured types (e.g. ints and
+    strings, booleans, lists), each stored as its JSON text in the layout of
+    a TextColumn so that it reads back as the same value.
+    """
+
+    kind = "json"
+
+    @staticmethod
+    def encode(value):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
+
+    @staticmethod
+    def decode(encoded):
+        return json.loads(encoded)
+
+
+COLUMN_TYPES = {
+    "int": IntColumn,
+    "float": FloatColumn,
+    "text": TextColumn,
+    "json": JsonColumn,
+}
+
+
+def column_type(field_type, values):
+    """
+    Column class able to hold values without changing their types: a typed
+    column when all values share int, float or str, else a JsonColumn. A
+    column without values follows the CKAN field type.
+    """
+    types = {type(v) for v in values if v is not None}
+    if not types:
+        return COLUMN_TYPES.get(field_type, TextColumn)
+    if types == {int}:
+        low, high = INT64_RANGE
+        if all(low <= v <= high for v in values if v is not None):
+            return IntColumn
+        return JsonColumn
+    if types == {float}:
+        return FloatColumn
+    if types == {str}:
+        return TextColumn
+    return JsonColumn
+
+
+class ColumnarDataset:
+    """
+    A CKAN datastore export ({"fields": [...], "records": [[...]]}) held as
+    typed columns, with the GEOMETRIA vertices pre-reprojected to WGS84.
+
+    The vertices of record i are lat[geometry_offsets[i]:geometry_offsets[i + 1]].
+    """
+
+    def __init__(self, fields, columns, lat=None, lng=None, geometry_offsets=None):
+        self.fields = fields
+        self.columns = columns
+        self.lat = lat
+        self.lng = lng
+        self.geometry_offsets = geometry_offsets
+        self.row_hashes = None
+        self.version = None
+        self._decoded = {}
+
+    @classmethod
+    def from_json(cls, raw_data, reproject=None, hash_rows=False):
+        """
+        Build a dataset from a decoded CKAN export. reproject, when given, maps
+        a list of geometries to (lat, lng, offsets) arrays. hash_rows keeps a
+        content hash per record for incremental refreshes.
+        """
+        fields = raw_data.get("fields", [])
+        records = raw_data.get("records", [])
+        columns = {}
+        for i, field in enumerate(fields):
+            values = [record[i] if i < len(record) else None for record in records]
+            column_class = column_type(field.get("type"), values)
+            columns[field["id"]] = column_class.from_values(values)
+
+        lat = lng = geometry_offsets = None
+        if reproject is not None and "GEOMETRIA" in columns:
+            lat, lng, geometry_offsets = reproject(columns["GEOMETRIA"].slice(0, None))
+
+        dataset = cls(fields, columns, lat, lng, geometry_offsets)
+        if hash_rows:
+            dataset.row_hashes = np.fromiter(
+                (row_hash(record) for record in records),
+                dtype=np.uint64,
+                count=len(records),
+            )
+        return dataset
+
+    def take(self, rows):
+        """New dataset made of the given rows, in that order"""
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = {name: column.take(rows) for name, column in self.columns.items()}
+        lat = lng = geometry_offsets = None
+        if self.has_coordinates:
+            vertices, lengths = gather_vertices(self.geometry_offsets, rows)
+            lat, lng = self.lat[vertices], self.lng[vertices]
+            geometry_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=geometry_offsets[1:])
+        dataset = ColumnarDataset(self.fields, columns, lat, lng, geometry_offsets)
+        if self.row_hashes is not None:
+            dataset.row_hashes = self.row_hashes[rows]
+        return dataset
+
+    def append(self, other):
+        """New dataset with the rows of other (same fields) after these"""
+        columns = {
+            name: column.append(other.columns[name])
+            for name, column in self.columns.items()
+        }
+        lat = lng = geometry_offsets = None
+        if self.has_coordinates and other.has_coordinates:
+            lat = np.concatenate([self.lat, other.lat])
+            lng = np.concatenate([self.lng, other.lng])
+            geometry_offsets = np.concatenate(
+                [
+                    self.geometry_offsets,
+                    other.geometry_offsets[1:] + self.geometry_offsets[-1],
+                ]
+            )
+        dataset = ColumnarDataset(self.fields, columns, lat, lng, geometry_offsets)
+        if self.row_hashes is not None and other.row_hashes is not None:
+            dataset.row_hashes = np.concatenate([self.row_hashes, other.row_hashes])
+        return dataset
+
+    def patch(self, rows, updates, deleted=(), inserts=None):
+        """
+        New dataset with the records at sorted rows replaced by the records
+        of updates (same fields, in row order), the records at sorted deleted
+        rows dropped and the records of inserts appended. Columns and
+        coordinates the change leaves intact are shared with this dataset,
+        so the store can link their files instead of rewriting them.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        deleted = np.asarray(deleted, dtype=np.int64)
+        inserts = inserts if inserts is not None and len(inserts) else None
+        columns = {}
+        patched = set()
+        for name, column in self.columns.items():
+            if len(rows) and column.take(rows).slice(0, None) != updates.column(name):
+                column = column.patch(rows, updates.columns[name])
+                patched.add(name)
+            if len(deleted):
+                column = column.delete(deleted)
+            if inserts is not None:
+                column = column.append(inserts.columns[name])
+            columns[name] = column
+
+        lat, lng, geometry_offsets = self.lat, self.lng, self.geometry_offsets
+        if self.has_coordinates:
+            if "GEOMETRIA" in patched:
+                geometry_offsets, (lat, lng) = splice_ragged(
+                    geometry_offsets,
+                    [lat, lng],
+                    rows,
+                    updates.geometry_offsets,
+                    [updates.lat, updates.lng],
+                )
+            if len(deleted):
+                geometry_offsets, (lat, lng) = splice_ragged(
+                    geometry_offsets, [lat, lng], deleted
+                )
+            if inserts is not None:
+                lat = np.concatenate([lat, inserts.lat])
+                lng = np.concatenate([lng, inserts.lng])
+                geometry_offsets = np.concatenate(
+                    [
+                        geometry_offsets,
+                        inserts.geometry_offsets[1:] + geometry_offsets[-1],
+                    ]
+                )
+
+        dataset = ColumnarDataset(self.fields, columns, lat, lng, geometry_offsets)
+        dataset.row_hashes = self.row_hashes
+        if self.row_hashes is not None and (len(rows) or len(deleted) or inserts):
+            hashes = np.array(self.row_hashes)
+            hashes[rows] = updates.row_hashes
+            hashes = np.delete(hashes, deleted)
+            if inserts is not None:
+                hashes = np.concatenate([hashes, inserts.row_hashes])
+            dataset.row_hashes = hashes
+        return dataset
+
+    @property
+    def field_names(self):
+        return [field["id"] for field in self.fields]
+
+    @property
+    def has_coordinates(self):
+        return self.geometry_offsets is not None
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(next(iter(self.columns.values())))
+
+    def column(self, name):
+        """Return a whole column as a list of Python values (decoded once)"""
+        if name not in self.columns:
+            return None
+        if name not in self._decoded:
+            self._decoded[name] = self.columns[name].slice(0, None)
+        return self._decoded[name]
+
+    def vertex_indices(self, rows):
+        """
+        Indices into lat/lng of the vertices of the given records, in order,
+        plus the number of vertices of each record.
+        """
+        return gather_vertices(self.geometry_offsets, rows)
+
+    def rows(self, start=0, stop=None):
+        """Materialize rows [start:stop] as {field: value} dicts"""
+        names = self.field_names
+        sliced = [self.columns[name].slice(start, stop) for name in names]
+        return [dict(zip(names, values)) for values in zip(*sliced)]
+
+    def iter_rows(self, start=0, stop=None, batch_size=1000):
+        """Yield rows [start:stop] as lists of {field: value} dicts, a batch at a time"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        for batch_start in range(start, stop, batch_size):
+            yield self.rows(batch_start, min(batch_start + batch_size, stop))
+
+    def column_span(self, name, rows):
+        """
+        Values of a column at sorted rows, decoding only the span they cover
+        instead of the whole column. None if the field is missing.
+        """
+        if name not in self.columns:
+            return None
+        if name in self._decoded:
+            column = self._decoded[name]
+            return [column[i] for i in rows]
+        if not len(rows):
+            return []
+        first = int(rows[0])
+        end = int(rows[-1]) + 1
+        values = self.columns[name].slice(first, end)
+        return [values[i - first] for i in rows]
+
+
+class ColumnarStore:
+    """
+    On-disk store of ColumnarDataset versions as memory-mappable .npy files.
+
+    Layout: <store_dir>/<dataset>/<version>/{manifest.json, *.npy}, with
+    <store_dir>/<dataset>/CURRENT naming the live version. Writers publish a
+    new version by atomically replacing CURRENT, so readers never observe a
+    partially written dataset.
+    """
+
+    def __init__(self, store_dir):
+        self.log = logging.getLogger(__name__)
+        self.store_dir = Path(store_dir)
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def current_version(self, dataset_name):
+        """Name of the live version of a dataset, or None if not ingested"""
+        try:
+            return (self.store_dir / dataset_name / CURRENT_FILE).read_text().strip()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def source_version(source_path):
+        """Version tag of a source file: (mtime in ns, size in bytes)"""
+        stat = os.stat(source_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def open(self, dataset_name, source_path=None):
+        """
+        Memory-map the live version of a dataset. Returns None when it has not
+        been ingested, when it was written in another STORE_FORMAT or when it
+        was built from a different version of source_path (if that file
+        exists).
+        """
+        try:
+            source_version = self.source_version(source_path) if source_path else None
+        except FileNotFoundError:
+            source_version = None
+
+        version = self.current_version(dataset_name)
+        if version is None:
+            return None
+
+        with self._lock:
+            cached = self._open.get(dataset_name)
+        if cached is not None and cached[0] == version:
+            manifest, dataset = cached[1], cached[2]
+        else:
+            try:
+                manifest, dataset = self._read(self.store_dir / dataset_name / version)
+            except (OSError, ValueError, KeyError) as e:
+                self.log.error(f"Error reading store for {dataset_name}: {str(e)}")
+                return None
+            with self._lock:
+                self._open[dataset_name] = (version, manifest, dataset)
+
+        built_from = manifest.get("source_version")
+        if dataset is None or (
+            source_version and built_from and tuple(built_from) != source_version
+        ):
+            self.log.warning(f"Columnar store for {dataset_name} is stale, ignoring it")
+            return None
+
+        return dataset
+
+    def write(self, dataset_name, dataset, source_version, keep=2, base=None):
+        """
+        Persist a dataset as a new version and make it the live one. Arrays
+        shared with base, a version of the dataset read from this store, are
+        hard-linked from its files instead of being written again.
+        """
+        dataset_dir = self.store_dir / dataset_name
+        version = uuid.uuid4().hex
+        version_dir = dataset_dir / version
+        version_dir.mkdir(parents=True)
+        linked = self._array_files(dataset_dir, base)
+
+        def save(name, array, dtype=None):
+            source = linked.get(id(array))
+            if source is not None:
+                try:
+                    os.link(source, version_dir / name)
+                    return
+                except OSError:
+                    pass
+            np.save(version_dir / name, np.asarray(array, dtype=dtype))
+
+        columns = []
+        for i, field in enumerate(dataset.fields):
+            column = dataset.columns[field["id"]]
+            for part, array in column.arrays().items():
+                save(f"col{i}.{part}.npy", array)
+            columns.append({"id": field["id"], "kind": column.kind})
+
+        if dataset.has_coordinates:
+            save("lat.npy", dataset.lat, np.float64)
+            save("lng.npy", dataset.lng, np.float64)
+            save("geometry_offsets.npy", dataset.geometry_offsets)
+        if dataset.row_hashes is not None:
+            save("row_hashes.npy", dataset.row_hashes)
+
+        manifest = {
+            "format": STORE_FORMAT,
+            "fields": dataset.fields,
+            "columns": columns,
+            "length": len(dataset),
+            "source_version": list(source_version) if source_version else None,
+            "has_coordinates": dataset.has_coordinates,
+            "has_row_hashes": dataset.row_hashes is not None,
+        }
+        with open(version_dir / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        # Publish atomically, then drop versions beyond the last `keep`
+        pointer = dataset_dir / f"{CURRENT_FILE}.{version}"
+        pointer.write_text(version)
+        os.replace(pointer, dataset_dir / CURRENT_FILE)
+        self.log.info(f"Published {dataset_name} version {version}")
+        self._prune(dataset_dir, version, keep)
+        return version
+
+    @staticmethod
+    def _array_files(dataset_dir, base):
+        """{id(array): .npy path} of the arrays of a stored dataset version"""
+        if base is None or base.version is None:
+            return {}
+        base_dir = dataset_dir / base.version
+        files = {}
+        for i, field in enumerate(base.fields):
+            for part, array in base.columns[field["id"]].arrays().items():
+                files[id(array)] = base_dir / f"col{i}.{part}.npy"
+        if base.has_coordinates:
+            files[id(base.lat)] = base_dir / "lat.npy"
+            files[id(base.lng)] = base_dir / "lng.npy"
+            files[id(base.geometry_offsets)] = base_dir / "geometry_offsets.npy"
+        if base.row_hashes is not None:
+            files[id(base.row_hashes)] = base_dir / "row_hashes.npy"
+        return files
+
+    def _prune(self, dataset_dir, current, keep):
+        versions = sorted(
+            (p for p in dataset_dir.iterdir() if p.is_dir() and p.name != current),
+            key=lambda p: p.stat().st_mtime_ns,
+            reverse=True,
+        )
+        keep_others = max(keep - 1, 0)
+        for stale in versions[keep_others:]:
+            shutil.rmtree(stale, ignore_errors=True)
+
+    @staticmethod
+    def _read(version_dir):
+        with open(version_dir / MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != STORE_FORMAT:
+            return manifest, None
+
+        def load(name):
+            return np.load(version_dir / name, mmap_mode="r")
+
+        columns = {}
+        for i, column in enumerate(manifest["columns"]):
+            column_class = COLUMN_TYPES[column["kind"]]
+            parts = [load(f"col{i}.{part}.npy") for part in column_class.parts]
+            columns[column["id"]] = column_class(*parts)
+
+        lat = lng = geometry_offsets = None
+        if manifest.get("has_coordinates"):
+            lat = load("lat.npy")
+            lng = load("lng.npy")
+            geometry_offsets = load("geometry_offsets.npy")
+
+        dataset = ColumnarDataset(
+            manifest["fields"], columns, lat, lng, geometry_offsets
+        )
+        if manifest.get("has_row_hashes"):
+            dataset.row_hashes = load("row_hashes.npy")
+        dataset.version = version_dir.name
+        return manifest, dataset
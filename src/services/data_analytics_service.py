@@ -2,7 +2,12 @@
 import logging
 import json
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.services.analytics_engine import AnalyticsEngine
+from src.services.bitmap_index import BitmapIndex
+from src.services.columnar_store import ColumnarDataset, ColumnarStore
+from src.services.layer_cache import LayerCache
+from src.services.metrics import timed
 
 logger = logging.getLogger(__name__)
 
@@ -10,6 +15,7 @@ logger = logging.getLogger(__name__)
 class DataService:
     def __init__(self, data_dir: str = "data"):
         self.data_dir = data_dir
+        self.store = ColumnarStore(Path(data_dir) / "store")
         self.available_datasets = {
             "estacionamento_publico_pessoa_idosa": "Older-Adult Parking",
             "estacionamento_rotativo": "Paid/Rotative Parking",
@@ -22,193 +28,172 @@ class DataService:
             "trecho_no_circulacao": "Non-Circulating Road Segments",
         }
 
+        self.analytics_engine = AnalyticsEngine()
+
+        # Decoded datasets, their analytics and bitmap indexes, one entry per
+        # dataset version
+        self._datasets = LayerCache(maxsize=len(self.available_datasets))
+        self._analytics = LayerCache(maxsize=len(self.available_datasets))
+        self._indexes = LayerCache(maxsize=len(self.available_datasets))
+
     def get_available_datasets(self) -> Dict[str, str]:
         return self.available_datasets
 
     def load_dataset(
-        self, dataset_name: str, page: int = 1, per_page: int = 100
+        self,
+        dataset_name: str,
+        page: int = 1,
+        per_page: int = 100,
+        filters: Optional[List] = None,
     ) -> Optional[Dict]:
+        """
+        One page of a dataset plus its analytics. filters (a parsed filter
+        expression, see bitmap_index.parse_filter) restricts the records and
+        total_records to the matching rows; analytics cover the whole dataset.
+        """
         if dataset_name not in self.available_datasets:
             return None
 
         try:
-            file_path = Path(self.data_dir) / f"{dataset_name}.json"
-            with open(file_path, "r", encoding="utf-8") as f:
-                raw_data = json.load(f)
-                processed_data = self._process_data(raw_data)
-
-                # Apply pagination
-                total_records = len(processed_data["records"])
-                start_idx = (page - 1) * per_page
-                end_idx = start_idx + per_page
-                paginated_records = processed_data["records"][start_idx:end_idx]
-
-                # Get dataset-specific analytics
-                analytics = self._get_dataset_analytics(
-                    dataset_name, processed_data["records"]
-                )
-
-                return {
-                    "fields": processed_data["fields"],
-                    "records": paginated_records,
-                    "total_records": total_records,
-                    "page": page,
-                    "per_page": per_page,
-                    "analytics": analytics,
-                }
+            version, dataset = self._open_dataset(dataset_name)
+
+            # Apply pagination, decoding only the rows of the requested page
+            start_idx = (page - 1) * per_page
+            end_idx = start_idx + per_page
+            total_records = len(dataset)
+            with timed("paginate"):
+                if filters is None:
+                    paginated_records = dataset.rows(start_idx, end_idx)
+                else:
+                    matches = self._filter_rows(dataset_name, version, dataset, filters)
+                    total_records = len(matches)
+                    page_rows = matches[start_idx:end_idx]
+                    paginated_records = dataset.take(page_rows).rows()
+
+            # Get dataset-specific analytics, computed once per dataset version
+            analytics = self._analytics.get(dataset_name, version)
+            if analytics is None:
+                with timed("analytics"):
+                    analytics = self._get_dataset_analytics(dataset_name, dataset)
+                self._analytics.put(dataset_name, version, analytics)
+
+            return {
+                "fields": dataset.field_names,
+                "records": paginated_records,
+                "total_records": total_records,
+                "page": page,
+                "per_page": per_page,
+                "analytics": analytics,
+            }
         except Exception as e:
             logger.error(f"Error loading dataset {dataset_name}: {str(e)}")
             return None
 
-    def _process_data(self, raw_data: Dict) -> Dict:
-        fields = [field["id"] for field in raw_data.get("fields", [])]
-        records = raw_data.get("records", [])
-
-        processed_records = []
-        for record in records:
-            processed_record = {}
-            for i, field in enumerate(fields):
-                if i < len(record):
-                    processed_record[field] = record[i]
-                else:
-                    processed_record[field] = None
-            processed_records.append(processed_record)
-
-        return {"fields": fields, "records": processed_records}
-
-    def _get_dataset_analytics(self, dataset_name: str, records: List[Dict]) -> Dict:
-        analytics = {}
-
-        if dataset_name == "estacionamento_publico_pessoa_idosa":
-            # Older-Adult Parking analytics
-            analytics["bairro_counts"] = self._count_by_field(records, "BAIRRO")
-            analytics["tempo_permanencia_counts"] = self._count_by_field(
-                records, "TEMPO_PERMANENCIA"
-            )
-            analytics["vagas_comparison"] = {
-                "fisicas": sum(int(r.get("NUMERO_VAGAS_FISICAS", 0)) for r in records),
-                "rotativas": sum(
-                    int(r.get("NUMERO_VAGAS_ROTATIVAS", 0)) for r in records
-                ),
-            }
-
-        elif dataset_name == "estacionamento_rotativo":
-            # Paid/Rotative Parking analytics
-            analytics["bairro_counts"] = self._count_by_field(records, "BAIRRO")
-            analytics["tempo_permanencia_counts"] = self._count_by_field(
-                records, "TEMPO_PERMANENCIA"
-            )
-            analytics["dia_operacao_counts"] = self._count_by_field(
-                records, "DIA_REGRA_OPERACAO"
-            )
-            analytics["vagas_comparison"] = {
-                "fisicas": sum(int(r.get("NUMERO_VAGAS_FISICAS", 0)) for r in records),
-                "rotativas": sum(
-                    int(r.get("NUMERO_VAGAS_ROTATIVAS", 0)) for r in records
-                ),
-            }
-
-        elif dataset_name == "fiscalizacao_eletronica":
-            # Electronic Enforcement analytics
-            analytics["tipo_controlador_counts"] = self._count_by_field(
-                records, "DESC_TIPO_CONTROLADOR_TRANSITO"
-            )
-            analytics["sentido_counts"] = self._count_by_field(records, "SENTIDO")
-
-        elif dataset_name == "posto_venda_rotativo":
-            # Rotative Ticket Booths analytics
-            analytics["endereco_counts"] = self._count_by_field(records, "ENDERECO")
+    def stream_dataset(
+        self,
+        dataset_name: str,
+        start: int = 0,
+        stop: Optional[int] = None,
+        batch_size: int = 1000,
+        filters: Optional[List] = None,
+    ) -> Optional[Tuple[int, Iterator[List[Dict]]]]:
+        """
+        Return (total_records, batches) where batches lazily yields rows
+        [start:stop] as lists of record dicts, decoding one batch at a time.
+        With filters, start and stop index the matching rows.
+        """
+        if dataset_name not in self.available_datasets:
+            return None
 
-        elif dataset_name == "rede_prioritaria_onibus":
-            # Bus Priority Network analytics
-            analytics["infraestrutura_counts"] = self._count_by_field(
-                records, "INFRAESTRUTURA_PREDOMINANTE"
-            )
-            analytics["total_extensao"] = sum(
-                float(r.get("EXTENSAO_TRECHO", 0)) for r in records
-            )
-            analytics["ano_implantacao_counts"] = self._count_by_field(
-                records, "ANO_IMPLANT_INFRA_ATUAL"
-            )
+        try:
+            version, dataset = self._open_dataset(dataset_name)
+            if filters is None:
+                return len(dataset), dataset.iter_rows(start, stop, batch_size)
 
-        elif dataset_name == "redutor_velocidade":
-            # Speed Humps analytics
-            analytics["bairro_counts"] = self._count_by_field(records, "BAIRRO")
-            analytics["implantacao_years"] = self._count_by_year(
-                records, "DATA_IMPLANTACAO"
-            )
-            analytics["manutencao_years"] = self._count_by_year(
-                records, "DATA_ULTIMA_MANUTENCAO"
+            matches = self._filter_rows(dataset_name, version, dataset, filters)
+            return len(matches), self._iter_matches(
+                dataset, matches[start:stop], batch_size
             )
+        except Exception as e:
+            logger.error(f"Error streaming dataset {dataset_name}: {str(e)}")
+            return None
 
-        elif dataset_name == "sinalizacao_semaforica":
-            # Traffic Signals analytics
-            analytics["tipo_travessia_counts"] = self._count_by_field(
-                records, "TP_TRAVESSIA_PEDESTRE"
-            )
-            analytics["botoeira_counts"] = self._count_by_field(records, "BOTOEIRA")
-            analytics["botoeira_sonora_counts"] = self._count_by_field(
-                records, "BOTOEIRA_SONORA"
-            )
-            analytics["media_faixas_veiculo"] = self._average_by_field(
-                records, "QTD_TR_C_FOCO"
-            )
-            analytics["media_faixas_pedestre"] = self._average_by_field(
-                records, "QTD_TR_S_FOCO"
-            )
+    def open_dataset(self, dataset_name: str):
+        """(version, ColumnarDataset) of an available dataset, or None"""
+        if dataset_name not in self.available_datasets:
+            return None
 
-        elif dataset_name == "sinistro_transito_vitima":
-            # Traffic Accidents analytics
-            analytics["tipo_acidente_counts"] = self._count_by_field(
-                records, "DESCRICAO_TIPO_ACIDENTE"
-            )
-            analytics["regional_counts"] = self._count_by_field(
-                records, "DESCRICAO_REGIONAL"
-            )
-            analytics["fatalidade_counts"] = self._count_by_field(
-                records, "INDICADOR_FATALIDADE"
-            )
-            analytics["acidentes_por_ano"] = self._count_by_year(
-                records, "DATA_HORA_BOLETIM"
-            )
+        try:
+            return self._open_dataset(dataset_name)
+        except FileNotFoundError:
+            logger.warning(f"Dataset {dataset_name} not found in {self.data_dir}")
+            return None
+        except Exception as e:
+            logger.error(f"Error opening dataset {dataset_name}: {str(e)}")
+            return None
 
-        elif dataset_name == "trecho_no_circulacao":
-            # Non-Circulating Road Segments analytics
-            pass  # Just need the points for mapping
-
-        return analytics
-
-    def _count_by_field(self, records: List[Dict], field_name: str) -> Dict:
-        counts = {}
-        for record in records:
-            value = record.get(field_name, "Unknown")
-            counts[value] = counts.get(value, 0) + 1
-        return counts
-
-    def _count_by_year(self, records: List[Dict], date_field: str) -> Dict:
-        year_counts = {}
-        for record in records:
-            date_str = record.get(date_field)
-            if date_str:
-                try:
-                    # Handle different date formats
-                    if " " in date_str:
-                        date_part = date_str.split(" ")[0]
-                    else:
-                        date_part = date_str
-
-                    year = date_part.split("-")[0]
-                    year_counts[year] = year_counts.get(year, 0) + 1
-                except:
-                    continue
-        return year_counts
-
-    def _average_by_field(self, records: List[Dict], field_name: str) -> float:
-        total = 0
-        count = 0
-        for record in records:
-            value = record.get(field_name)
-            if value and str(value).isdigit():
-                total += int(value)
-                count += 1
-        return total / count if count > 0 else 0
+    def dataset_version(self, dataset_name: str):
+        """
+        Version of a dataset's data without decoding it: its JSON file's
+        (mtime, size), else its columnar store version, else None
+        """
+        if dataset_name not in self.available_datasets:
+            return None
+        try:
+            return LayerCache.file_version(Path(self.data_dir) / f"{dataset_name}.json")
+        except FileNotFoundError:
+            return self.store.current_version(dataset_name)
+
+    def analytics_snapshot(self) -> List[Tuple]:
+        """(dataset, version, analytics) of every computed analytics entry"""
+        return self._analytics.snapshot()
+
+    def restore_analytics(self, entries: List[Tuple]):
+        """Put back analytics taken with analytics_snapshot()"""
+        self._analytics.restore(entries)
+
+    def get_column(self, dataset_name: str, field: str) -> Optional[List]:
+        """All values of one field of a dataset, or None if unavailable"""
+        opened = self.open_dataset(dataset_name)
+        if opened is None:
+            return None
+        return opened[1].column(field)
+
+    def _filter_rows(self, dataset_name: str, version, dataset, filters: List):
+        """Sorted indices of the rows matching filters, via a bitmap index"""
+        index = self._indexes.get(dataset_name, version)
+        if index is None:
+            index = BitmapIndex(dataset)
+            self._indexes.put(dataset_name, version, index)
+        return index.rows(filters)
+
+    @staticmethod
+    def _iter_matches(dataset: ColumnarDataset, rows, batch_size: int):
+        for batch_start in range(0, len(rows), batch_size):
+            yield dataset.take(rows[batch_start:][:batch_size]).rows()
+
+    def _open_dataset(self, dataset_name: str):
+        """
+        Return (version, ColumnarDataset) for a dataset. The columnar store is
+        memory-mapped when fresh; otherwise the JSON file is decoded once per
+        file version and kept in memory.
+        """
+        file_path = Path(self.data_dir) / f"{dataset_name}.json"
+        dataset = self.store.open(dataset_name, file_path)
+        if dataset is not None:
+            return ("store", dataset.version), dataset
+
+        version = LayerCache.file_version(file_path)
+        dataset = self._datasets.get(dataset_name, version)
+        if dataset is None:
+            with open(file_path, "r", encoding="utf-8") as f, timed("json_decode"):
+                raw_data = json.load(f)
+            with timed("columnar_encode"):
+                dataset = ColumnarDataset.from_json(raw_data)
+            self._datasets.put(dataset_name, version, dataset)
+        return version, dataset
+
+    def _get_dataset_analytics(
+        self, dataset_name: str, dataset: ColumnarDataset
+    ) -> Dict:
+        return self.analytics_engine.evaluate(dataset_name, dataset)
@@ -0,0 +1,328 @@
+import logging
+import math
+import os
+import struct
+import threading
+import zlib
+import numpy as np
+from src.services.bitmap_index import filter_groups, filter_key
+from src.services.heatmap_service import FILE_MAPPING
+from src.services.layer_cache import LayerCache
+from src.services.metrics import timed
+from src.services.vector_tiles import EARTH_RADIUS, tile_bounds
+
+PNG_MIMETYPE = "image/png"
+GRID_MIMETYPE = "application/octet-stream"
+TILE_SIZE = 256
+
+# Gaussian kernel standard deviation, in metres
+DEFAULT_BANDWIDTH = 150.0
+MIN_BANDWIDTH = 10.0
+MAX_BANDWIDTH = 5000.0
+
+# Surfaces are sampled at a quarter of the bandwidth, but never finer than
+# MIN_CELL_SIZE metres nor into more than MAX_GRID_CELLS cells
+MIN_CELL_SIZE = 5.0
+MAX_GRID_CELLS = 4_000_000
+
+# The surface extends this many bandwidths past the outermost points
+MARGIN_BANDWIDTHS = 4
+
+# Density (per hectare) at this quantile of the non-empty cells maps to the
+# hottest colour, so a single hotspot does not wash out the rest of the map
+SATURATION_QUANTILE = 0.995
+
+# (position, (r, g, b, a)) stops of the tile colour ramp
+COLOR_STOPS = (
+    (0.0, (0, 255, 0, 0)),
+    (0.1, (0, 255, 0, 140)),
+    (0.4, (255, 255, 0, 190)),
+    (0.7, (255, 128, 0, 215)),
+    (1.0, (255, 0, 0, 235)),
+)
+
+
+def parse_bandwidth(value):
+    """Bandwidth in metres from a query argument; raises ValueError when invalid"""
+    if value is None or value == "":
+        return DEFAULT_BANDWIDTH
+    try:
+        bandwidth = float(value)
+    except ValueError:
+        raise ValueError(f"Invalid bandwidth: {value}")
+    if not MIN_BANDWIDTH <= bandwidth <= MAX_BANDWIDTH:
+        raise ValueError(
+            f"bandwidth must be between {MIN_BANDWIDTH:g}m and {MAX_BANDWIDTH:g}m"
+        )
+    return bandwidth
+
+
+def _color_ramp():
+    """256 x RGBA lookup table of COLOR_STOPS"""
+    positions = [stop[0] for stop in COLOR_STOPS]
+    levels = np.linspace(0, 1, 256)
+    channels = [
+        np.interp(levels, positions, [stop[1][c] for stop in COLOR_STOPS])
+        for c in range(4)
+    ]
+    return np.rint(np.stack(channels, axis=1)).astype(np.uint8)
+
+
+COLOR_RAMP = _color_ramp()
+
+
+def _png_chunk(kind, data):
+    chunk = kind + data
+    return struct.pack(">I", len(data)) + chunk + struct.pack(">I", zlib.crc32(chunk))
+
+
+def encode_png(rgba):
+    """PNG bytes of an (height, width, 4) uint8 RGBA array"""
+    height, width, _ = rgba.shape
+    # Every scanline starts with filter type 0 (None)
+    scanlines = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = rgba.reshape(height, width * 4)
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"".join(
+        (
+            b"\x89PNG\r\n\x1a\n",
+            _png_chunk(b"IHDR", header),
+            _png_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)),
+            _png_chunk(b"IEND", b""),
+        )
+    )
+
+
+EMPTY_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+def gaussian_density(x, y, bandwidth, cell_size=None):
+    """
+    Kernel density estimate of projected points: the points are binned onto a
+    grid of cell_size metres (default a quarter of the bandwidth) and the
+    grid is convolved with a Gaussian of standard deviation bandwidth by
+    multiplying its FFT with the Gaussian's transfer function. The grid is
+    padded by MARGIN_BANDWIDTHS bandwidths, so the circular convolution does
+    not wrap. Returns a DensitySurface, None without points.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+    if not len(x):
+        return None
+
+    margin = MARGIN_BANDWIDTHS * bandwidth
+    min_x, min_y = x.min() - margin, y.min() - margin
+    width_m, height_m = x.max() + margin - min_x, y.max() + margin - min_y
+    if cell_size is None:
+        cell_size = max(bandwidth / 4, MIN_CELL_SIZE)
+    cell_size = max(cell_size, math.sqrt(width_m * height_m / MAX_GRID_CELLS))
+    columns = int(math.ceil(width_m / cell_size)) + 1
+    rows = int(math.ceil(height_m / cell_size)) + 1
+
+    with timed("density_bin"):
+        col = np.floor((x - min_x) / cell_size).astype(np.int64)
+        row = np.floor((y - min_y) / cell_size).astype(np.int64)
+        counts = np.bincount(row * columns + col, minlength=rows * columns)
+        grid = counts.reshape(rows, columns).astype(np.float64)
+
+    with timed("density_fft"):
+        sigma = bandwidth / cell_size
+        fy = np.fft.fftfreq(rows)[:, None]
+        fx = np.fft.rfftfreq(columns)[None, :]
+        transfer = np.exp(-2 * (math.pi * sigma) ** 2 * (fx**2 + fy**2))
+        smoothed = np.fft.irfft2(np.fft.rfft2(grid) * transfer, s=grid.shape)
+
+    # Points per hectare; the FFT leaves tiny negative round-off values
+    hectares = cell_size * cell_size / 10_000
+    density = np.clip(smoothed, 0, None) / hectares
+    return DensitySurface(density.astype(np.float32), min_x, min_y, cell_size)
+
+
+class DensitySurface:
+    """
+    A density grid in UTM 23S metres: density[row, col] is the density at
+    the centre of the cell whose south-west corner is (min_x + col *
+    cell_size, min_y + row * cell_size), rows running south to north. Values
+    are points per hectare.
+    """
+
+    def __init__(self, density, min_x, min_y, cell_size):
+        self.density = density
+        self.min_x = min_x
+        self.min_y = min_y
+        self.cell_size = cell_size
+        positive = density[density > 0]
+        self.scale = (
+            float(np.quantile(positive, SATURATION_QUANTILE)) if len(positive) else 0.0
+        )
+
+    @property
+    def bounds(self):
+        """(min_x, min_y, max_x, max_y) of the outer edges of the grid"""
+        rows, columns = self.density.shape
+        return (
+            self.min_x,
+            self.min_y,
+            self.min_x + columns * self.cell_size,
+            self.min_y + rows * self.cell_size,
+        )
+
+    def sample(self, x, y):
+        """Bilinear interpolation of the density at projected points (0 outside)"""
+        rows, columns = self.density.shape
+        fx = (np.asarray(x) - self.min_x) / self.cell_size - 0.5
+        fy = (np.asarray(y) - self.min_y) / self.cell_size - 0.5
+        inside = (fx >= 0) & (fx <= columns - 1) & (fy >= 0) & (fy <= rows - 1)
+        fx = np.where(inside, fx, 0)
+        fy = np.where(inside, fy, 0)
+        c0 = np.minimum(np.floor(fx).astype(np.int64), columns - 2)
+        r0 = np.minimum(np.floor(fy).astype(np.int64), rows - 2)
+        tx, ty = fx - c0, fy - r0
+        d = self.density
+        south = d[r0, c0] * (1 - tx) + d[r0, c0 + 1] * tx
+        north = d[r0 + 1, c0] * (1 - tx) + d[r0 + 1, c0 + 1] * tx
+        return np.where(inside, south * (1 - ty) + north * ty, 0.0)
+
+    def float16_grid(self):
+        """The surface as little-endian float16 rows from north to south"""
+        limit = np.finfo(np.float16).max
+        return np.minimum(self.density[::-1], limit).astype("<f2").tobytes()
+
+
+class DensityService:
+    """
+    Server-side heatmaps: Gaussian kernel density surfaces of the heatmap
+    layers, one per layer, filter combination and bandwidth, rendered as PNG
+    XYZ tiles or exported as a Float16 grid. Rendering a tile samples the
+    surface, so its cost does not depend on the number of points. Surfaces
+    and tiles are cached per version of the layer's source file.
+    """
+
+    def __init__(self, heatmap_service, cache_size=None, tile_cache_size=None):
+        self.log = logging.getLogger(__name__)
+        self.heatmap_service = heatmap_service
+        if cache_size is None:
+            cache_size = int(os.getenv("DENSITY_CACHE_SIZE", "8"))
+        if tile_cache_size is None:
+            tile_cache_size = int(os.getenv("DENSITY_TILE_CACHE_SIZE", "2048"))
+        self.surfaces = LayerCache(maxsize=cache_size)
+        self.cache = LayerCache(maxsize=tile_cache_size)
+
+        # WGS84 to UTM 23S, built on first use (pyproj is slow to import)
+        self._transformer = None
+        self._transformer_lock = threading.Lock()
+
+    @property
+    def transformer(self):
+        if self._transformer is None:
+            with self._transformer_lock:
+                if self._transformer is None:
+                    from pyproj import Transformer
+
+                    self._transformer = Transformer.from_crs("EPSG:4326", "EPSG:32723")
+        return self._transformer
+
+    def surface(
+        self,
+        heatmap_type,
+        year_filter=None,
+        fatality_filter=None,
+        filters=None,
+        bandwidth=DEFAULT_BANDWIDTH,
+    ):
+        """
+        (version, DensitySurface or None) of a filtered layer, or None if
+        the layer is unknown or unavailable
+        """
+        if heatmap_type not in FILE_MAPPING:
+            return None
+        version = self.heatmap_service.layer_version(heatmap_type)
+        if version is None:
+            return None
+
+        groups = filter_groups(year_filter, fatality_filter, filters)
+        key = (heatmap_type, filter_key(groups), bandwidth)
+        cached = self.surfaces.get(key, version)
+        if cached is not None:
+            return version, cached[0]
+
+        points = self.heatmap_service.layer_points(heatmap_type, groups)
+        if points is None:
+            return None
+        version, lat, lng, _ = points
+        surface = None
+        if len(lat):
+            with timed("reproject"):
+                x, y = self.transformer.transform(lat, lng)
+            surface = gaussian_density(x, y, bandwidth)
+            self.log.debug(
+                f"Built {surface.density.shape} density surface of {heatmap_type} "
+                f"for {key} from {len(lat)} points"
+            )
+        # Wrapped so that a layer without points is cached too
+        self.surfaces.put(key, version, (surface,))
+        return version, surface
+
+    def get_tile(
+        self,
+        heatmap_type,
+        z,
+        x,
+        y,
+        year_filter=None,
+        fatality_filter=None,
+        filters=None,
+        bandwidth=DEFAULT_BANDWIDTH,
+    ):
+        """PNG bytes of an XYZ density tile, or None if the layer is unavailable"""
+        opened = self.surface(
+            heatmap_type, year_filter, fatality_filter, filters, bandwidth
+        )
+        if opened is None:
+            return None
+        version, surface = opened
+
+        groups = filter_groups(year_filter, fatality_filter, filters)
+        key = (heatmap_type, filter_key(groups), bandwidth, z, x, y)
+        tile = self.cache.get(key, version)
+        if tile is None:
+            with timed("density_tile"):
+                tile = self._render(surface, z, x, y)
+            self.cache.put(key, version, tile)
+        return tile
+
+    def _render(self, surface, z, x, y):
+        if surface is None or surface.scale <= 0:
+            return EMPTY_TILE
+
+        # Pixel centres in Web Mercator, then degrees, then UTM 23S
+        min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+        pixel = (max_x - min_x) / TILE_SIZE
+        offsets = (np.arange(TILE_SIZE) + 0.5) * pixel
+        lng = np.degrees((min_x + offsets) / EARTH_RADIUS)
+        lat = np.degrees(
+            2 * np.arctan(np.exp((max_y - offsets) / EARTH_RADIUS)) - np.pi / 2
+        )
+
+        # Skip tiles whose corners all lie on one side of the surface
+        corners_x, corners_y = self.transformer.transform(
+            lat[[0, 0, -1, -1]], lng[[0, -1, 0, -1]]
+        )
+        left, bottom, right, top = surface.bounds
+        if (
+            np.all(corners_x < left)
+            or np.all(corners_x > right)
+            or np.all(corners_y < bottom)
+            or np.all(corners_y > top)
+        ):
+            return EMPTY_TILE
+
+        grid_lat, grid_lng = np.meshgrid(lat, lng, indexing="ij")
+        utm_x, utm_y = self.transformer.transform(grid_lat, grid_lng)
+        values = surface.sample(utm_x, utm_y)
+        levels = np.clip(values / surface.scale * 255, 0, 255).astype(np.uint8)
+        if not levels.any():
+            return EMPTY_TILE
+        return encode_png(COLOR_RAMP[levels])
@@ -0,0 +1,147 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from src.services.metrics import timed_upstream
+from src.services.route_cache import RouteCache
+
+# Distance Matrix API limits per request
+MAX_ORIGINS = 25
+MAX_DESTINATIONS = 25
+MAX_ELEMENTS = 100
+
+
+def format_location(location):
+    """Locations may be addresses or (lat, lng) pairs; pairs become "lat,lng" """
+    if isinstance(location, (tuple, list)):
+        lat, lng = location
+        return f"{float(lat):.6f},{float(lng):.6f}"
+    if isinstance(location, dict):
+        return f"{float(location['lat']):.6f},{float(location['lng']):.6f}"
+    return str(location)
+
+
+def chunk_shape(n_origins, n_destinations, max_elements=MAX_ELEMENTS):
+    """Largest origins x destinations block allowed in a single request"""
+    cols = max(1, min(n_destinations, MAX_DESTINATIONS, max_elements))
+    rows = max(1, min(n_origins, MAX_ORIGINS, max_elements // cols))
+    return rows, cols
+
+
+class DistanceMatrixPlanner:
+    """
+    Computes N x M duration/distance matrices by splitting the request into
+    blocks that fit the API's per-request limits, fetching the blocks on a
+    bounded thread pool and stitching them into NumPy arrays. Cells already
+    in the cell cache are reused and only missing cells are requested.
+    """
+
+    def __init__(self, client, cache=None, max_workers=4, max_elements=MAX_ELEMENTS):
+        self.log = logging.getLogger(__name__)
+        self.client = client
+        self.cache = cache or RouteCache(maxsize=100_000)
+        self.max_workers = max_workers
+        self.max_elements = max_elements
+
+    def plan(self, origins, destinations, mode="driving"):
+        """
+        Returns {"origins", "destinations", "duration", "distance"} where
+        duration (seconds) and distance (metres) are float arrays of shape
+        (len(origins), len(destinations)), NaN for cells without a route.
+        """
+        origins = [format_location(o) for o in origins]
+        destinations = [format_location(d) for d in destinations]
+        duration = np.full((len(origins), len(destinations)), np.nan)
+        distance = np.full((len(origins), len(destinations)), np.nan)
+
+        keys = self._cell_keys(origins, destinations, mode)
+        missing = np.ones(duration.shape, dtype=bool)
+        for i, row in enumerate(keys):
+            for j, key in enumerate(row):
+                cell = self.cache.get(key)
+                if cell is not None:
+                    duration[i, j], distance[i, j] = cell
+                    missing[i, j] = False
+
+        matrix = {
+            "origins": origins,
+            "destinations": destinations,
+            "duration": duration,
+            "distance": distance,
+        }
+        blocks = self._blocks(missing)
+        self.log.debug(
+            f"Distance matrix {duration.shape}: {int(missing.sum())} cells missing, "
+            f"{len(blocks)} requests"
+        )
+        if blocks:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = pool.map(
+                    lambda block: self._fetch(matrix, mode, *block), blocks
+                )
+                for (rows, cols), elements in zip(blocks, results):
+                    self._fill(matrix, keys, rows, cols, elements)
+        return matrix
+
+    @staticmethod
+    def _cell_keys(origins, destinations, mode):
+        """
+        Cache key of every cell. Each address is normalized once, and tabs
+        cannot occur in normalized text, so they separate the parts.
+        """
+        mode = RouteCache.normalize(mode or "")
+        destinations = [RouteCache.normalize(d) for d in destinations]
+        return [
+            [f"{origin}\t{destination}\t{mode}" for destination in destinations]
+            for origin in (RouteCache.normalize(o) for o in origins)
+        ]
+
+    def _blocks(self, missing):
+        """
+        (row indices, column indices) of blocks covering exactly the missing
+        cells: rows missing the same columns are fetched together, so cells
+        already cached are never requested again
+        """
+        rows = np.flatnonzero(missing.any(axis=1))
+        if not len(rows):
+            return []
+        patterns, group = np.unique(missing[rows], axis=0, return_inverse=True)
+        group = group.reshape(-1)
+
+        blocks = []
+        for g, pattern in enumerate(patterns):
+            group_rows = rows[group == g]
+            cols = np.flatnonzero(pattern)
+            n_rows, n_cols = chunk_shape(len(group_rows), len(cols), self.max_elements)
+            for r in range(0, len(group_rows), n_rows):
+                block_rows = group_rows[r:][:n_rows]
+                for c in range(0, len(cols), n_cols):
+                    blocks.append((block_rows, cols[c:][:n_cols]))
+        return blocks
+
+    def _fetch(self, matrix, mode, rows, cols):
+        try:
+            with timed_upstream("distance_matrix"):
+                response = self.client.distance_matrix(
+                    [matrix["origins"][i] for i in rows],
+                    [matrix["destinations"][j] for j in cols],
+                    mode=mode,
+                )
+            return [row["elements"] for row in response["rows"]]
+        except Exception as e:
+            self.log.error(f"Error getting distance matrix block: {str(e)}")
+            return None
+
+    def _fill(self, matrix, keys, rows, cols, elements):
+        """Write a block's OK elements into the matrix and the cell cache"""
+        if elements is None:
+            return
+        for i, row in zip(rows, elements):
+            for j, element in zip(cols, row):
+                if element.get("status") != "OK":
+                    continue
+                cell = (
+                    float(element["duration"]["value"]),
+                    float(element["distance"]["value"]),
+                )
+                matrix["duration"][i, j], matrix["distance"][i, j] = cell
+                self.cache.put(keys[i][j], cell)
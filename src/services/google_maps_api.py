@@ -1,8 +1,10 @@
 import logging
 import os
-import googlemaps
 from datetime import datetime
 from dotenv import load_dotenv
+from src.services.distance_matrix import DistanceMatrixPlanner
+from src.services.metrics import timed_upstream
+from src.services.route_cache import RouteCache
 
 load_dotenv()
 
@@ -12,20 +14,53 @@ class GoogleMapsService:
     Class to interact with Google Maps API for route calculations and distance matrices.
     """
 
-    def __init__(self):
+    def __init__(self, client=None, route_cache=None):
         self.log = logging.getLogger(__name__)
         self.api_key = os.getenv("GOOGLE_MAPS_SERVER_KEY")
-        if not self.api_key:
-            self.log.error("Google Maps API key not found in environment variables")
-            raise ValueError("Google Maps API key not configured")
+        if client is None:
+            if not self.api_key:
+                self.log.error("Google Maps API key not found in environment variables")
+                raise ValueError("Google Maps API key not configured")
+            # Imported here: googlemaps pulls in requests, slow to import
+            import googlemaps
 
-        self.client = googlemaps.Client(key=self.api_key)
+            # GOOGLE_MAPS_BASE_URL points the client at another server,
+            # e.g. a local fake Directions API
+            base_url = os.getenv("GOOGLE_MAPS_BASE_URL")
+            if base_url:
+                client = googlemaps.Client(key=self.api_key, base_url=base_url)
+            else:
+                client = googlemaps.Client(key=self.api_key)
+
+        self.client = client
+        self.route_cache = route_cache or RouteCache(
+            maxsize=int(os.getenv("ROUTE_CACHE_SIZE", "256")),
+            ttl=float(os.getenv("ROUTE_CACHE_TTL", "600")),
+            db_path=os.getenv("ROUTE_CACHE_DB") or None,
+        )
+        self.matrix_planner = DistanceMatrixPlanner(
+            self.client,
+            cache=RouteCache(
+                maxsize=int(os.getenv("DISTANCE_MATRIX_CACHE_SIZE", "100000")),
+                ttl=float(os.getenv("ROUTE_CACHE_TTL", "600")),
+            ),
+            max_workers=int(os.getenv("DISTANCE_MATRIX_WORKERS", "4")),
+        )
         self.log.debug("Google Maps service initialized")
 
     def get_route(self, origins, destinations, mode, waypoints=None):
         """
         Get the route between two locations using Google Maps Directions API.
+        Results are cached per normalized request and identical concurrent
+        requests share one upstream call.
         """
+        key = RouteCache.make_key(origins, destinations, mode, waypoints)
+        return self.route_cache.get_or_compute(
+            key, lambda: self._fetch_route(origins, destinations, mode, waypoints)
+        )
+
+    def _fetch_route(self, origins, destinations, mode, waypoints=None):
+        """Call the Directions API; returns the first route or None"""
         try:
             self.log.debug(
                 f"Getting route from {origins} to {destinations} with {len(waypoints) if waypoints else 0} waypoints (mode: {mode})"
@@ -38,26 +73,28 @@ class GoogleMapsService:
                 #     self.log.warning("Transit mode requires exactly two waypoints or none")
                 #     return None
 
-                directions = self.client.directions(
-                    origins,
-                    destinations,
-                    mode=mode,
-                    alternatives=False,
-                    departure_time=now,
-                    transit_mode=["bus", "subway", "train"],
-                    transit_routing_preference="less_walking",
-                )
+                with timed_upstream("directions"):
+                    directions = self.client.directions(
+                        origins,
+                        destinations,
+                        mode=mode,
+                        alternatives=False,
+                        departure_time=now,
+                        transit_mode=["bus", "subway", "train"],
+                        transit_routing_preference="less_walking",
+                    )
             else:
-                directions = self.client.directions(
-                    origins,
-                    destinations,
-                    mode=mode,
-                    alternatives=False,
-                    departure_time=now,
-                    traffic_model="optimistic",
-                    waypoints=waypoints if waypoints else None,
-                    optimize_waypoints=True,
-                )
+                with timed_upstream("directions"):
+                    directions = self.client.directions(
+                        origins,
+                        destinations,
+                        mode=mode,
+                        alternatives=False,
+                        departure_time=now,
+                        traffic_model="optimistic",
+                        waypoints=waypoints if waypoints else None,
+                        optimize_waypoints=True,
+                    )
 
             if directions:
                 self.log.debug(f'Route found with {len(directions[0]["legs"])} legs')
@@ -78,8 +115,20 @@ class GoogleMapsService:
             self.log.debug(
                 f"Getting distance matrix for {len(origins)} origins and {len(destinations)} destinations"
             )
-            matrix = self.client.distance_matrix(origins, destinations, mode=mode)
+            with timed_upstream("distance_matrix"):
+                matrix = self.client.distance_matrix(origins, destinations, mode=mode)
             return matrix
         except Exception as e:
             self.log.error(f"Error getting distance matrix: {str(e)}", exc_info=True)
             return None
+
+    def plan_distance_matrix(self, origins, destinations, mode="driving"):
+        """
+        Duration/distance matrices for any number of origins and destinations,
+        fetched in API-sized blocks and reusing previously computed cells.
+        """
+        try:
+            return self.matrix_planner.plan(origins, destinations, mode)
+        except Exception as e:
+            self.log.error(f"Error planning distance matrix: {str(e)}", exc_info=True)
+            return None
@@ -1,22 +1,56 @@
 import json
 import os
 import logging
+import threading
+import numpy as np
 from dotenv import load_dotenv
 from pathlib import Path
-from pyproj import Transformer
+from src.services.aggregation import bin_points
+from src.services.bitmap_index import (
+    BitmapIndex,
+    boletim_year,
+    filter_groups,
+    filter_key,
+    record_matches,
+)
+from src.services.columnar_store import (
+    ColumnarDataset,
+    ColumnarStore,
+    gather_vertices,
+)
+from src.services.layer_cache import LayerCache
+from src.services.metrics import timed
+from src.services.spatial_index import FeatureIndex
+from src.services.wire_format import encode_layer
 
 load_dotenv()
 
+# Map button IDs to filenames
+FILE_MAPPING = {
+    "speed-reducer": "redutor_velocidade.json",
+    "traffic-light-signaling": "sinalizacao_semaforica.json",
+    "electronic-physicalization": "fiscalizacao_eletronica.json",
+    "public-parking-elderly-person": "estacionamento_publico_pessoa_idosa.json",
+    "short-term-parking": "estacionamento_rotativo.json",
+    "rotary-sales-point": "posto_venda_rotativo.json",
+    "traffic-accident-with-victims": "sinistro_transito_vitima.json",
+}
+
+# Records processed per batch when a layer is streamed
+STREAM_BATCH_SIZE = 1000
+
 
 class HeatmapService:
     """
     Service to handle heatmap data loading and processing.
     """
 
-    def __init__(self):
+    def __init__(self, cache_size=None, data_dir=None):
         self.log = logging.getLogger(__name__)
-        # Get the project root directory
-        self.data_dir = Path(__file__).parent.parent.parent / "data"
+        # Default to the data directory at the project root
+        if data_dir is None:
+            data_dir = Path(__file__).parent.parent.parent / "data"
+        self.data_dir = Path(data_dir)
         self.log.debug(
             f"HeatmapService initialized with data directory: {self.data_dir}"
         )
@@ -27,13 +61,38 @@ class HeatmapService:
             raise FileNotFoundError(f"Data directory not found at: {self.data_dir}")
 
         # List available files for debugging
-        available_files = list(self.data_dir.glob("*.json"))
-        self.log.info(f"Available JSON files: {[f.name for f in available_files]}")
-
-        # Initialize coordinate transformer (example for UTM zone 23S - adjust as needed)
-        self.transformer = Transformer.from_crs(
-            "EPSG:32723", "EPSG:4326"
-        )  # UTM 23S to WGS84
+        if self.log.isEnabledFor(logging.DEBUG):
+            available_files = list(self.data_dir.glob("*.json"))
+            self.log.debug(f"Available JSON files: {[f.name for f in available_files]}")
+
+        # Coordinate transformer, built on first reprojection (pyproj is slow to import)
+        self._transformer = None
+        self._transformer_lock = threading.Lock()
+
+        # Process-wide cache of built layers, keyed by (type, year, fatality)
+        if cache_size is None:
+            cache_size = int(os.getenv("HEATMAP_CACHE_SIZE", "32"))
+        self.cache = LayerCache(maxsize=cache_size)
+
+        # Columnar store written by ingest.py, used when present and fresh
+        self.store = ColumnarStore(self.data_dir / "store")
+
+        # Parsed datasets and their spatial and bitmap indexes, one entry per
+        # file version
+        self._datasets = LayerCache(maxsize=len(FILE_MAPPING))
+        self._indexes = LayerCache(maxsize=len(FILE_MAPPING))
+        self._bitmaps = LayerCache(maxsize=len(FILE_MAPPING))
+
+    @property
+    def transformer(self):
+        """UTM 23S to WGS84 transformer, created on first use"""
+        if self._transformer is None:
+            with self._transformer_lock:
+                if self._transformer is None:
+                    from pyproj import Transformer
+
+                    self._transformer = Transformer.from_crs("EPSG:32723", "EPSG:4326")
+        return self._transformer
 
     def convert_to_latlon(self, x, y):
         """Convert projected coordinates to latitude/longitude"""
@@ -46,179 +105,431 @@ class HeatmapService:
 
     def parse_linestring(self, linestring):
         """Parse LINESTRING coordinates and convert to lat/lon"""
+        return self.process_geometry(linestring)
+
+    def parse_coordinates(self, geom):
+        """
+        Parse a POINT/LINESTRING geometry (WKT or GeoJSON) into a flat
+        [x0, y0, x1, y1, ...] list of projected coordinates.
+        """
         try:
-            # Remove "LINESTRING (" and ")"
-            coords_str = linestring[12:-1]
-            # Split into coordinate pairs
-            pairs = coords_str.split(", ")
-            points = []
-
-            for pair in pairs:
-                x, y = map(float, pair.split())
-                converted = self.convert_to_latlon(x, y)
-                if converted:
-                    points.append(converted)
-
-            return points
+            # Handle LINESTRING format
+            if isinstance(geom, str) and geom.startswith("LINESTRING"):
+                # Remove "LINESTRING (" and ")"
+                coords = []
+                for pair in geom[12:-1].split(", "):
+                    x, y = map(float, pair.split())
+                    coords.extend((x, y))
+                return coords
+
+            # Handle POINT format
+            if isinstance(geom, str) and geom.startswith("POINT"):
+                coords = geom[7:-1].split()  # Remove "POINT (" and ")"
+                if len(coords) == 2:
+                    return [float(coords[0]), float(coords[1])]
+                return []
+
+            # Handle GeoJSON format
+            if isinstance(geom, dict) and "coordinates" in geom:
+                if geom["type"] == "LineString":
+                    coords = []
+                    for x, y in geom["coordinates"]:
+                        coords.extend((float(x), float(y)))
+                    return coords
+                if geom["type"] == "Point":
+                    x, y = geom["coordinates"]
+                    return [float(x), float(y)]
         except Exception as e:
-            self.log.error(f"Error parsing LINESTRING: {str(e)}")
-            return []
+            self.log.error(f"Error processing geometry: {str(e)}")
+
+        return []
 
-    def load_data(self, heatmap_type: str, year_filter=None, fatality_filter=None):
+    def reproject_geometries(self, geometries):
+        """
+        Reproject the vertices of many geometries with a single transformer call.
+
+        Returns (lat, lng, offsets) where lat/lng are contiguous float arrays and
+        the vertices of geometries[i] are lat[offsets[i]:offsets[i + 1]].
+        """
+        coords = []
+        offsets = np.zeros(len(geometries) + 1, dtype=np.int64)
+        for i, geom in enumerate(geometries):
+            coords.extend(self.parse_coordinates(geom))
+            offsets[i + 1] = len(coords) // 2
+
+        xy = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        if not len(xy):
+            return np.empty(0), np.empty(0), offsets
+
+        with timed("reproject"):
+            lat, lng = self.transformer.transform(xy[:, 0], xy[:, 1])
+        return np.asarray(lat), np.asarray(lng), offsets
+
+    @staticmethod
+    def to_points(lat, lng):
+        """Build the {"lat", "lng"} response dicts from coordinate arrays"""
+        return [{"lat": a, "lng": b} for a, b in zip(lat.tolist(), lng.tolist())]
+
+    def load_data(
+        self,
+        heatmap_type: str,
+        year_filter=None,
+        fatality_filter=None,
+        agg=None,
+        cell_size=None,
+        bbox=None,
+        output_format="json",
+        filters=None,
+    ):
         """
         Load JSON data for specific heatmap type.
+
+        With agg ("grid" or "hex") the points are binned server-side into
+        cells of cell_size metres and returned as weighted [lat, lng, weight]
+        rows under "cells" instead of one {"lat", "lng"} dict per vertex.
+
+        With bbox (min_lat, min_lng, max_lat, max_lng) only the features whose
+        bounds intersect the box are returned, found through a per-layer
+        spatial index.
+
+        output_format picks the serialization (see wire_format.FORMATS): the
+        JSON formats return a dict, "binary" returns bytes.
+
+        filters is a parsed filter expression (see bitmap_index.parse_filter),
+        AND-ed with the year and fatality filters and resolved through a
+        per-layer bitmap index.
+
+        Built layers are cached until the source file's mtime or size changes,
+        so warm requests skip the JSON decode and reprojection. Unknown types
+        and missing files give an empty layer; errors while building one are
+        logged and raised, so that they are never cached or served as data.
         """
-        self.log.info(
+        self.log.debug(
             f"Loading heatmap data for {heatmap_type} with filters - year: {year_filter}, fatality: {fatality_filter}"
         )
 
-        try:
-            # Map button IDs to filenames
-            file_mapping = {
-                "speed-reducer": "redutor_velocidade.json",
-                "traffic-light-signaling": "sinalizacao_semaforica.json",
-                "electronic-physicalization": "fiscalizacao_eletronica.json",
-                "public-parking-elderly-person": "estacionamento_publico_pessoa_idosa.json",
-                "short-term-parking": "estacionamento_rotativo.json",
-                "rotary-sales-point": "posto_venda_rotativo.json",
-                "traffic-accident-with-victims": "sinistro_transito_vitima.json",
-            }
-
-            filename = file_mapping.get(heatmap_type)
-            if not filename:
-                self.log.warning(f"No mapping found for heatmap type: {heatmap_type}")
-                return {"points": []}
-
-            file_path = self.data_dir / filename
-
-            if not file_path.exists():
-                available_files = "\n".join([f.name for f in self.data_dir.glob("*")])
-                self.log.error(
-                    f"File {filename} not found in {self.data_dir}\n"
-                    f"Available files:\n{available_files}"
-                )
-                return {"points": []}
+        filename = FILE_MAPPING.get(heatmap_type)
+        if not filename:
+            self.log.warning(f"No mapping found for heatmap type: {heatmap_type}")
+            return {"points": []}
 
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+        file_path = self.data_dir / filename
+        version = self._source_version(file_path)
+        if version is None:
+            return {"points": []}
 
-            points = []
-            details = []  # Store additional details for each point
-
-            if "fields" in data and "records" in data:
-                field_names = [field["id"] for field in data["fields"]]
-                for record in data["records"]:
-                    row = dict(zip(field_names, record))
-
-                    record_year = None
-                    try:
-                        boletim = row.get("NUMERO_BOLETIM", "")
-                        if isinstance(boletim, str) and "-" in boletim:
-                            record_year = boletim.split("-")[0]
-                    except Exception as e:
-                        self.log.warning(
-                            f"Failed to extract year from NUMERO_BOLETIM: {boletim}"
-                        )
-
-                    if year_filter and record_year != str(year_filter):
-                        continue
-
-                    if (
-                        fatality_filter
-                        and row.get("INDICADOR_FATALIDADE", "").lower()
-                        != fatality_filter.lower()
-                    ):
-                        continue
-
-                    if "GEOMETRIA" in row:
-                        point_data = self.process_geometry(row["GEOMETRIA"])
-                        if point_data:
-                            points.extend(point_data)
-                            details.append(
-                                {
-                                    "boletim": boletim,
-                                    "fatalidade": row.get("INDICADOR_FATALIDADE", ""),
-                                    "year": record_year,
-                                }
-                            )
-            elif isinstance(data, list):
-                for item in data:
-                    # Similar filtering logic as above
-                    if heatmap_type == "traffic-accident-with-victims":
-                        try:
-                            record_year = item.get("NUMERO_BOLETIM", "").split("-")[0]
-                        except:
-                            record_year = None
-
-                        if year_filter and record_year != str(year_filter):
-                            continue
-
-                        if (
-                            fatality_filter
-                            and item.get("INDICADOR_FATALIDADE", "").lower()
-                            != fatality_filter.lower()
-                        ):
-                            continue
-
-                    if "GEOMETRIA" in item:
-                        point_data = self.process_geometry(row["GEOMETRIA"])
-                        if point_data:
-                            points.extend(point_data)
-                            details.append(
-                                {
-                                    "boletim": item.get("NUMERO_BOLETIM", ""),
-                                    "fatalidade": item.get("INDICADOR_FATALIDADE", ""),
-                                    "year": row.get("NUMERO_BOLETIM", "").split("-")[0],
-                                }
-                            )
-
-            self.log.info(f"Processed {len(points)} points from {filename}")
-            return {
-                "points": points,
-                "details": (
-                    details if heatmap_type == "traffic-accident-with-victims" else []
-                ),
-            }
+        # Viewport queries vary continuously, so only whole layers are cached
+        cache_key = (
+            heatmap_type,
+            str(year_filter) if year_filter else None,
+            fatality_filter.lower() if fatality_filter else None,
+            agg,
+            cell_size if agg else None,
+            output_format,
+            filter_key(filters),
+        )
+        if bbox is None:
+            cached = self.cache.get(cache_key, version)
+            if cached is not None:
+                self.log.debug(f"Serving cached heatmap layer for {cache_key}")
+                return cached
 
+        try:
+            groups = filter_groups(year_filter, fatality_filter, filters)
+            lat, lng, details = self._build_layer(
+                heatmap_type, file_path, version, groups, bbox
+            )
+            weights = None
+            extra = {}
+            if agg:
+                with timed("aggregate"):
+                    lat, lng, weights = bin_points(lat, lng, agg, cell_size)
+                extra = {"agg": agg, "cell_size": cell_size}
+            with timed("encode"):
+                layer = encode_layer(output_format, lat, lng, details, weights, extra)
         except json.JSONDecodeError as e:
             self.log.error(f"Invalid JSON in {filename}: {str(e)}")
-            return {"points": []}
+            raise
         except Exception as e:
             self.log.error(f"Error loading {filename}: {str(e)}", exc_info=True)
-            return {"points": []}
+            raise
+
+        if bbox is None:
+            self.cache.put(cache_key, version, layer)
+        return layer
+
+    def iter_layer(
+        self,
+        heatmap_type: str,
+        year_filter=None,
+        fatality_filter=None,
+        bbox=None,
+        batch_size=STREAM_BATCH_SIZE,
+        filters=None,
+    ):
+        """
+        Yield a layer as (lat, lng, details) batches built from at most
+        batch_size records at a time, for streaming responses. details has
+        one entry per vertex (accident layers only). The points and details
+        of one batch are built at a time and, with a columnar store, only the
+        batch's span of the columns is decoded. Without a store the layer's
+        JSON file is decoded whole (and cached) before the first batch, as
+        for load_data.
+        """
+        filename = FILE_MAPPING.get(heatmap_type)
+        if not filename:
+            self.log.warning(f"No mapping found for heatmap type: {heatmap_type}")
+            return
+
+        file_path = self.data_dir / filename
+        version = self._source_version(file_path)
+        if version is None:
+            return
+
+        groups = filter_groups(year_filter, fatality_filter, filters)
+        dataset = self._open_dataset(file_path, version)
+        if isinstance(dataset, list):
+            yield self._build_list_layer(heatmap_type, dataset, groups, bbox, True)
+            return
+
+        if "GEOMETRIA" not in dataset.columns or not dataset.has_coordinates:
+            return
+
+        if bbox is not None:
+            rows = self._spatial_index(file_path.stem, version, dataset).query(bbox)
+        else:
+            rows = np.arange(len(dataset))
+        if groups is not None:
+            # Filter up front so that every batch holds batch_size matches
+            mask = self._bitmap_index(file_path.stem, version, dataset).mask(groups)
+            rows = rows[mask[rows]]
+
+        for start in range(0, len(rows), batch_size):
+            yield self._build_dataset_layer(
+                heatmap_type, dataset, rows[start:][:batch_size], batch=True
+            )
+
+    def layer_points(self, heatmap_type, groups=None, bbox=None):
+        """
+        (version, lat, lng, details) of the vertices of a heatmap layer that
+        match filter groups (see bitmap_index.filter_groups) and bbox, before
+        any aggregation or encoding. None if the layer is unknown or its data
+        file is missing.
+        """
+        filename = FILE_MAPPING.get(heatmap_type)
+        if not filename:
+            return None
+        file_path = self.data_dir / filename
+        version = self._source_version(file_path)
+        if version is None:
+            return None
+        lat, lng, details = self._build_layer(
+            heatmap_type, file_path, version, groups, bbox
+        )
+        return version, lat, lng, details
 
-    def process_geometry(self, geom):
-        """Helper method to process geometry data"""
-        points = []
+    def open_source(self, filename):
+        """
+        (version, contents) of a data file in the data directory, as cached
+        for the layers: a ColumnarDataset with per-feature geometry offsets,
+        or the raw list of a plain-list export. None if the file is missing.
+        """
+        file_path = self.data_dir / filename
+        version = self._source_version(file_path)
+        if version is None:
+            return None
+        return version, self._open_dataset(file_path, version)
+
+    def layer_version(self, heatmap_type):
+        """Version of the data behind a heatmap type, None if it has none"""
+        filename = FILE_MAPPING.get(heatmap_type)
+        if not filename:
+            return None
         try:
-            # Handle LINESTRING format
-            if isinstance(geom, str) and geom.startswith("LINESTRING"):
-                line_points = self.parse_linestring(geom)
-                points.extend(line_points)
+            return self.cache.file_version(self.data_dir / filename)
+        except FileNotFoundError:
+            return self.store.current_version(Path(filename).stem)
 
-            # Handle POINT format
-            elif isinstance(geom, str) and geom.startswith("POINT"):
-                coords = geom[7:-1].split()  # Remove "POINT (" and ")"
-                if len(coords) == 2:
-                    x, y = map(float, coords)
-                    converted = self.convert_to_latlon(x, y)
-                    if converted:
-                        points.append(converted)
+    def _source_version(self, file_path):
+        """Version of a data file (or of its store copy), None if neither exists"""
+        try:
+            return self.cache.file_version(file_path)
+        except FileNotFoundError:
+            version = self.store.current_version(file_path.stem)
+
+        if version is None:
+            available_files = "\n".join([f.name for f in self.data_dir.glob("*")])
+            self.log.error(
+                f"File {file_path.name} not found in {self.data_dir}\n"
+                f"Available files:\n{available_files}"
+            )
+        return version
+
+    def _open_dataset(self, file_path, version):
+        """
+        Return the parsed contents of a data file, cached per file version: a
+        ColumnarDataset with reprojected coordinates (from the columnar store
+        or the CKAN JSON export), or the raw list for plain-list exports.
+        """
+        dataset = self._datasets.get(file_path.stem, version)
+        if dataset is not None:
+            return dataset
 
-            # Handle GeoJSON format
-            elif isinstance(geom, dict) and "coordinates" in geom:
-                if geom["type"] == "LineString":
-                    for coord in geom["coordinates"]:
-                        x, y = coord
-                        converted = self.convert_to_latlon(x, y)
-                        if converted:
-                            points.append(converted)
-                elif geom["type"] == "Point":
-                    x, y = geom["coordinates"]
-                    converted = self.convert_to_latlon(x, y)
-                    if converted:
-                        points.append(converted)
-        except Exception as e:
-            self.log.error(f"Error processing geometry: {str(e)}")
+        dataset = self.store.open(file_path.stem, file_path)
+        if dataset is None or not dataset.has_coordinates:
+            with open(file_path, "r", encoding="utf-8") as f, timed("json_decode"):
+                data = json.load(f)
+
+            if isinstance(data, list):
+                dataset = data
+            elif "fields" in data and "records" in data:
+                dataset = ColumnarDataset.from_json(
+                    data, reproject=self.reproject_geometries
+                )
+            else:
+                dataset = ColumnarDataset([], {})
+
+        self._datasets.put(file_path.stem, version, dataset)
+        return dataset
+
+    def _spatial_index(self, name, version, dataset):
+        """FeatureIndex over a dataset's features, built once per version"""
+        index = self._indexes.get(name, version)
+        if index is None:
+            index = FeatureIndex(dataset.lat, dataset.lng, dataset.geometry_offsets)
+            self._indexes.put(name, version, index)
+        return index
+
+    def _bitmap_index(self, name, version, dataset):
+        """BitmapIndex over a dataset's categorical fields, built once per version"""
+        index = self._bitmaps.get(name, version)
+        if index is None:
+            index = BitmapIndex(dataset)
+            self._bitmaps.put(name, version, index)
+        return index
+
+    def _build_layer(self, heatmap_type, file_path, version, groups, bbox):
+        """
+        Filter and gather the reprojected vertices of a data file. Returns the
+        lat/lng arrays of the matching vertices and the accident details of
+        matching records.
+        """
+        dataset = self._open_dataset(file_path, version)
+        if isinstance(dataset, list):
+            return self._build_list_layer(heatmap_type, dataset, groups, bbox)
+
+        if "GEOMETRIA" not in dataset.columns or not dataset.has_coordinates:
+            return np.empty(0), np.empty(0), []
+
+        rows = None
+        if bbox is not None:
+            index = self._spatial_index(file_path.stem, version, dataset)
+            with timed("bbox_query"):
+                rows = index.query(bbox)
+
+        if groups is not None:
+            index = self._bitmap_index(file_path.stem, version, dataset)
+            with timed("filter"):
+                mask = index.mask(groups)
+                rows = np.flatnonzero(mask) if rows is None else rows[mask[rows]]
+
+        lat, lng, details = self._build_dataset_layer(heatmap_type, dataset, rows)
+        self.log.debug(f"Processed {len(lat)} points from {heatmap_type}")
+        return lat, lng, details
+
+    @staticmethod
+    def _column_values(dataset, field, rows, span=False):
+        """
+        Values of a column at the given rows ("" if the field is missing).
+        With span only the range covered by rows is decoded, not the column.
+        """
+        if span:
+            column = dataset.column_span(field, rows)
+            return [""] * len(rows) if column is None else column
+
+        column = dataset.column(field)
+        if column is None:
+            return [""] * len(rows)
+        return [column[i] for i in rows]
+
+    def _build_dataset_layer(self, heatmap_type, dataset, rows=None, batch=False):
+        """
+        Gather the vertices of the given (already filtered) rows of a columnar
+        dataset, all rows if None. With batch, rows is one slice of a streamed
+        layer: only its span of the columns is decoded and details are
+        repeated per vertex.
+        """
+        rows = np.arange(len(dataset)) if rows is None else np.asarray(rows)
+        vertices, lengths = dataset.vertex_indices(rows)
+        lat = np.asarray(dataset.lat[vertices])
+        lng = np.asarray(dataset.lng[vertices])
+
+        details = []
+        if heatmap_type == "traffic-accident-with-victims":
+            owners = np.repeat(rows, lengths) if batch else rows[lengths > 0]
+            owners = owners.tolist()
+            boletins = self._column_values(dataset, "NUMERO_BOLETIM", owners, batch)
+            fatalities = self._column_values(
+                dataset, "INDICADOR_FATALIDADE", owners, batch
+            )
+            details = [
+                {
+                    "boletim": boletim,
+                    "fatalidade": fatalidade,
+                    "year": boletim_year(boletim),
+                }
+                for boletim, fatalidade in zip(boletins, fatalities)
+            ]
+        return lat, lng, details
+
+    def _build_list_layer(
+        self,
+        heatmap_type,
+        data,
+        groups,
+        bbox=None,
+        per_vertex=False,
+    ):
+        """
+        Build a layer from a plain list of records (non-CKAN exports), keeping
+        those that match the filter groups. per_vertex repeats each feature's
+        details for every vertex.
+        """
+        geometries = []
+        geometry_details = []  # Store additional details for each geometry
+
+        for item in data:
+            if groups is not None and not record_matches(item, groups):
+                continue
+
+            if "GEOMETRIA" in item:
+                geometries.append(item["GEOMETRIA"])
+                geometry_details.append(
+                    {
+                        "boletim": item.get("NUMERO_BOLETIM", ""),
+                        "fatalidade": item.get("INDICADOR_FATALIDADE", ""),
+                        "year": item.get("NUMERO_BOLETIM", "").split("-")[0],
+                    }
+                )
 
-        return points
+        # Reproject every collected vertex in one batch
+        lat, lng, offsets = self.reproject_geometries(geometries)
+        if bbox is not None:
+            features = FeatureIndex(lat, lng, offsets).query(bbox)
+        else:
+            features = np.flatnonzero(offsets[1:] > offsets[:-1])
+        vertices, lengths = gather_vertices(offsets, features)
+        lat, lng = lat[vertices], lng[vertices]
+
+        details = []
+        if heatmap_type == "traffic-accident-with-victims":
+            owners = np.repeat(features, lengths) if per_vertex else features
+            details = [geometry_details[i] for i in owners.tolist()]
+
+        self.log.debug(f"Processed {len(lat)} points from {heatmap_type}")
+        return lat, lng, details
+
+    def process_geometry(self, geom):
+        """Helper method to process geometry data"""
+        lat, lng, _ = self.reproject_geometries([geom])
+        return self.to_points(lat, lng)
@@ -0,0 +1,115 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+from flask import Response, current_app, request
+from src.services.layer_cache import LayerCache
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip is offered
+    brotli = None
+
+# Bump when the bytes served for the same data and arguments change, so
+# clients holding old ETags refetch after a deploy
+ETAG_GENERATION = 1
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def make_etag(*parts):
+    """Content hash of the parts that determine a response (data version, arguments)"""
+    digest = hashlib.blake2b(
+        json.dumps([ETAG_GENERATION, *parts], default=str).encode("utf-8"),
+        digest_size=16,
+    )
+    return digest.hexdigest()
+
+
+def request_arguments():
+    """The query arguments of the current request, in a canonical order"""
+    return sorted(request.args.items(multi=True))
+
+
+def compress(body):
+    """{content-coding: bytes} variants of a response body"""
+    variants = {"identity": body}
+    if len(body) >= MIN_COMPRESS_SIZE:
+        variants["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        if brotli is not None:
+            variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return variants
+
+
+class ResponseCache:
+    """
+    Conditional, precompressed responses for endpoints whose output depends
+    only on a data version and the request arguments. Each response gets an
+    ETag derived from those, so a matching If-None-Match is answered 304
+    without building the response. Stored responses keep gzip (and, with the
+    brotli package, br) variants, served according to Accept-Encoding.
+    """
+
+    def __init__(self, maxsize=None, max_age=None):
+        self.log = logging.getLogger(__name__)
+        if maxsize is None:
+            maxsize = int(os.getenv("RESPONSE_CACHE_SIZE", "64"))
+        if max_age is None:
+            max_age = int(os.getenv("HTTP_CACHE_MAX_AGE", "300"))
+        self.max_age = max_age
+        self.cache = LayerCache(maxsize=maxsize)
+
+    def respond(self, etag, build, store=True):
+        """
+        Serve the response identified by etag: 304 if the client holds it,
+        the stored variants if any, else what build() returns (anything a
+        view may return), stored for reuse when store is set and it is a 200.
+        Other statuses (errors) are returned as built, without an ETag or
+        cache headers, so that a failure is never cached downstream.
+        """
+        if request.if_none_match.contains_weak(etag):
+            return self._headers(Response(status=304), etag)
+
+        entry = self.cache.get(etag, etag)
+        if entry is None:
+            response = current_app.make_response(build())
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            if not store:
+                return self._headers(response, etag)
+            headers = [
+                (name, value)
+                for name, value in response.headers.items()
+                if name not in ("Content-Type", "Content-Length")
+            ]
+            entry = (response.mimetype, headers, compress(response.get_data()))
+            self.cache.put(etag, etag, entry)
+
+        mimetype, headers, variants = entry
+        coding = self._negotiate(variants)
+        response = Response(variants[coding], mimetype=mimetype, headers=headers)
+        if coding != "identity":
+            response.headers["Content-Encoding"] = coding
+        return self._headers(response, etag)
+
+    @staticmethod
+    def _negotiate(variants):
+        accepted = request.accept_encodings
+        best = max(
+            (c for c in ("br", "gzip") if c in variants and accepted[c]),
+            key=lambda c: accepted[c],
+            default=None,
+        )
+        return best or "identity"
+
+    def _headers(self, response, etag):
+        # Representations differ by content-coding, so the ETag is weak
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = f"public, max-age={self.max_age}"
+        response.headers["Vary"] = "Accept, Accept-Encoding"
+        return response
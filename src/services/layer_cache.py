@@ -0,0 +1,72 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+
+class LayerCache:
+    """
+    Thread-safe LRU cache whose entries are tagged with the version of the
+    source file they were built from.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.log = logging.getLogger(__name__)
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_version(file_path):
+        """Version tag for a source file: (mtime in ns, size in bytes)"""
+        stat = os.stat(file_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, key, version):
+        """Return the cached value for key, or None if missing or stale"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self.log.debug(f"Evicting stale cache entry: {key}")
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value):
+        """Store value for key, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                self.log.debug(f"Evicting least recently used cache entry: {evicted}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        """(key, version, value) of every entry, least recently used first"""
+        with self._lock:
+            return [(key, entry[0], entry[1]) for key, entry in self._entries.items()]
+
+    def restore(self, entries):
+        """Put back entries taken with snapshot(); stale ones simply never hit"""
+        for key, version, value in entries:
+            self.put(key, version, value)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
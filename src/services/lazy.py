@@ -0,0 +1,44 @@
+import logging
+import threading
+
+
+class LazyService:
+    """
+    Stand-in for a service that is only constructed on first use: attribute
+    access builds it (once, under a lock) and delegates to it. Lets modules
+    declare their services at import time without paying for, or failing on,
+    their construction until a request needs them.
+    """
+
+    def __init__(self, factory, name=None):
+        self._factory = factory
+        self._name = name or getattr(factory, "__name__", repr(factory))
+        self._instance = None
+        self._lock = threading.Lock()
+        self._log = logging.getLogger(__name__)
+
+    def get(self):
+        """The service, constructed on first call"""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._log.debug(f"Constructing {self._name}")
+                    self._instance = self._factory()
+        return self._instance
+
+    @property
+    def built(self):
+        return self._instance is not None
+
+    def peek(self, attribute):
+        """An attribute of the service if it has been built, else None"""
+        if self._instance is None:
+            return None
+        return getattr(self._instance, attribute)
+
+    def __getattr__(self, attribute):
+        return getattr(self.get(), attribute)
+
+    def __repr__(self):
+        state = "built" if self.built else "not built"
+        return f"<LazyService {self._name} ({state})>"
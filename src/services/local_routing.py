@@ -0,0 +1,373 @@
+import heapq
+import logging
+import math
+import threading
+import numpy as np
+import shapely
+from shapely import STRtree
+from src.services.data_analytics_service import DataService
+from src.services.wire_format import encode_polyline
+
+# Datasets whose LINESTRINGs form the road graph
+ROAD_LAYERS = ("rede_prioritaria_onibus", "trecho_no_circulacao")
+
+# Seconds added when passing a feature of these datasets (humps only slow vehicles)
+PENALTIES = {"redutor_velocidade": 4.0, "sinalizacao_semaforica": 15.0}
+VEHICLE_ONLY = ("redutor_velocidade",)
+
+# Travel speeds in metres per second
+MODE_SPEEDS = {
+    "driving": 30 / 3.6,
+    "transit": 20 / 3.6,
+    "bicycling": 15 / 3.6,
+    "walking": 5 / 3.6,
+}
+VEHICLE_MODES = ("driving", "transit", "bicycling")
+
+# Vertices closer than this (metres) are merged into one graph node
+SNAP_TOLERANCE = 1.0
+# A penalty feature applies to the nodes within this distance (metres)
+PENALTY_RADIUS = 15.0
+# Locations farther than this from the network are not routed
+MAX_SNAP_DISTANCE = 1000.0
+
+
+class RoadGraph:
+    """
+    Undirected road graph in CSR form: the edges leaving node u are
+    indices[indptr[u]:indptr[u + 1]], with their lengths in metres. Node
+    coordinates are UTM 23S (EPSG:32723) metres. The searches walk Python
+    lists, built once here, and edge costs are cached per speed and
+    penalties.
+    """
+
+    def __init__(self, x, y, indptr, indices, lengths):
+        self.x = x
+        self.y = y
+        self.indptr = indptr
+        self.indices = indices
+        self.lengths = lengths
+        self.node_penalty = {}
+        self._tree = STRtree(shapely.points(x, y))
+        self._x, self._y = np.asarray(x).tolist(), np.asarray(y).tolist()
+        self._indptr = np.asarray(indptr).tolist()
+        self._indices = np.asarray(indices).tolist()
+        self._lengths = np.asarray(lengths).tolist()
+        self._costs = {}
+
+    @classmethod
+    def from_geometries(cls, geometries, snap=SNAP_TOLERANCE):
+        """
+        Build the graph from (MULTI)LINESTRING geometries, one edge per
+        segment. Lines are first split where they cross, so that crossing
+        streets share a node even where neither has a vertex there.
+        """
+        parts = shapely.get_parts(geometries)
+        parts = parts[shapely.get_type_id(parts) == 1]
+        if len(parts):
+            parts = shapely.get_parts(shapely.node(shapely.multilinestrings(parts)))
+        coords, part_index = shapely.get_coordinates(parts, return_index=True)
+        if not len(coords):
+            empty = np.empty(0)
+            return cls(empty, empty, np.zeros(1, dtype=np.int64), empty, empty)
+
+        # Merge vertices that fall on the same snap cell
+        cells = np.round(coords / snap).astype(np.int64)
+        _, first, node_of = np.unique(
+            cells, axis=0, return_index=True, return_inverse=True
+        )
+        node_of = node_of.ravel()
+        x, y = coords[first, 0], coords[first, 1]
+
+        same_part = part_index[1:] == part_index[:-1]
+        source = node_of[:-1][same_part]
+        target = node_of[1:][same_part]
+        keep = source != target
+        source, target = source[keep], target[keep]
+
+        # Both directions, without duplicate edges
+        edges = np.unique(
+            np.concatenate(
+                [np.stack([source, target], 1), np.stack([target, source], 1)]
+            ),
+            axis=0,
+        )
+        source, target = edges[:, 0], edges[:, 1]
+        lengths = np.hypot(x[target] - x[source], y[target] - y[source])
+
+        indptr = np.zeros(len(x) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source, minlength=len(x)), out=indptr[1:])
+        return cls(x, y, indptr, target, lengths)
+
+    @property
+    def node_count(self):
+        return len(self.x)
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    def add_penalties(self, name, x, y, seconds, radius=PENALTY_RADIUS):
+        """Charge seconds to the nodes within radius of the given points"""
+        if not len(x) or not self.node_count:
+            return
+        hits = self._tree.query(
+            shapely.points(x, y), predicate="dwithin", distance=radius
+        )
+        penalty = np.zeros(self.node_count)
+        penalty[np.unique(hits[1])] = seconds
+        self.node_penalty[name] = penalty
+        self._costs.clear()
+
+    def nearest_node(self, x, y):
+        """(node, distance in metres) of the node closest to a UTM point"""
+        node = int(self._tree.nearest(shapely.Point(x, y)))
+        return node, math.hypot(self.x[node] - x, self.y[node] - y)
+
+    def edge_costs(self, speed, penalties=()):
+        """
+        Seconds to traverse every edge, including the penalty of its target
+        node, as a list shared by every caller with the same arguments
+        """
+        key = (speed, tuple(penalties))
+        costs = self._costs.get(key)
+        if costs is None:
+            costs = self.lengths / speed
+            for name in key[1]:
+                if name in self.node_penalty:
+                    costs = costs + self.node_penalty[name][self.indices]
+            costs = self._costs[key] = np.asarray(costs).tolist()
+        return costs
+
+    def shortest_path(self, source, target, costs, speed):
+        """
+        A* from source to target with a straight-line travel time heuristic.
+        Returns (nodes, edges, seconds), or None if target is unreachable.
+        """
+        x, y = self._x, self._y
+        indptr, indices = self._indptr, self._indices
+        tx, ty = x[target], y[target]
+
+        def heuristic(node):
+            return math.hypot(x[node] - tx, y[node] - ty) / speed
+
+        best = {source: 0.0}
+        came_from = {}
+        heap = [(heuristic(source), 0.0, source)]
+        while heap:
+            _, elapsed, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if elapsed > best[node]:
+                continue
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[edge]
+                candidate = elapsed + costs[edge]
+                if candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    came_from[neighbour] = (node, edge)
+                    heapq.heappush(
+                        heap, (candidate + heuristic(neighbour), candidate, neighbour)
+                    )
+        else:
+            return None
+
+        nodes, edges = [target], []
+        while nodes[-1] != source:
+            node, edge = came_from[nodes[-1]]
+            nodes.append(node)
+            edges.append(edge)
+        return nodes[::-1], edges[::-1], best[target]
+
+    def travel_times(self, source, costs):
+        """
+        Dijkstra from source. Returns the seconds to every node (inf where
+        unreachable) and the metres along those fastest paths.
+        """
+        indptr, indices, lengths = self._indptr, self._indices, self._lengths
+        best = [math.inf] * self.node_count
+        meters = [math.inf] * self.node_count
+        best[source] = meters[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            elapsed, node = heapq.heappop(heap)
+            if elapsed > best[node]:
+                continue
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[edge]
+                candidate = elapsed + costs[edge]
+                if candidate < best[neighbour]:
+                    best[neighbour] = candidate
+                    meters[neighbour] = meters[node] + lengths[edge]
+                    heapq.heappush(heap, (candidate, neighbour))
+        return np.asarray(best), np.asarray(meters)
+
+
+class LocalRoutingService:
+    """
+    Offline routing over the road LINESTRINGs shipped in data/, with the same
+    get_route interface as GoogleMapsService. Locations are "lat,lng" strings
+    or (lat, lng) pairs, since there is no geocoder; results are shaped like
+    a Directions API route (legs and overview_polyline).
+    """
+
+    def __init__(self, data_dir="data", penalties=None):
+        self.log = logging.getLogger(__name__)
+        self.data_service = DataService(data_dir=data_dir)
+        self.penalties = PENALTIES if penalties is None else penalties
+        from pyproj import Transformer
+
+        self.to_utm = Transformer.from_crs("EPSG:4326", "EPSG:32723")
+        self.to_latlon = Transformer.from_crs("EPSG:32723", "EPSG:4326")
+        self._graph = None
+        self._lock = threading.Lock()
+
+    @property
+    def graph(self):
+        """The road graph, built on first use"""
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    self._graph = self._build_graph()
+        return self._graph
+
+    def _geometries(self, dataset_name):
+        values = self.data_service.get_column(dataset_name, "GEOMETRIA") or []
+        return shapely.from_wkt(
+            [v for v in values if isinstance(v, str)], on_invalid="ignore"
+        )
+
+    def _build_graph(self):
+        geometries = np.concatenate([self._geometries(name) for name in ROAD_LAYERS])
+        graph = RoadGraph.from_geometries(geometries)
+
+        for name, seconds in self.penalties.items():
+            points = shapely.centroid(self._geometries(name))
+            points = points[~shapely.is_missing(points) & ~shapely.is_empty(points)]
+            graph.add_penalties(
+                name, shapely.get_x(points), shapely.get_y(points), seconds
+            )
+
+        self.log.info(
+            f"Built road graph with {graph.node_count} nodes and {graph.edge_count} edges"
+        )
+        return graph
+
+    def _penalties_for(self, mode):
+        return [
+            name
+            for name in self.penalties
+            if name not in VEHICLE_ONLY or mode in VEHICLE_MODES
+        ]
+
+    @staticmethod
+    def parse_location(location):
+        """(lat, lng) of a "lat,lng" string or pair; None for other addresses"""
+        try:
+            if isinstance(location, str):
+                lat, lng = (float(v) for v in location.split(","))
+            else:
+                lat, lng = (float(v) for v in location)
+        except (TypeError, ValueError):
+            return None
+        return lat, lng
+
+    def _snap(self, location):
+        coordinates = self.parse_location(location)
+        if coordinates is None or not self.graph.node_count:
+            return None
+        x, y = self.to_utm.transform(*coordinates)
+        node, distance = self.graph.nearest_node(x, y)
+        if distance > MAX_SNAP_DISTANCE:
+            return None
+        return node
+
+    def get_route(self, origins, destinations, mode, waypoints=None):
+        """
+        Shortest route through origin, waypoints (in order) and destination.
+        """
+        try:
+            mode = mode or "driving"
+            speed = MODE_SPEEDS.get(mode, MODE_SPEEDS["driving"])
+            costs = self.graph.edge_costs(speed, self._penalties_for(mode))
+            stops = [origins, *(waypoints or []), destinations]
+
+            nodes = [self._snap(stop) for stop in stops]
+            if any(node is None for node in nodes):
+                self.log.warning(
+                    f"Could not place {stops} on the road network (expected lat,lng)"
+                )
+                return None
+
+            legs, path = [], []
+            for i in range(len(stops) - 1):
+                result = self.graph.shortest_path(nodes[i], nodes[i + 1], costs, speed)
+                if result is None:
+                    self.log.warning(
+                        f"No route found between {stops[i]} and {stops[i + 1]}"
+                    )
+                    return None
+                leg_nodes, leg_edges, seconds = result
+                meters = float(self.graph.lengths[leg_edges].sum())
+                legs.append(
+                    {
+                        "start_address": str(stops[i]),
+                        "end_address": str(stops[i + 1]),
+                        "distance": {
+                            "text": f"{meters / 1000:.1f} km",
+                            "value": round(meters),
+                        },
+                        "duration": {
+                            "text": f"{max(1, round(seconds / 60))} mins",
+                            "value": round(seconds),
+                        },
+                    }
+                )
+                path.extend(leg_nodes if not path else leg_nodes[1:])
+
+            lat, lng = self.to_latlon.transform(self.graph.x[path], self.graph.y[path])
+            return {
+                "legs": legs,
+                "overview_polyline": {
+                    "points": encode_polyline(np.asarray(lat), np.asarray(lng))
+                },
+            }
+        except Exception as e:
+            self.log.error(f"Error computing local route: {str(e)}", exc_info=True)
+            return None
+
+    def plan_distance_matrix(self, origins, destinations, mode="driving"):
+        """
+        Duration/distance matrices between locations, one Dijkstra per
+        origin; same shape as DistanceMatrixPlanner.plan.
+        """
+        try:
+            mode = mode or "driving"
+            speed = MODE_SPEEDS.get(mode, MODE_SPEEDS["driving"])
+            costs = self.graph.edge_costs(speed, self._penalties_for(mode))
+            targets = [self._snap(d) for d in destinations]
+            reachable = np.array([t is not None for t in targets], dtype=bool)
+            target_nodes = np.array([t if t is not None else 0 for t in targets])
+
+            duration = np.full((len(origins), len(destinations)), np.nan)
+            distance = np.full(duration.shape, np.nan)
+            for i, origin in enumerate(origins):
+                source = self._snap(origin)
+                if source is None:
+                    continue
+                times, meters = self.graph.travel_times(source, costs)
+                found = reachable & np.isfinite(times[target_nodes])
+                duration[i] = np.where(found, times[target_nodes], np.nan)
+                distance[i] = np.where(found, meters[target_nodes], np.nan)
+
+            return {
+                "origins": [str(o) for o in origins],
+                "destinations": [str(d) for d in destinations],
+                "duration": duration,
+                "distance": distance,
+            }
+        except Exception as e:
+            self.log.error(
+                f"Error computing local distance matrix: {str(e)}", exc_info=True
+            )
+            return None
@@ -0,0 +1,306 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+# Histogram buckets for stage latencies (seconds) and payload sizes (bytes)
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS = (1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, one value per label combination"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, self.labels, key, value) for key, value in values]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label combination"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = sorted(
+                (key, (list(counts), total, count))
+                for key, (counts, total, count) in self._series.items()
+            )
+        names = self.labels + ("le",)
+        samples = []
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                samples.append(
+                    (f"{self.name}_bucket", names, key + (_number(bound),), cumulative)
+                )
+            samples.append((f"{self.name}_sum", self.labels, key, total))
+            samples.append((f"{self.name}_count", self.labels, key, count))
+        return samples
+
+
+class CallbackGauge:
+    """Gauge whose values are read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels, callback):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.callback = callback
+
+    def samples(self):
+        return [
+            (self.name, self.labels, key, value)
+            for key, value in sorted(self.callback().items())
+        ]
+
+
+class CallbackCounter(CallbackGauge):
+    """Counter whose running totals are read from a callback at scrape time"""
+
+    kind = "counter"
+
+
+class MetricsRegistry:
+    """
+    Process-local registry rendered in the Prometheus text format. Under
+    gunicorn every worker keeps its own registry, so a scrape reports the
+    worker that served it. When disabled, instrumentation is a no-op.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = {}
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, labels, callback):
+        return self._register(CallbackGauge(name, help_text, labels, callback))
+
+    def callback_counter(self, name, help_text, labels, callback):
+        return self._register(CallbackCounter(name, help_text, labels, callback))
+
+    def register_cache(self, name, cache):
+        """
+        Export the stats() (size, hits, misses) of a cache under name. cache
+        may be a callable returning the cache, or None while there is none.
+        """
+        with self._lock:
+            self._caches[name] = cache
+
+    def cache_stats(self):
+        with self._lock:
+            caches = dict(self._caches)
+        stats = {}
+        for name, cache in caches.items():
+            cache = cache() if callable(cache) else cache
+            if cache is not None:
+                stats[name] = cache.stats()
+        return stats
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, label_names, label_values, value in metric.samples():
+                lines.append(
+                    f"{name}{_label_text(label_names, label_values)} {_number(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry(
+    enabled=os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+)
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "smart_cities_stage_seconds",
+    "Time spent in each processing stage",
+    ("stage",),
+)
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "smart_cities_upstream_seconds",
+    "Latency of Google Maps API calls",
+    ("api",),
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "smart_cities_upstream_errors_total",
+    "Google Maps API calls that raised",
+    ("api",),
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "smart_cities_request_seconds",
+    "HTTP request latency",
+    ("endpoint", "status"),
+)
+RESPONSE_BYTES = REGISTRY.histogram(
+    "smart_cities_response_bytes",
+    "Size of non-streamed response bodies",
+    ("endpoint",),
+    SIZE_BUCKETS,
+)
+
+
+def _cache_samples(field):
+    return lambda: {
+        (name,): stats[field] for name, stats in REGISTRY.cache_stats().items()
+    }
+
+
+def _cache_hit_ratio():
+    ratios = {}
+    for name, stats in REGISTRY.cache_stats().items():
+        lookups = stats["hits"] + stats["misses"]
+        ratios[(name,)] = stats["hits"] / lookups if lookups else 0.0
+    return ratios
+
+
+REGISTRY.callback_counter(
+    "smart_cities_cache_hits_total", "Cache hits", ("cache",), _cache_samples("hits")
+)
+REGISTRY.callback_counter(
+    "smart_cities_cache_misses_total",
+    "Cache misses",
+    ("cache",),
+    _cache_samples("misses"),
+)
+REGISTRY.gauge(
+    "smart_cities_cache_entries", "Cached entries", ("cache",), _cache_samples("size")
+)
+REGISTRY.gauge(
+    "smart_cities_cache_hit_ratio",
+    "Hits over lookups since start",
+    ("cache",),
+    _cache_hit_ratio,
+)
+
+
+def timed(stage):
+    """Context manager recording the duration of a processing stage"""
+    if not REGISTRY.enabled:
+        return nullcontext()
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def timed_upstream(api):
+    """Context manager recording the latency (and failures) of an upstream call"""
+    if not REGISTRY.enabled:
+        return nullcontext()
+    return _upstream(api)
+
+
+@contextmanager
+def _upstream(api):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(api=api)
+        raise
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, api=api)
+
+
+def observe_response(endpoint, status, seconds, size=None):
+    """Record the latency and (when known) body size of an HTTP response"""
+    if not REGISTRY.enabled:
+        return
+    REQUEST_SECONDS.observe(seconds, endpoint=endpoint, status=status)
+    if size is not None:
+        RESPONSE_BYTES.observe(size, endpoint=endpoint)
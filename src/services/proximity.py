@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+import numpy as np
+import shapely
+from shapely import STRtree
+from src.services.layer_cache import LayerCache
+
+# Dataset pairs whose nearest-neighbour tables are precomputed at ingest
+NEAREST_TABLES = (
+    ("sinistro_transito_vitima", "sinalizacao_semaforica"),
+    ("redutor_velocidade", "rede_prioritaria_onibus"),
+    ("estacionamento_rotativo", "posto_venda_rotativo"),
+    ("estacionamento_publico_pessoa_idosa", "posto_venda_rotativo"),
+)
+
+PROXIMITY_MODES = ("nearest", "within", "count")
+MAX_DISTANCE = 10_000.0
+
+
+def parse_geometries(dataset, rows=None):
+    """
+    Shapely geometries (UTM 23S metres) of a dataset's GEOMETRIA, None where
+    a row has none. With rows, only those rows are decoded and parsed.
+    """
+    if "GEOMETRIA" not in dataset.columns:
+        values = [None] * (len(dataset) if rows is None else len(rows))
+    elif rows is None:
+        values = dataset.column("GEOMETRIA")
+    else:
+        values = dataset.columns["GEOMETRIA"].take(rows).slice(0, None)
+    return shapely.from_wkt(
+        [v if isinstance(v, str) else None for v in values], on_invalid="ignore"
+    )
+
+
+class SpatialLayer:
+    """
+    A dataset's GEOMETRIA parsed into shapely geometries in their native UTM
+    23S metres, with an STRtree over them. Rows without a geometry are None.
+    """
+
+    def __init__(self, ids, geometries):
+        self.ids = ids
+        self.geometries = geometries
+        self.tree = STRtree(geometries)
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        ids = dataset.column("_id") or list(range(len(dataset)))
+        return cls(ids, parse_geometries(dataset))
+
+    def __len__(self):
+        return len(self.geometries)
+
+
+class ProximityService:
+    """
+    Cross-layer proximity queries (nearest feature, features within a
+    distance, counts within a distance) answered from per-layer STRtrees.
+    Nearest-neighbour tables for NEAREST_TABLES are written at ingest to
+    <data_dir>/store/proximity and reused while both datasets are unchanged.
+    """
+
+    def __init__(self, data_service):
+        self.log = logging.getLogger(__name__)
+        self.data_service = data_service
+        self.table_dir = Path(data_service.data_dir) / "store" / "proximity"
+        datasets = len(data_service.get_available_datasets())
+        self._layers = LayerCache(maxsize=datasets)
+        self._tables = LayerCache(maxsize=datasets * datasets)
+
+    def layer(self, dataset_name):
+        """(version, SpatialLayer) of a dataset, or None if unavailable"""
+        opened = self.data_service.open_dataset(dataset_name)
+        if opened is None:
+            return None
+        version, dataset = opened
+        layer = self._layers.get(dataset_name, version)
+        if layer is None:
+            layer = SpatialLayer.from_dataset(dataset)
+            self._layers.put(dataset_name, version, layer)
+        return version, layer
+
+    def _layers_for(self, source, target):
+        opened_source, opened_target = self.layer(source), self.layer(target)
+        if opened_source is None or opened_target is None:
+            return None
+        return opened_source, opened_target
+
+    @staticmethod
+    def _tag(source_version, target_version):
+        return json.dumps([list(source_version), list(target_version)])
+
+    def nearest(self, source, target, max_distance=None):
+        """
+        Nearest target feature of every source feature. Returns
+        {"source_ids", "target_ids", "distance"} (distance in metres), with
+        None for source features that have no target within max_distance.
+        """
+        layers = self._layers_for(source, target)
+        if layers is None:
+            return None
+        (source_version, source_layer), (target_version, target_layer) = layers
+
+        tag = self._tag(source_version, target_version)
+        key = (source, target)
+        table = self._tables.get(key, tag)
+        if table is None:
+            table = self._read_table(source, target, tag)
+        if table is None:
+            table = self.nearest_table(source_layer, target_layer)
+        self._tables.put(key, tag, table)
+
+        rows, distance = table
+        if max_distance is not None:
+            rows = np.where(distance <= max_distance, rows, -1)
+        found = rows >= 0
+        target_ids = [target_layer.ids[i] if i >= 0 else None for i in rows.tolist()]
+        return {
+            "source_ids": source_layer.ids,
+            "target_ids": target_ids,
+            "distance": [
+                round(d, 2) if ok else None
+                for d, ok in zip(distance.tolist(), found.tolist())
+            ],
+        }
+
+    @staticmethod
+    def nearest_table(source_layer, target_layer):
+        """(target row or -1, distance or inf) for every source row"""
+        return ProximityService._nearest(source_layer.geometries, target_layer.tree)
+
+    @staticmethod
+    def _nearest(geometries, tree):
+        """(nearest row of tree or -1, distance or inf) of every geometry"""
+        rows = np.full(len(geometries), -1, dtype=np.int64)
+        distance = np.full(len(geometries), np.inf)
+        valid = np.flatnonzero(~shapely.is_missing(geometries))
+        if len(valid) and len(tree):
+            (source_index, target_index), found = tree.query_nearest(
+                geometries[valid], return_distance=True, all_matches=False
+            )
+            rows[valid[source_index]] = target_index
+            distance[valid[source_index]] = found
+        return rows, distance
+
+    def within(self, source, target, distance):
+        """
+        Every (source, target) pair of features at most distance metres apart.
+        Returns {"source_ids", "target_ids", "distance"} as parallel lists.
+        """
+        layers = self._layers_for(source, target)
+        if layers is None:
+            return None
+        (_, source_layer), (_, target_layer) = layers
+
+        source_rows, target_rows = self._pairs_within(
+            source_layer, target_layer, distance
+        )
+        gaps = shapely.distance(
+            source_layer.geometries[source_rows], target_layer.geometries[target_rows]
+        )
+        return {
+            "source_ids": [source_layer.ids[i] for i in source_rows.tolist()],
+            "target_ids": [target_layer.ids[i] for i in target_rows.tolist()],
+            "distance": np.round(gaps, 2).tolist(),
+        }
+
+    def count_within(self, source, target, distance):
+        """Number of target features within distance metres of each source feature"""
+        layers = self._layers_for(source, target)
+        if layers is None:
+            return None
+        (_, source_layer), (_, target_layer) = layers
+
+        source_rows, _ = self._pairs_within(source_layer, target_layer, distance)
+        counts = np.bincount(source_rows, minlength=len(source_layer))
+        return {"source_ids": source_layer.ids, "count": counts.tolist()}
+
+    @staticmethod
+    def _pairs_within(source_layer, target_layer, distance):
+        """Sorted (source rows, target rows) of features within distance"""
+        if not len(source_layer) or not len(target_layer):
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        source_rows, target_rows = target_layer.tree.query(
+            source_layer.geometries, predicate="dwithin", distance=distance
+        )
+        order = np.lexsort((target_rows, source_rows))
+        return source_rows[order], target_rows[order]
+
+    def write_table(self, source, target):
+        """Precompute and persist the nearest-neighbour table of a dataset pair"""
+        layers = self._layers_for(source, target)
+        if layers is None:
+            self.log.warning(f"Skipping proximity table {source} -> {target}")
+            return False
+        (source_version, source_layer), (target_version, target_layer) = layers
+
+        rows, distance = self.nearest_table(source_layer, target_layer)
+        self._save_table(source, target, rows, distance, source_version, target_version)
+        return True
+
+    def update_table(self, source, target, refreshed, previous, old_to_new, changed):
+        """
+        Bring the table of a dataset pair up to date after dataset refreshed
+        (source or target) moved on from version previous, recomputing only
+        the rows the change affects. old_to_new maps each previous row to its
+        current row (-1 for updated and deleted records) and changed lists
+        the current rows of updated and inserted records. Rebuilds the table
+        when none was written for the previous version.
+        """
+        opened_source = self.data_service.open_dataset(source)
+        opened_target = self.data_service.open_dataset(target)
+        if opened_source is None or opened_target is None:
+            self.log.warning(f"Skipping proximity table {source} -> {target}")
+            return False
+        (source_version, source_data), (target_version, target_data) = (
+            opened_source,
+            opened_target,
+        )
+
+        if refreshed == source:
+            table = self._read_table(
+                source, target, self._tag(previous, target_version)
+            )
+        else:
+            table = self._read_table(
+                source, target, self._tag(source_version, previous)
+            )
+        if table is None:
+            return self.write_table(source, target)
+        rows, distance = table
+        changed = np.asarray(changed, dtype=np.int64)
+
+        if refreshed == source:
+            # Unchanged rows keep their nearest target; changed rows look it up
+            kept = old_to_new >= 0
+            rows_now = np.full(len(source_data), -1, dtype=np.int64)
+            distance_now = np.full(len(source_data), np.inf)
+            rows_now[old_to_new[kept]] = rows[kept]
+            distance_now[old_to_new[kept]] = distance[kept]
+            if len(changed):
+                tree = self.layer(target)[1].tree
+                found = self._nearest(parse_geometries(source_data, changed), tree)
+                rows_now[changed], distance_now[changed] = found
+            rows, distance = rows_now, distance_now
+        else:
+            rows = np.where(rows >= 0, old_to_new[np.maximum(rows, 0)], -1)
+            lost = np.flatnonzero((rows < 0) & np.isfinite(distance))
+            distance[lost] = np.inf
+            if len(lost) or len(changed):
+                geometries = self.layer(source)[1].geometries
+            if len(lost):
+                # Sources whose nearest target changed or went away
+                tree = self.layer(target)[1].tree
+                rows[lost], distance[lost] = self._nearest(geometries[lost], tree)
+            if len(changed):
+                # Updated and inserted targets may be nearer than the current ones
+                tree = STRtree(parse_geometries(target_data, changed))
+                found, gap = self._nearest(geometries, tree)
+                closer = (found >= 0) & (gap < distance)
+                rows[closer] = changed[found[closer]]
+                distance[closer] = gap[closer]
+
+        self._save_table(source, target, rows, distance, source_version, target_version)
+        return True
+
+    def _save_table(
+        self, source, target, rows, distance, source_version, target_version
+    ):
+        self.table_dir.mkdir(parents=True, exist_ok=True)
+        path = self.table_dir / f"{source}__{target}.npz"
+        tmp = self.table_dir / f".{path.stem}.{uuid.uuid4().hex}.npz"
+        np.savez(
+            tmp,
+            rows=rows,
+            distance=distance,
+            tag=np.array(self._tag(source_version, target_version)),
+        )
+        os.replace(tmp, path)
+        self.log.info(f"Wrote proximity table {source} -> {target} ({len(rows)} rows)")
+
+    def _read_table(self, source, target, tag):
+        path = self.table_dir / f"{source}__{target}.npz"
+        try:
+            with np.load(path) as table:
+                if str(table["tag"]) != tag:
+                    return None
+                return table["rows"], table["distance"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            self.log.error(f"Error reading proximity table {path}: {str(e)}")
+            return None
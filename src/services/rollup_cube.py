@@ -0,0 +1,562 @@
+import json
+import logging
+import os
+import re
+import uuid
+from itertools import combinations
+from pathlib import Path
+import numpy as np
+from src.services.bitmap_index import boletim_year, normalize
+from src.services.layer_cache import LayerCache
+
+# Fields with more distinct values than this (or than half the records) are
+# not dimensions of the cube
+MAX_DIMENSION_CARDINALITY = 512
+
+# Two-dimensional cuboids are materialized when their dense size is at most
+# this many cells; wider groupings are rolled up from the base cuboid
+MAX_CUBOID_CELLS = 65536
+
+# Fields that are never dimensions or measures, besides ID_* identifiers
+EXCLUDED_FIELDS = ("_id", "GEOMETRIA")
+
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}")
+NUMBER_PATTERN = re.compile(r"^-?\d+(\.\d+)?$")
+
+# Version of the on-disk cube layout
+CUBE_FORMAT = 1
+
+
+def parse_metric(value):
+    """Parse "count" or "sum:FIELD" into ("count", None) / ("sum", FIELD)"""
+    value = (value or "count").strip()
+    if value.lower() == "count":
+        return "count", None
+    kind, sep, field = value.partition(":")
+    if kind.lower() != "sum" or not sep or not field.strip():
+        raise ValueError("metric must be count or sum:FIELD")
+    return "sum", field.strip()
+
+
+def parse_group_by(value):
+    """Parse a comma-separated list of dimensions"""
+    if value is None or not value.strip():
+        return []
+    dimensions = [name.strip() for name in value.split(",")]
+    if not all(dimensions):
+        raise ValueError("group_by must be a comma-separated list of dimensions")
+    return dimensions
+
+
+def _encode(values):
+    """(row codes, labels) of values: code 0 is missing, code i is labels[i - 1]"""
+    lookup = {}
+    labels = []
+    codes = np.zeros(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None or value == "":
+            continue
+        code = lookup.get(value)
+        if code is None:
+            labels.append(value)
+            code = lookup[value] = len(labels)
+        codes[i] = code
+    return codes, labels
+
+
+def _dimension_values(dataset, dimension):
+    """Values of a cube dimension for every record of a dataset"""
+    if dimension == "year" and "NUMERO_BOLETIM" in dataset.columns:
+        return [boletim_year(b) for b in dataset.column("NUMERO_BOLETIM")]
+    if dimension.endswith(".year") and dimension[:-5] in dataset.columns:
+        return [v[:4] if v else None for v in dataset.column(dimension[:-5])]
+    return dataset.column(dimension)
+
+
+def _measure_values(values):
+    return np.array([0.0 if v is None or v == "" else float(v) for v in values])
+
+
+def _is_date(value):
+    return isinstance(value, str) and DATE_PATTERN.match(value)
+
+
+def _is_structured(value):
+    """Lists and objects (from JSON columns) are neither dimensions nor measures"""
+    return isinstance(value, (list, dict))
+
+
+def _is_number(value):
+    return NUMBER_PATTERN.match(str(value).strip())
+
+
+def _label_ranks(labels):
+    """Rank of every code (0 is missing, ranked last) in the order of its label"""
+    order = sorted(
+        range(len(labels)), key=lambda j: (str(labels[j]), type(labels[j]).__name__)
+    )
+    ranks = np.empty(len(labels) + 1, dtype=np.int64)
+    ranks[0] = len(labels)
+    ranks[np.array(order, dtype=np.int64) + 1] = np.arange(len(labels))
+    return ranks
+
+
+def _group(codes, shape, counts, sums):
+    """
+    Roll cells up by their code rows. shape is the number of codes of each
+    column. Returns (distinct code rows, counts, sums) in code order.
+    """
+    if not codes.shape[1]:
+        # A single cell holding the grand totals
+        inverse = np.zeros(len(codes), dtype=np.int64)
+        keys = np.zeros((min(len(codes), 1), 0), dtype=np.int32)
+    elif np.prod([float(s) for s in shape]) < 2**62:
+        flat = np.ravel_multi_index(codes.T, shape)
+        unique, inverse = np.unique(flat, return_inverse=True)
+        keys = np.stack(np.unravel_index(unique, shape), axis=1).astype(np.int32)
+    else:
+        keys, inverse = np.unique(codes, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    grouped_counts = np.bincount(inverse, weights=counts, minlength=len(keys))
+    grouped_sums = {
+        name: np.bincount(inverse, weights=column, minlength=len(keys))
+        for name, column in sums.items()
+    }
+    return keys, grouped_counts.astype(np.int64), grouped_sums
+
+
+class RollupCube:
+    """
+    Materialized data cube of a dataset: record counts and measure sums
+    grouped by every categorical dimension (the base cuboid), plus the grand
+    total and every one- and two-dimensional cuboid that fits MAX_CUBOID_CELLS.
+    Queries slice the smallest cuboid covering their dimensions, so their cost
+    depends on the number of distinct value combinations, not on the number
+    of records.
+
+    Dimensions are low-cardinality fields, the year of every date field
+    ("<FIELD>.year") and "year": the NUMERO_BOLETIM year, or an alias of the
+    first date field's year. Measures are the numeric fields.
+    """
+
+    def __init__(
+        self, dimensions, labels, measures, cells, counts, sums, cuboids, aliases=None
+    ):
+        self.dimensions = dimensions
+        self.aliases = aliases or {}
+        self.labels = labels
+        self.measures = measures
+        self.cells = cells
+        self.counts = counts
+        self.sums = sums
+        # {dimension indices: (code rows, counts, sums)}
+        self.cuboids = cuboids
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        """Build the cube of a ColumnarDataset"""
+        names = [
+            n
+            for n in dataset.field_names
+            if n not in EXCLUDED_FIELDS and not n.startswith("ID_")
+        ]
+        length = len(dataset)
+        dimensions, labels, codes, measures, sums = [], [], [], [], {}
+        aliases = {}
+
+        def add_dimension(name, values):
+            column_codes, column_labels = _encode(values)
+            dimensions.append(name)
+            labels.append(column_labels)
+            codes.append(column_codes)
+
+        if "NUMERO_BOLETIM" in names:
+            add_dimension("year", _dimension_values(dataset, "year"))
+        for name in names:
+            values = dataset.column(name)
+            present = [v for v in values if v is not None and v != ""]
+            if not present or any(_is_structured(v) for v in present):
+                continue
+            if all(_is_date(v) for v in present):
+                add_dimension(
+                    f"{name}.year", _dimension_values(dataset, f"{name}.year")
+                )
+                aliases.setdefault("year", f"{name}.year")
+                continue
+            if all(_is_number(v) for v in present):
+                measures.append(name)
+                sums[name] = _measure_values(values)
+            distinct = len(set(present))
+            if distinct <= min(MAX_DIMENSION_CARDINALITY, max(length // 2, 1)):
+                add_dimension(name, values)
+        if "year" in dimensions:
+            aliases.pop("year", None)
+
+        codes = np.stack(codes, axis=1) if codes else np.zeros((length, 0), np.int32)
+        shape = [len(column_labels) + 1 for column_labels in labels]
+        counts = np.ones(length, dtype=np.int64)
+        cells, counts, sums = _group(codes, shape, counts, sums)
+        cuboids = cls._materialize(cells, shape, counts, sums)
+        return cls(dimensions, labels, measures, cells, counts, sums, cuboids, aliases)
+
+    @staticmethod
+    def _materialize(cells, shape, counts, sums):
+        """The zero-, one- and two-dimensional cuboids that fit MAX_CUBOID_CELLS"""
+        cuboids = {}
+        for size in (0, 1, 2):
+            for group in combinations(range(len(shape)), size):
+                if np.prod([shape[i] for i in group]) > MAX_CUBOID_CELLS:
+                    continue
+                cuboids[group] = _group(
+                    cells[:, group], [shape[i] for i in group], counts, sums
+                )
+        return cuboids
+
+    def apply(self, removed, added, length):
+        """
+        The cube after dropping the records of dataset removed (as they were
+        when the cube was built) and adding those of dataset added, leaving
+        length records. It is rolled up from the base cuboid, so its cost
+        depends on the changed records and the number of cells. Returns None
+        when the change may turn a dimension or measure into something else;
+        the cube must then be rebuilt with from_dataset. Dimensions are not
+        re-detected: fields only become dimensions on rebuilds.
+        """
+        labels = [list(column_labels) for column_labels in self.labels]
+        lookups = [
+            {label: code for code, label in enumerate(column_labels, start=1)}
+            for column_labels in labels
+        ]
+        codes, counts = [self.cells], [self.counts]
+        sums = {measure: [self.sums[measure]] for measure in self.measures}
+        for dataset, sign in ((removed, -1), (added, 1)):
+            if not len(dataset):
+                continue
+            if sign > 0 and not self._still_typed(dataset):
+                return None
+            rows = np.zeros((len(dataset), len(self.dimensions)), dtype=np.int32)
+            for i, dimension in enumerate(self.dimensions):
+                for r, value in enumerate(_dimension_values(dataset, dimension)):
+                    if value is None or value == "":
+                        continue
+                    code = lookups[i].get(value)
+                    if code is None:
+                        labels[i].append(value)
+                        code = lookups[i][value] = len(labels[i])
+                    rows[r, i] = code
+            codes.append(rows)
+            counts.append(np.full(len(dataset), sign, dtype=np.int64))
+            for measure in self.measures:
+                sums[measure].append(sign * _measure_values(dataset.column(measure)))
+
+        shape = [len(column_labels) + 1 for column_labels in labels]
+        cells, counts, sums = _group(
+            np.concatenate(codes),
+            shape,
+            np.concatenate(counts),
+            {measure: np.concatenate(values) for measure, values in sums.items()},
+        )
+        present = counts > 0
+        cells, counts = cells[present], counts[present]
+        sums = {measure: values[present] for measure, values in sums.items()}
+
+        limit = min(MAX_DIMENSION_CARDINALITY, max(length // 2, 1))
+        for i, dimension in enumerate(self.dimensions):
+            if dimension == "year" or dimension.endswith(".year"):
+                continue
+            used = np.count_nonzero(np.unique(cells[:, i]))
+            if not used or used > limit:
+                return None
+
+        cuboids = self._materialize(cells, shape, counts, sums)
+        return RollupCube(
+            self.dimensions,
+            labels,
+            self.measures,
+            cells,
+            counts,
+            sums,
+            cuboids,
+            self.aliases,
+        )
+
+    def _still_typed(self, dataset):
+        """
+        Whether new records keep the date fields dates, the measures numbers
+        and the other dimensions free of structured values
+        """
+        for dimension in self.dimensions:
+            field = dimension[:-5]
+            if dimension.endswith(".year") and field in dataset.columns:
+                values = dataset.column(field)
+                if not all(_is_date(v) for v in values if v is not None and v != ""):
+                    return False
+            elif dimension in dataset.columns:
+                if any(_is_structured(v) for v in dataset.column(dimension)):
+                    return False
+        for measure in self.measures:
+            values = dataset.column(measure)
+            if not all(_is_number(v) for v in values if v is not None and v != ""):
+                return False
+        return True
+
+    def dimension(self, name):
+        """Index of a dimension (matched case-insensitively)"""
+        name = self.aliases.get(name.lower(), name)
+        for i, dimension in enumerate(self.dimensions):
+            if dimension.lower() == name.lower():
+                return i
+        raise ValueError(
+            f"Unknown dimension {name}; available: {', '.join(self.dimensions)}"
+        )
+
+    def measure(self, name):
+        """Name of a measure (matched case-insensitively)"""
+        for measure in self.measures:
+            if measure.lower() == name.lower():
+                return measure
+        raise ValueError(
+            f"Unknown measure {name}; available: {', '.join(self.measures)}"
+        )
+
+    def _cuboid(self, group):
+        """
+        (dimensions, code rows, counts, sums) of the smallest cuboid covering a
+        set of dimension indices: a materialized one, else the base cuboid
+        """
+        materialized = tuple(sorted(group))
+        if materialized in self.cuboids:
+            codes, counts, sums = self.cuboids[materialized]
+            return materialized, codes, counts, sums
+        return tuple(range(len(self.dimensions))), self.cells, self.counts, self.sums
+
+    def _matching(self, dimensions, codes, filters):
+        """Mask of the cuboid cells matching filter groups (see parse_filter)"""
+        mask = np.zeros(len(codes), dtype=bool)
+        for group in filters:
+            matched = np.ones(len(codes), dtype=bool)
+            for field, values in group:
+                i = self.dimension(field)
+                wanted = {normalize(v) for v in values}
+                accepted = [
+                    code
+                    for code, label in enumerate(self.labels[i], start=1)
+                    if normalize(label) in wanted
+                ]
+                matched &= np.isin(codes[:, dimensions.index(i)], accepted)
+            mask |= matched
+        return mask
+
+    def query(self, group_by=(), metric="count", field=None, filters=None):
+        """
+        Aggregate the cube. group_by lists dimension names, metric is "count"
+        or "sum" (of measure field), filters a parsed filter expression over
+        dimensions. Returns [{name: value, ..., "value": aggregate}], keyed
+        by the names as given in group_by, sorted by descending value and
+        then by label, so the order does not depend on how the cube was
+        built. Raises ValueError for unknown names.
+        """
+        group = [self.dimension(name) for name in group_by]
+        if len(set(group)) != len(group):
+            raise ValueError("group_by lists a dimension twice")
+        if metric == "sum":
+            field = self.measure(field)
+        filtered = (
+            []
+            if filters is None
+            else [self.dimension(f) for clauses in filters for f, _ in clauses]
+        )
+
+        dimensions, codes, counts, sums = self._cuboid(set(group) | set(filtered))
+        values = counts if metric == "count" else sums[field]
+        if filters is not None:
+            mask = self._matching(dimensions, codes, filters)
+            codes, values = codes[mask], values[mask]
+        columns = [dimensions.index(i) for i in group]
+        if filters is None and len(columns) == len(dimensions):
+            # The cuboid is already grouped by exactly these dimensions
+            keys, totals = codes[:, columns], values
+        else:
+            keys, _, grouped = _group(
+                codes[:, columns],
+                [len(self.labels[i]) + 1 for i in group],
+                np.zeros(len(codes)),
+                {"value": values},
+            )
+            totals = grouped["value"]
+        if np.all(np.mod(totals, 1) == 0):
+            totals = totals.astype(np.int64)
+
+        ranks = [_label_ranks(self.labels[i])[keys[:, k]] for k, i in enumerate(group)]
+        order = np.lexsort([*reversed(ranks), -totals])
+        columns = {
+            name: np.array([None] + self.labels[i], dtype=object)[keys[order, k]]
+            for k, (name, i) in enumerate(zip(group_by, group))
+        }
+        columns["value"] = totals[order]
+        names = list(columns)
+        return [
+            dict(zip(names, row))
+            for row in zip(*(column.tolist() for column in columns.values()))
+        ]
+
+    def to_arrays(self):
+        """The cube as a dict of arrays, for np.savez"""
+        meta = {
+            "format": CUBE_FORMAT,
+            "dimensions": self.dimensions,
+            "labels": self.labels,
+            "measures": self.measures,
+            "aliases": self.aliases,
+            "cuboids": [list(group) for group in self.cuboids],
+        }
+        arrays = {
+            "meta": np.array(json.dumps(meta)),
+            "cells": self.cells,
+            "counts": self.counts,
+        }
+        for m, measure in enumerate(self.measures):
+            arrays[f"sum{m}"] = self.sums[measure]
+        for c, (codes, counts, sums) in enumerate(self.cuboids.values()):
+            arrays[f"cuboid{c}.codes"] = codes
+            arrays[f"cuboid{c}.counts"] = counts
+            for m, measure in enumerate(self.measures):
+                arrays[f"cuboid{c}.sum{m}"] = sums[measure]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Inverse of to_arrays; raises ValueError for another layout version"""
+        meta = json.loads(str(arrays["meta"]))
+        if meta.get("format") != CUBE_FORMAT:
+            raise ValueError(f"Unsupported cube format {meta.get('format')}")
+        measures = meta["measures"]
+        sums = {measure: arrays[f"sum{m}"] for m, measure in enumerate(measures)}
+        cuboids = {}
+        for c, group in enumerate(meta["cuboids"]):
+            cuboids[tuple(group)] = (
+                arrays[f"cuboid{c}.codes"],
+                arrays[f"cuboid{c}.counts"],
+                {
+                    measure: arrays[f"cuboid{c}.sum{m}"]
+                    for m, measure in enumerate(measures)
+                },
+            )
+        return cls(
+            meta["dimensions"],
+            meta["labels"],
+            measures,
+            arrays["cells"],
+            arrays["counts"],
+            sums,
+            cuboids,
+            meta.get("aliases"),
+        )
+
+
+class CubeService:
+    """
+    Answers ad-hoc analytics queries from per-dataset RollupCubes. Cubes are
+    written at ingest to <data_dir>/store/cubes and reused while the dataset
+    is unchanged; otherwise they are built on first query, once per version.
+    """
+
+    def __init__(self, data_service):
+        self.log = logging.getLogger(__name__)
+        self.data_service = data_service
+        self.cube_dir = Path(data_service.data_dir) / "store" / "cubes"
+        self.cache = LayerCache(maxsize=len(data_service.get_available_datasets()))
+
+    @staticmethod
+    def _tag(version):
+        return json.dumps(list(version))
+
+    def cube(self, dataset_name):
+        """RollupCube of a dataset, or None if the dataset is unavailable"""
+        opened = self.data_service.open_dataset(dataset_name)
+        if opened is None:
+            return None
+        version, dataset = opened
+        tag = self._tag(version)
+        cube = self.cache.get(dataset_name, tag)
+        if cube is None:
+            cube = self._read_cube(dataset_name, tag)
+        if cube is None:
+            cube = RollupCube.from_dataset(dataset)
+        self.cache.put(dataset_name, tag, cube)
+        return cube
+
+    def query(self, dataset_name, group_by=(), metric="count", filters=None):
+        """
+        Answer a query (see RollupCube.query) with metric "count" or
+        "sum:FIELD". Returns None for unknown datasets; raises ValueError for
+        malformed queries.
+        """
+        kind, field = parse_metric(metric)
+        cube = self.cube(dataset_name)
+        if cube is None:
+            return None
+        return {
+            "dataset": dataset_name,
+            "group_by": list(group_by),
+            "metric": metric,
+            "rows": cube.query(group_by, kind, field, filters),
+            "dimensions": cube.dimensions,
+            "measures": cube.measures,
+        }
+
+    def write_cube(self, dataset_name):
+        """Build and persist the cube of a dataset's current version"""
+        opened = self.data_service.open_dataset(dataset_name)
+        if opened is None:
+            self.log.warning(f"Skipping cube of {dataset_name}")
+            return False
+        version, dataset = opened
+
+        self._save_cube(dataset_name, version, RollupCube.from_dataset(dataset))
+        return True
+
+    def update_cube(self, dataset_name, previous, removed, added):
+        """
+        Bring the cube of a dataset up to date after it moved on from version
+        previous, from the records it lost and gained (see RollupCube.apply).
+        Rebuilds the cube when none was written for the previous version or
+        the change needs a rebuild.
+        """
+        opened = self.data_service.open_dataset(dataset_name)
+        if opened is None:
+            self.log.warning(f"Skipping cube of {dataset_name}")
+            return False
+        version, dataset = opened
+
+        cube = self._read_cube(dataset_name, self._tag(previous))
+        if cube is not None:
+            cube = cube.apply(removed, added, len(dataset))
+        if cube is None:
+            return self.write_cube(dataset_name)
+        self._save_cube(dataset_name, version, cube)
+        return True
+
+    def _save_cube(self, dataset_name, version, cube):
+        self.cube_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cube_dir / f"{dataset_name}.npz"
+        tmp = self.cube_dir / f".{dataset_name}.{uuid.uuid4().hex}.npz"
+        np.savez(tmp, tag=np.array(self._tag(version)), **cube.to_arrays())
+        os.replace(tmp, path)
+        self.log.info(
+            f"Wrote cube of {dataset_name} ({len(cube.dimensions)} dimensions, "
+            f"{len(cube.cells)} cells, {len(cube.cuboids)} cuboids)"
+        )
+
+    def _read_cube(self, dataset_name, tag):
+        path = self.cube_dir / f"{dataset_name}.npz"
+        try:
+            with np.load(path) as arrays:
+                if str(arrays["tag"]) != tag:
+                    return None
+                return RollupCube.from_arrays({k: arrays[k] for k in arrays.files})
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            self.log.error(f"Error reading cube {path}: {str(e)}")
+            return None
@@ -0,0 +1,184 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """An upstream call in progress that identical requests can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RouteCache:
+    """
+    TTL + LRU cache of Directions API results keyed on the normalized
+    (origin, destination, waypoints, mode), with optional SQLite persistence.
+
+    get_or_compute coalesces concurrent identical requests: the first caller
+    makes the upstream call and the others wait for its result (single-flight).
+    """
+
+    def __init__(self, maxsize=256, ttl=600, db_path=None, clock=time.time):
+        self.log = logging.getLogger(__name__)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS routes "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def normalize(address):
+        """Case- and whitespace-insensitive form of an address or mode"""
+        return " ".join(str(address).split()).casefold()
+
+    @classmethod
+    def make_key(cls, origin, destination, mode, waypoints=None):
+        """Cache key for a route request, insensitive to case and spacing"""
+        return json.dumps(
+            [
+                cls.normalize(origin),
+                cls.normalize(destination),
+                [cls.normalize(w) for w in waypoints or []],
+                cls.normalize(mode or ""),
+            ],
+            ensure_ascii=False,
+        )
+
+    def get(self, key):
+        """Return a fresh cached value, or None (memory first, then SQLite)"""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+
+        stored = self._db_get(key, now)
+        if stored is not None:
+            expires_at, value = stored
+            self._remember(key, value, expires_at)
+            return value
+        return None
+
+    def put(self, key, value):
+        expires_at = self.clock() + self.ttl
+        self._remember(key, value, expires_at)
+        self._db_put(key, value, expires_at)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for key or compute it once, sharing the
+        result with concurrent callers of the same key. None results are
+        shared but not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+            if flight.result is not None:
+                self.put(key, flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM routes")
+                self._db.commit()
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _db_get(self, key, now):
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM routes WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            self.log.error(f"Route cache read failed: {str(e)}")
+            return None
+        if row is None or row[1] <= now:
+            return None
+        return row[1], json.loads(row[0])
+
+    def _db_put(self, key, value, expires_at):
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO routes (key, value, expires_at) "
+                    "VALUES (?, ?, ?)",
+                    (key, json.dumps(value, default=str), expires_at),
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            self.log.error(f"Route cache write failed: {str(e)}")
@@ -0,0 +1,137 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from src.models.trecho import CompleteRoute, RouteSegment
+from src.services.tour_optimizer import solve_tour
+from src.services.wire_format import join_polylines
+
+# Travel modes of the Directions API
+TRAVEL_MODES = ("driving", "walking", "bicycling", "transit")
+
+# Stops (origin + waypoints + destination) one Directions request may carry
+MAX_STOPS = {"transit": 2}
+DEFAULT_MAX_STOPS = 27
+
+
+def split_itinerary(addresses, mode):
+    """
+    Split an itinerary into consecutive sub-itineraries the Directions API
+    accepts for mode. Consecutive parts share their joint address; transit
+    takes no waypoints, so every stop-to-stop hop becomes its own request.
+    """
+    max_stops = MAX_STOPS.get(mode, DEFAULT_MAX_STOPS)
+    parts = []
+    start = 0
+    while start < len(addresses) - 1:
+        stop = min(start + max_stops, len(addresses))
+        parts.append(addresses[start:stop])
+        start = stop - 1
+    return parts
+
+
+class RoutePlanner:
+    """
+    Fans route requests out over a bounded thread pool: long itineraries are
+    split into legs fetched concurrently, and several modes can be planned
+    in parallel, so latency is close to the slowest upstream call rather
+    than their sum.
+    """
+
+    def __init__(self, maps_service, max_workers=8):
+        self.log = logging.getLogger(__name__)
+        self.maps_service = maps_service
+        self.pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="route-planner"
+        )
+
+    def plan(self, addresses, mode):
+        """Plan one itinerary; returns {"route", "polyline"} or None"""
+        return self.compare(addresses, [mode])[mode]
+
+    def compare(self, addresses, modes):
+        """
+        Plan the same itinerary for every mode with all upstream requests in
+        flight at once. Returns {mode: {"route", "polyline"} or None}.
+        """
+        plans = {mode: split_itinerary(addresses, mode) for mode in modes}
+        requests = [(part, mode) for mode in modes for part in plans[mode]]
+        self.log.debug(
+            f"Planning {len(addresses)} stops for modes {modes} "
+            f"with {len(requests)} upstream requests"
+        )
+        routes = iter(self.pool.map(lambda r: self._fetch(*r), requests))
+
+        results = {}
+        for mode in modes:
+            legs = [next(routes) for _ in plans[mode]]
+            results[mode] = self._assemble(legs, mode)
+        return results
+
+    def plan_tour(self, addresses, mode, return_to_start=True):
+        """
+        Visit every address, starting from the first, in the order solve_tour
+        finds over the backend's (cached, batched) travel-time matrix. Legs
+        are taken from the matrix rather than fetched one by one. Returns
+        {"order", "route"}, or None if some leg of the tour is unreachable.
+        """
+        matrix = self.maps_service.plan_distance_matrix(addresses, addresses, mode)
+        if matrix is None:
+            return None
+
+        duration, distance = matrix["duration"], matrix["distance"]
+        order = solve_tour(duration, 0, return_to_start)
+        legs = list(zip(order[:-1], order[1:]))
+        unreachable = [
+            (i, j)
+            for i, j in legs
+            if not (np.isfinite(duration[i, j]) and np.isfinite(distance[i, j]))
+        ]
+        if unreachable:
+            self.log.warning(
+                f"Tour of {len(addresses)} stops has {len(unreachable)} unreachable legs"
+            )
+            return None
+
+        segments = [
+            RouteSegment.from_values(
+                addresses[i], addresses[j], distance[i, j], duration[i, j], mode
+            )
+            for i, j in legs
+        ]
+        return {"order": order, "route": CompleteRoute(segments).get_summary()}
+
+    def _fetch(self, part, mode):
+        """Route of one part, or None if the backend fails, so that a failed
+        leg only voids its own mode"""
+        waypoints = part[1:-1] or None
+        try:
+            return self.maps_service.get_route(part[0], part[-1], mode, waypoints)
+        except Exception as e:
+            self.log.error(f"Error routing {mode} leg: {str(e)}", exc_info=True)
+            return None
+
+    def _assemble(self, routes, mode):
+        """Join the routes of consecutive parts into one CompleteRoute"""
+        if not routes or any(route is None for route in routes):
+            return None
+
+        segments = []
+        for route in routes:
+            for leg in route["legs"]:
+                segments.append(
+                    RouteSegment(
+                        start_address=leg["start_address"],
+                        end_address=leg["end_address"],
+                        distance=leg["distance"],
+                        duration=leg["duration"],
+                        mode=mode,
+                    )
+                )
+
+        polylines = [route["overview_polyline"]["points"] for route in routes]
+        return {
+            "route": CompleteRoute(segments).get_summary(),
+            "polyline": (
+                polylines[0] if len(polylines) == 1 else join_polylines(polylines)
+            ),
+        }
@@ -0,0 +1,74 @@
+import math
+import numpy as np
+import shapely
+from shapely import STRtree
+
+# Ground resolution of a Web Mercator tile pixel at zoom 0, in metres
+METERS_PER_PIXEL_Z0 = 156_543.03
+
+
+def parse_bbox(value):
+    """
+    Parse "minLat,minLng,maxLat,maxLng" into a tuple of floats.
+    Raises ValueError for malformed or inverted boxes.
+    """
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(v) for v in value.split(","))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be minLat,minLng,maxLat,maxLng")
+
+    if not all(math.isfinite(v) for v in (min_lat, min_lng, max_lat, max_lng)):
+        raise ValueError("bbox coordinates must be finite numbers")
+    if min_lat > max_lat or min_lng > max_lng:
+        raise ValueError("bbox minimums must not exceed maximums")
+    return (min_lat, min_lng, max_lat, max_lng)
+
+
+def cell_size_for_zoom(zoom, latitude, pixels=4):
+    """Size in metres of `pixels` screen pixels at a Web Mercator zoom level"""
+    return METERS_PER_PIXEL_Z0 * math.cos(math.radians(latitude)) / 2**zoom * pixels
+
+
+def feature_bounds(lat, lng, offsets):
+    """
+    Per-feature bounding boxes of vertices grouped by offsets. Returns the
+    indices of features that have vertices and their (min_lat, min_lng,
+    max_lat, max_lng) arrays.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    features = np.flatnonzero(offsets[1:] > offsets[:-1])
+    if not len(features):
+        empty = np.empty(0)
+        return features, empty, empty, empty, empty
+
+    starts = offsets[features]
+    return (
+        features,
+        np.minimum.reduceat(lat, starts),
+        np.minimum.reduceat(lng, starts),
+        np.maximum.reduceat(lat, starts),
+        np.maximum.reduceat(lng, starts),
+    )
+
+
+class FeatureIndex:
+    """
+    STRtree over the bounding boxes of a layer's features (records), built
+    once from its reprojected vertices.
+    """
+
+    def __init__(self, lat, lng, offsets):
+        features, min_lat, min_lng, max_lat, max_lng = feature_bounds(lat, lng, offsets)
+        self.features = features
+        self.tree = STRtree(shapely.box(min_lng, min_lat, max_lng, max_lat))
+
+    def __len__(self):
+        return len(self.features)
+
+    def query(self, bbox):
+        """Sorted indices of the features whose bounds intersect bbox"""
+        min_lat, min_lng, max_lat, max_lng = bbox
+        hits = self.tree.query(shapely.box(min_lng, min_lat, max_lng, max_lat))
+        return np.sort(self.features[hits])
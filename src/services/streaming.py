@@ -0,0 +1,54 @@
+import json
+
+# Streaming response modes: newline-delimited JSON or one JSON array
+STREAM_MODES = ("ndjson", "array")
+
+STREAM_MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "array": "application/json",
+}
+
+_TRUTHY = ("1", "true", "yes")
+
+
+def parse_stream(value):
+    """
+    Map a stream= query value to a mode: "1"/"true"/"ndjson" stream NDJSON,
+    "array" streams a JSON array, and empty/"0"/"false" disable streaming.
+    Raises ValueError for anything else.
+    """
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if value in ("", "0", "false", "no"):
+        return None
+    if value in _TRUTHY:
+        return "ndjson"
+    if value in STREAM_MODES:
+        return value
+    raise ValueError(f"stream must be 1 or one of: {', '.join(STREAM_MODES)}")
+
+
+def _dumps(item):
+    return json.dumps(item, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_stream(batches, mode="ndjson"):
+    """
+    Serialize an iterable of item batches lazily, one chunk per batch, as
+    NDJSON lines or the elements of a single JSON array. An error raised by
+    batches propagates before the array is closed, so a failed stream never
+    reads as a complete document.
+    """
+    if mode == "ndjson":
+        for batch in batches:
+            if batch:
+                yield "".join(_dumps(item) + "\n" for item in batch)
+        return
+
+    separator = "["
+    for batch in batches:
+        if batch:
+            yield separator + ",".join(_dumps(item) for item in batch)
+            separator = ","
+    yield "[]" if separator == "[" else "]"
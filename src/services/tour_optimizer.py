@@ -0,0 +1,152 @@
+import numpy as np
+
+# Smallest improvement (in cost units) a move must bring to be applied
+EPSILON = 1e-9
+# Segment lengths tried by Or-opt
+OR_OPT_LENGTHS = (1, 2, 3)
+
+
+def nearest_neighbour(cost, start=0, end=None):
+    """
+    Greedy path from start that always moves to the cheapest unvisited stop,
+    finishing at end if given.
+    """
+    n = len(cost)
+    visited = np.zeros(n, dtype=bool)
+    visited[start] = True
+    if end is not None:
+        visited[end] = True
+
+    order = [start]
+    for _ in range(n - visited.sum()):
+        row = np.where(visited, np.inf, cost[order[-1]])
+        nxt = int(np.argmin(row))
+        visited[nxt] = True
+        order.append(nxt)
+    if end is not None:
+        order.append(end)
+    return np.asarray(order, dtype=np.int64)
+
+
+def path_cost(cost, order):
+    return float(cost[order[:-1], order[1:]].sum())
+
+
+def two_opt(cost, order, max_moves=None):
+    """
+    Improve a path with fixed endpoints by reversing sub-paths. Every step
+    evaluates all O(n^2) reversals at once and applies the best one.
+    cost must be symmetric.
+    """
+    order = order.copy()
+    m = len(order)
+    if m < 4:
+        return order
+
+    upper = np.triu(np.ones((m - 1, m - 1), dtype=bool), k=2)
+    moves = 0
+    while max_moves is None or moves < max_moves:
+        a, b = order[:-1], order[1:]
+        edge = cost[a, b]
+        gain = (
+            edge[:, None]
+            + edge[None, :]
+            - cost[a[:, None], a[None, :]]
+            - cost[b[:, None], b[None, :]]
+        )
+        gain = np.where(upper, gain, -np.inf)
+        i, j = np.unravel_index(int(np.argmax(gain)), gain.shape)
+        if gain[i, j] <= EPSILON:
+            break
+        reversed_part = slice(i + 1, j + 1)
+        order[reversed_part] = order[reversed_part][::-1]
+        moves += 1
+    return order
+
+
+def or_opt(cost, order):
+    """
+    Improve a path with fixed endpoints by moving runs of 1-3 stops (kept
+    or reversed) to the cheapest other position, until no move helps.
+    """
+    order = order.copy()
+    improved = True
+    while improved:
+        improved = False
+        for length in OR_OPT_LENGTHS:
+            i = 1
+            while i + length < len(order):
+                moved = _best_segment_move(cost, order, i, length)
+                if moved is not None:
+                    order = moved
+                    improved = True
+                else:
+                    i += 1
+    return order
+
+
+def _best_segment_move(cost, order, i, length):
+    """Path with order[i:i + length] reinserted at its best position, or None"""
+    end = i + length
+    segment = order[i:end]
+    prev, nxt = order[i - 1], order[end]
+    removal = cost[prev, segment[0]] + cost[segment[-1], nxt] - cost[prev, nxt]
+
+    rest = np.concatenate([order[:i], order[end:]])
+    a, b = rest[:-1], rest[1:]
+    forward = cost[a, segment[0]] + cost[segment[-1], b] - cost[a, b]
+    backward = cost[a, segment[-1]] + cost[segment[0], b] - cost[a, b]
+    insertion = np.minimum(forward, backward)
+    # Putting it back where it was is not a move
+    insertion[i - 1] = np.inf
+
+    k = int(np.argmin(insertion))
+    if removal - insertion[k] <= EPSILON:
+        return None
+    if backward[k] < forward[k]:
+        segment = segment[::-1]
+    return np.insert(rest, k + 1, segment)
+
+
+def solve_tour(cost, start=0, return_to_start=True):
+    """
+    Order the stops of an n x n cost matrix: nearest neighbour followed by
+    2-opt and Or-opt on the symmetrized costs. The result starts at start
+    and, with return_to_start, ends there again. Missing (NaN/inf) costs
+    are treated as very expensive.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    n = len(cost)
+    if n < 2:
+        return list(range(n))
+
+    finite = np.isfinite(cost)
+    big = (cost[finite].max() if finite.any() else 1.0) * n + 1
+    cost = np.where(finite, cost, big)
+    symmetric = (cost + cost.T) / 2
+
+    # Search over paths that end at an extra, fixed node n
+    end = n
+    if return_to_start:
+        # n duplicates the start
+        augmented = np.empty((n + 1, n + 1))
+        augmented[:n, :n] = symmetric
+        augmented[n, :n] = symmetric[start]
+        augmented[:n, n] = symmetric[:, start]
+        augmented[n, n] = 0.0
+    else:
+        # n is a dummy reachable from every stop at no cost, freeing the end
+        augmented = np.zeros((n + 1, n + 1))
+        augmented[:n, :n] = symmetric
+
+    order = nearest_neighbour(augmented, start, end)
+    previous = np.inf
+    while True:
+        order = or_opt(augmented, two_opt(augmented, order))
+        current = path_cost(augmented, order)
+        if current >= previous - EPSILON:
+            break
+        previous = current
+
+    order = order[:-1].tolist()
+    return order + [start] if return_to_start else order
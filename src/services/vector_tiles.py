@@ -0,0 +1,480 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import struct
+import threading
+import uuid
+from pathlib import Path
+import numpy as np
+import shapely
+from shapely import STRtree
+from src.services.columnar_store import gather_vertices
+from src.services.heatmap_service import FILE_MAPPING
+from src.services.layer_cache import LayerCache
+
+MVT_MIMETYPE = "application/vnd.mapbox-vector-tile"
+
+# Tile coordinate space and the margin (in tile units) kept around each tile
+# so lines crossing tile edges join up when rendered
+EXTENT = 4096
+BUFFER = 64
+MAX_ZOOM = 22
+
+# Lines are simplified (Douglas-Peucker) to this fraction of a tile's width,
+# about one screen pixel of a 256 px tile, below SIMPLIFY_MAX_ZOOM
+SIMPLIFY_TOLERANCE = 1 / 256
+SIMPLIFY_MAX_ZOOM = 17
+
+# Zoom levels written to the on-disk pyramid by default
+PYRAMID_MAX_ZOOM = 14
+
+EARTH_RADIUS = 6_378_137.0
+WORLD_SIZE = 2 * math.pi * EARTH_RADIUS
+
+ACCIDENT_FILE = FILE_MAPPING["traffic-accident-with-victims"]
+
+# MVT geometry types and commands
+POINT, LINESTRING = 1, 2
+MOVE_TO, LINE_TO = 1, 2
+
+
+def to_web_mercator(lat, lng):
+    """EPSG:4326 degrees to EPSG:3857 metres"""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.05112878, 85.05112878)
+    x = np.radians(np.asarray(lng, dtype=np.float64)) * EARTH_RADIUS
+    y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * EARTH_RADIUS
+    return x, y
+
+
+def tile_bounds(z, x, y):
+    """(min_x, min_y, max_x, max_y) of an XYZ tile in Web Mercator metres"""
+    size = WORLD_SIZE / 2**z
+    min_x = -WORLD_SIZE / 2 + x * size
+    max_y = WORLD_SIZE / 2 - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+def tile_range(min_x, min_y, max_x, max_y, z):
+    """Inclusive (x0, y0, x1, y1) tile indices covering a Web Mercator box"""
+    n = 2**z
+    size = WORLD_SIZE / n
+
+    def column(v):
+        return min(max(int((v + WORLD_SIZE / 2) // size), 0), n - 1)
+
+    def row(v):
+        return min(max(int((WORLD_SIZE / 2 - v) // size), 0), n - 1)
+
+    return column(min_x), row(max_y), column(max_x), row(min_y)
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number, wire_type):
+    return _varint((number << 3) | wire_type)
+
+
+def _message(number, payload):
+    return _field(number, 2) + _varint(len(payload)) + payload
+
+
+def _packed(number, values):
+    return _message(number, b"".join(_varint(v) for v in values))
+
+
+def _value(value):
+    """Encode a feature property as an MVT Value message"""
+    if isinstance(value, bool):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        return _field(6, 0) + _varint(_zigzag(value) & 0xFFFFFFFFFFFFFFFF)
+    if isinstance(value, float):
+        return _field(3, 1) + struct.pack("<d", value)
+    return _message(1, str(value).encode("utf-8"))
+
+
+def _geometry_commands(parts):
+    """
+    Command stream of one feature from its parts, each an (n, 2) array of
+    integer tile coordinates: MoveTo then LineTo for lines, MoveTo for points.
+    """
+    commands = []
+    cursor = np.zeros(2, dtype=np.int64)
+    for part in parts:
+        deltas = np.diff(part, axis=0, prepend=cursor[None, :])
+        cursor = part[-1]
+        zigzag = ((deltas << 1) ^ (deltas >> 63)).tolist()
+        commands.append((MOVE_TO & 0x7) | (1 << 3))
+        commands.extend(zigzag[0])
+        if len(part) > 1:
+            commands.append((LINE_TO & 0x7) | ((len(part) - 1) << 3))
+            for pair in zigzag[1:]:
+                commands.extend(pair)
+    return commands
+
+
+def encode_tile(layer_name, features, extent=EXTENT):
+    """
+    Encode one MVT layer. features are (id, geometry type, parts, properties)
+    with parts in tile coordinates. Returns b"" for an empty tile.
+    """
+    if not features:
+        return b""
+
+    keys, values = {}, {}
+    encoded = []
+    for feature_id, geometry_type, parts, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+
+        body = b""
+        if isinstance(feature_id, int) and feature_id >= 0:
+            body += _field(1, 0) + _varint(feature_id)
+        if tags:
+            body += _packed(2, tags)
+        body += _field(3, 0) + _varint(geometry_type)
+        body += _packed(4, _geometry_commands(parts))
+        encoded.append(_message(2, body))
+
+    layer = _field(15, 0) + _varint(2) + _message(1, layer_name.encode("utf-8"))
+    layer += b"".join(encoded)
+    layer += b"".join(_message(3, key.encode("utf-8")) for key in keys)
+    layer += b"".join(_message(4, _value(value)) for _, value in values)
+    layer += _field(5, 0) + _varint(extent)
+    return _message(3, layer)
+
+
+class TileLayer:
+    """
+    One layer's features as Web Mercator geometries (points for one-vertex
+    features, linestrings otherwise) with an STRtree, renderable into
+    clipped, per-zoom simplified vector tiles.
+    """
+
+    def __init__(self, lat, lng, offsets, ids=None, properties=None):
+        x, y = to_web_mercator(lat, lng)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        lengths = np.diff(offsets)
+        self.features = np.flatnonzero(lengths > 0)
+        self.ids = ids
+        self.properties = properties
+
+        geometries = np.empty(len(self.features), dtype=object)
+        is_point = lengths[self.features] == 1
+        starts = offsets[self.features]
+        geometries[is_point] = shapely.points(x[starts[is_point]], y[starts[is_point]])
+        lines = self.features[~is_point]
+        if len(lines):
+            vertices, line_lengths = gather_vertices(offsets, lines)
+            owner = np.repeat(np.arange(len(lines)), line_lengths)
+            geometries[~is_point] = shapely.linestrings(
+                x[vertices], y[vertices], indices=owner
+            )
+        self.geometries = geometries
+        self.is_point = is_point
+        self.has_lines = bool(len(lines))
+        self.tree = STRtree(geometries)
+        self._simplified = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.features)
+
+    def geometries_at(self, z):
+        """Geometries simplified for zoom z (cached per zoom)"""
+        if not self.has_lines or z >= SIMPLIFY_MAX_ZOOM:
+            return self.geometries
+        with self._lock:
+            simplified = self._simplified.get(z)
+            if simplified is None:
+                tolerance = WORLD_SIZE / 2**z * SIMPLIFY_TOLERANCE
+                simplified = shapely.simplify(
+                    self.geometries, tolerance, preserve_topology=False
+                )
+                self._simplified[z] = simplified
+        return simplified
+
+    def covering_tiles(self, z):
+        """Tiles at zoom z that intersect at least one feature"""
+        tiles = set()
+        bounds = shapely.bounds(self.geometries_at(z))
+        for min_x, min_y, max_x, max_y in bounds.tolist():
+            x0, y0, x1, y1 = tile_range(min_x, min_y, max_x, max_y, z)
+            for tx in range(x0, x1 + 1):
+                for ty in range(y0, y1 + 1):
+                    tiles.add((tx, ty))
+        return sorted(tiles)
+
+    def render(self, name, z, x, y, extent=EXTENT, buffer=BUFFER):
+        """Encode tile z/x/y of this layer (b"" when no feature touches it)"""
+        min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+        size = max_x - min_x
+        pad = size * buffer / extent
+        clip_box = (min_x - pad, min_y - pad, max_x + pad, max_y + pad)
+        hits = np.sort(self.tree.query(shapely.box(*clip_box)))
+        if not len(hits):
+            return b""
+
+        clipped = shapely.clip_by_rect(self.geometries_at(z)[hits], *clip_box)
+        scale = extent / size
+        features = []
+        for hit, geometry in zip(hits.tolist(), clipped):
+            if geometry is None or shapely.is_empty(geometry):
+                continue
+            point = bool(self.is_point[hit])
+            parts = []
+            for part in shapely.get_parts(geometry):
+                coords = shapely.get_coordinates(part)
+                tile = np.empty(coords.shape, dtype=np.int64)
+                tile[:, 0] = np.round((coords[:, 0] - min_x) * scale)
+                tile[:, 1] = np.round((max_y - coords[:, 1]) * scale)
+                # Vertices that collapse onto the same tile unit add nothing
+                keep = np.ones(len(tile), dtype=bool)
+                keep[1:] = np.any(tile[1:] != tile[:-1], axis=1)
+                tile = tile[keep]
+                # Clipping can leave bare points where a line grazes the edge
+                if len(tile) > 1 or (point and len(tile)):
+                    parts.append(tile[:1] if point else tile)
+            if not parts:
+                continue
+
+            feature = int(self.features[hit])
+            geometry_type = POINT if point else LINESTRING
+            features.append(
+                (
+                    self.ids[feature] if self.ids is not None else feature,
+                    geometry_type,
+                    parts,
+                    self.properties[feature] if self.properties else {},
+                )
+            )
+        return encode_tile(name, features, extent)
+
+
+class TileService:
+    """
+    Serves Mapbox Vector Tiles for the heatmap layers and the datasets with
+    geometries. Non-empty tiles up to PYRAMID_MAX_ZOOM are kept in an on-disk
+    pyramid under <data_dir>/store/tiles (filled by prerender() or on first
+    request), and hot tiles of every zoom, empty ones included, in an
+    in-memory LRU. Both are keyed by the dataset behind the layer, so the
+    heatmap type and dataset name of the same file share their tiles, and by
+    the version of its source file. Pyramids of older versions are dropped
+    when a new version is first served, pre-rendered or ingested.
+    """
+
+    def __init__(
+        self,
+        heatmap_service,
+        datasets=(),
+        tile_dir=None,
+        cache_size=None,
+        pyramid_max_zoom=None,
+    ):
+        self.log = logging.getLogger(__name__)
+        self.heatmap_service = heatmap_service
+        self.layers = dict(FILE_MAPPING)
+        self.layers.update({name: f"{name}.json" for name in datasets})
+        self.tile_dir = Path(tile_dir or heatmap_service.data_dir / "store" / "tiles")
+        if cache_size is None:
+            cache_size = int(os.getenv("TILE_CACHE_SIZE", "4096"))
+        if pyramid_max_zoom is None:
+            pyramid_max_zoom = int(
+                os.getenv("TILE_PYRAMID_MAX_ZOOM", str(PYRAMID_MAX_ZOOM))
+            )
+        self.pyramid_max_zoom = pyramid_max_zoom
+        self.cache = LayerCache(maxsize=cache_size)
+        self._layers = LayerCache(maxsize=len(self.layers))
+        # Version of each dataset whose older pyramids were last dropped
+        self._pruned = {}
+
+    def dataset(self, name):
+        """Name of the dataset behind a layer (heatmap type or dataset), or None"""
+        filename = self.layers.get(name)
+        return None if filename is None else Path(filename).stem
+
+    def datasets(self):
+        """The distinct datasets behind the tile layers"""
+        return sorted({Path(filename).stem for filename in self.layers.values()})
+
+    def layer(self, name):
+        """(version, TileLayer) of a layer, or None if unknown or unavailable"""
+        dataset = self.dataset(name)
+        if dataset is None:
+            return None
+        opened = self.heatmap_service.open_source(self.layers[name])
+        if opened is None:
+            return None
+        version, contents = opened
+
+        layer = self._layers.get(dataset, version)
+        if layer is None:
+            layer = self._build_layer(self.layers[name], contents)
+            if layer is None:
+                return None
+            self._layers.put(dataset, version, layer)
+        return version, layer
+
+    def _build_layer(self, filename, dataset):
+        if isinstance(dataset, list):
+            geometries = [item.get("GEOMETRIA") for item in dataset]
+            lat, lng, offsets = self.heatmap_service.reproject_geometries(geometries)
+            return TileLayer(lat, lng, offsets)
+        if not dataset.has_coordinates:
+            self.log.warning(f"{filename} has no geometries to tile")
+            return None
+
+        ids = dataset.column("_id")
+        if ids is not None and not all(isinstance(i, int) for i in ids):
+            ids = None
+        properties = None
+        if filename == ACCIDENT_FILE:
+            boletins = dataset.column("NUMERO_BOLETIM") or [None] * len(dataset)
+            fatalities = dataset.column("INDICADOR_FATALIDADE") or [None] * len(dataset)
+            properties = [
+                {
+                    "boletim": boletim,
+                    "fatalidade": fatality,
+                    "year": (
+                        boletim.split("-")[0]
+                        if isinstance(boletim, str) and "-" in boletim
+                        else None
+                    ),
+                }
+                for boletim, fatality in zip(boletins, fatalities)
+            ]
+        return TileLayer(
+            dataset.lat, dataset.lng, dataset.geometry_offsets, ids, properties
+        )
+
+    @staticmethod
+    def _version_tag(version):
+        return hashlib.sha1(json.dumps(version).encode("utf-8")).hexdigest()[:16]
+
+    def _tile_path(self, name, version, z, x, y):
+        return (
+            self.tile_dir
+            / name
+            / self._version_tag(version)
+            / str(z)
+            / str(x)
+            / f"{y}.mvt"
+        )
+
+    def get_tile(self, name, z, x, y):
+        """
+        Encoded tile bytes, or None if the layer is unknown or unavailable.
+        The MVT layer is named after the dataset behind the layer.
+        """
+        opened = self.layer(name)
+        if opened is None:
+            return None
+        version, layer = opened
+        dataset = self.dataset(name)
+
+        key = (dataset, z, x, y)
+        tile = self.cache.get(key, version)
+        if tile is not None:
+            return tile
+
+        in_pyramid = z <= self.pyramid_max_zoom
+        if in_pyramid and self._pruned.get(dataset) != version:
+            self._prune(dataset, version)
+        path = self._tile_path(dataset, version, z, x, y)
+        if in_pyramid and path.exists():
+            tile = path.read_bytes()
+        else:
+            tile = layer.render(dataset, z, x, y)
+            # Only tiles with features reach the disk, so requests for tiles
+            # outside the data extent cannot grow the pyramid
+            if in_pyramid and tile:
+                try:
+                    self._write(path, tile)
+                except OSError as e:
+                    # The version may have just been pruned by a newer one
+                    self.log.warning(f"Could not store tile {path}: {e}")
+        self.cache.put(key, version, tile)
+        return tile
+
+    @staticmethod
+    def _write(path, tile):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        tmp.write_bytes(tile)
+        os.replace(tmp, path)
+
+    def prerender(self, name, max_zoom=None, min_zoom=0):
+        """
+        Write every non-empty tile of a layer from min_zoom to max_zoom into
+        the pyramid and drop pyramids of older versions. Returns the number
+        of tiles written.
+        """
+        opened = self.layer(name)
+        if opened is None:
+            self.log.warning(f"Skipping tiles for {name}: layer unavailable")
+            return 0
+        version, layer = opened
+        dataset = self.dataset(name)
+        max_zoom = self.pyramid_max_zoom if max_zoom is None else max_zoom
+
+        written = 0
+        for z in range(min_zoom, max_zoom + 1):
+            for x, y in layer.covering_tiles(z):
+                tile = layer.render(dataset, z, x, y)
+                if tile:
+                    self._write(self._tile_path(dataset, version, z, x, y), tile)
+                    written += 1
+
+        self._prune(dataset, version)
+        self.log.info(f"Pre-rendered {written} tiles of {name} up to zoom {max_zoom}")
+        return written
+
+    def prune(self, name):
+        """
+        Drop the on-disk pyramids of a layer's dataset built from versions
+        other than the current one (all of them if it is unavailable).
+        Returns the number of pyramids removed.
+        """
+        dataset = self.dataset(name)
+        if dataset is None or not (self.tile_dir / dataset).exists():
+            return 0
+        opened = self.layer(name)
+        return self._prune(dataset, opened[0] if opened else None)
+
+    def _prune(self, dataset, version):
+        self._pruned[dataset] = version
+        current = None if version is None else self._version_tag(version)
+        layer_dir = self.tile_dir / dataset
+        removed = 0
+        for stale in layer_dir.iterdir() if layer_dir.exists() else ():
+            if stale.is_dir() and stale.name != current:
+                shutil.rmtree(stale, ignore_errors=True)
+                removed += 1
+        if removed:
+            self.log.info(f"Removed {removed} stale tile pyramids of {dataset}")
+        return removed
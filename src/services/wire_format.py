@@ -0,0 +1,168 @@
+import json
+import struct
+import numpy as np
+
+# Response formats for heatmap layers
+FORMATS = ("json", "columnar", "polyline", "binary")
+
+MIMETYPES = {
+    "json": "application/json",
+    "columnar": "application/json",
+    "polyline": "application/json",
+    "binary": "application/octet-stream",
+}
+
+# Decimal places kept for coordinates in the compact formats (~0.1 m)
+COORDINATE_DECIMALS = 6
+POLYLINE_PRECISION = 5
+
+
+def negotiate_format(requested, accept_mimetypes):
+    """
+    Pick the response format from an explicit format= value or, failing
+    that, the Accept header. Raises ValueError for unknown formats.
+    """
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+        return requested
+
+    best = accept_mimetypes.best_match(
+        ["application/json", "application/octet-stream"], default="application/json"
+    )
+    return "binary" if best == "application/octet-stream" else "json"
+
+
+def detail_columns(details):
+    """Turn a list of detail dicts into a dict of parallel columns"""
+    if not details:
+        return {}
+    return {key: [detail[key] for detail in details] for key in details[0]}
+
+
+def encode_polyline(lat, lng, precision=POLYLINE_PRECISION):
+    """
+    Encode coordinates with the Google encoded polyline algorithm: deltas of
+    fixed-point values, zig-zag encoded and written as 5-bit ASCII chunks.
+    """
+    if not len(lat):
+        return ""
+
+    factor = 10**precision
+    fixed = np.empty((len(lat), 2), dtype=np.int64)
+    fixed[:, 0] = np.round(np.asarray(lat) * factor)
+    fixed[:, 1] = np.round(np.asarray(lng) * factor)
+    deltas = np.diff(fixed, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+
+    values = deltas << 1
+    values = np.where(deltas < 0, ~values, values)
+
+    # Split every value into 5-bit chunks, least significant first
+    shifts = 5 * np.arange(13, dtype=np.int64)
+    chunks = (values[:, None] >> shifts) & 0x1F
+    lengths = 1 + (values[:, None] >= (1 << shifts[1:])).sum(axis=1)
+    used = np.arange(len(shifts))[None, :] < lengths[:, None]
+    more = np.arange(len(shifts))[None, :] < (lengths - 1)[:, None]
+    chunks = (chunks | np.where(more, 0x20, 0)) + 63
+    return chunks[used].astype(np.uint8).tobytes().decode("ascii")
+
+
+def decode_polyline(encoded, precision=POLYLINE_PRECISION):
+    """Decode an encoded polyline into (lat, lng) float arrays"""
+    chunks = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64)
+    if not len(chunks):
+        return np.empty(0), np.empty(0)
+
+    chunks -= 63
+    # A value ends at every chunk without the continuation bit
+    ends = np.flatnonzero(chunks < 0x20)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    position = np.arange(len(chunks)) - np.repeat(starts, ends - starts + 1)
+    values = np.add.reduceat((chunks & 0x1F) << (5 * position), starts)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+
+    fixed = np.cumsum(deltas.reshape(-1, 2), axis=0) / 10**precision
+    return fixed[:, 0], fixed[:, 1]
+
+
+def join_polylines(polylines, precision=POLYLINE_PRECISION):
+    """Concatenate encoded polylines into one, dropping repeated joint points"""
+    lats, lngs = [], []
+    for encoded in polylines:
+        lat, lng = decode_polyline(encoded, precision)
+        if lats and len(lat) and len(lats[-1]):
+            if (lat[0], lng[0]) == (lats[-1][-1], lngs[-1][-1]):
+                lat, lng = lat[1:], lng[1:]
+        lats.append(lat)
+        lngs.append(lng)
+    if not lats:
+        return ""
+    return encode_polyline(np.concatenate(lats), np.concatenate(lngs), precision)
+
+
+def pack_binary(lat, lng, header, weights=None):
+    """
+    Binary layout: uint32 little-endian header length, a UTF-8 JSON header
+    padded to a 4-byte boundary, then count Float32 latitudes followed by
+    count Float32 longitudes (and count Float32 weights if present).
+    """
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % 4)
+    body = [struct.pack("<I", len(header_bytes)), header_bytes]
+    body.append(np.asarray(lat, dtype="<f4").tobytes())
+    body.append(np.asarray(lng, dtype="<f4").tobytes())
+    if weights is not None:
+        body.append(np.asarray(weights, dtype="<f4").tobytes())
+    return b"".join(body)
+
+
+def encode_layer(fmt, lat, lng, details, weights=None, extra=None):
+    """
+    Serialize a layer in one of FORMATS. "json" is the original per-point
+    payload; the others carry coordinates as parallel columns, an encoded
+    polyline or raw Float32 arrays, with details sent as parallel columns.
+    Returns a dict for the JSON formats and bytes for "binary".
+    """
+    extra = extra or {}
+    if fmt == "json":
+        if weights is None:
+            points = [{"lat": a, "lng": b} for a, b in zip(lat.tolist(), lng.tolist())]
+            return {"points": points, "details": details, **extra}
+        cells = [
+            [a, b, w] for a, b, w in zip(lat.tolist(), lng.tolist(), weights.tolist())
+        ]
+        return {"cells": cells, "details": details, **extra}
+
+    columns = detail_columns(details)
+    if fmt == "columnar":
+        layer = {
+            "lat": np.round(lat, COORDINATE_DECIMALS).tolist(),
+            "lng": np.round(lng, COORDINATE_DECIMALS).tolist(),
+            "details": columns,
+            **extra,
+        }
+        if weights is not None:
+            layer["weight"] = weights.tolist()
+        return layer
+
+    if fmt == "polyline":
+        layer = {
+            "polyline": encode_polyline(lat, lng),
+            "count": len(lat),
+            "details": columns,
+            **extra,
+        }
+        if weights is not None:
+            layer["weight"] = weights.tolist()
+        return layer
+
+    if fmt == "binary":
+        header = {
+            "count": len(lat),
+            "weighted": weights is not None,
+            "details": columns,
+            **extra,
+        }
+        return pack_binary(lat, lng, header, weights)
+
+    raise ValueError(f"Unknown format: {fmt}")
@@ -0,0 +1,107 @@
+import math
+
+import numpy as np
+import pytest
+
+from src.services.aggregation import (
+    DEFAULT_CELL_SIZE,
+    _hex_cells,
+    _to_local_meters,
+    bin_points,
+    parse_cell_size,
+)
+
+
+def sample_points(count=2000, seed=1):
+    rng = np.random.default_rng(seed)
+    lat = -19.92 + rng.normal(0, 0.02, count)
+    lng = -43.94 + rng.normal(0, 0.03, count)
+    return lat, lng
+
+
+@pytest.mark.parametrize("agg", ["grid", "hex"])
+@pytest.mark.parametrize("cell_size", [10.0, 100.0, 2500.0])
+def test_weights_sum_to_the_point_count(agg, cell_size):
+    lat, lng = sample_points()
+    lat[:5] = np.nan
+    lng[5:8] = np.inf
+    cell_lat, cell_lng, weights = bin_points(lat, lng, agg, cell_size)
+
+    assert weights.sum() == len(lat) - 8
+    assert (weights > 0).all()
+    assert len(cell_lat) == len(cell_lng) == len(weights)
+    # Weighted cell centroids average back to the centroid of the points
+    finite = np.isfinite(lat) & np.isfinite(lng)
+    assert np.average(cell_lat, weights=weights) == pytest.approx(lat[finite].mean())
+    assert np.average(cell_lng, weights=weights) == pytest.approx(lng[finite].mean())
+
+
+def test_grid_cells_hold_the_points_of_their_square():
+    lat, lng = sample_points(500)
+    cell_size = 250.0
+    cell_lat, cell_lng, weights = bin_points(lat, lng, "grid", cell_size)
+
+    x, y = _to_local_meters(lat, lng)
+    squares = {}
+    for key, a, b in zip(
+        zip(np.floor(x / cell_size).tolist(), np.floor(y / cell_size).tolist()),
+        lat.tolist(),
+        lng.tolist(),
+    ):
+        squares.setdefault(key, []).append((a, b))
+    expected = sorted(
+        (len(p), np.mean([a for a, _ in p]), np.mean([b for _, b in p]))
+        for p in squares.values()
+    )
+    found = sorted(zip(weights.tolist(), cell_lat.tolist(), cell_lng.tolist()))
+    assert np.allclose(found, expected)
+
+
+def test_hex_cells_are_the_nearest_hexagon_centres():
+    rng = np.random.default_rng(2)
+    x, y = rng.uniform(-5000, 5000, (2, 5000))
+    cell_size = 100.0
+    q, r = _hex_cells(x, y, cell_size)
+
+    radius = cell_size / math.sqrt(3)
+
+    def centre(q, r):
+        return radius * math.sqrt(3) * (q + r / 2), radius * 1.5 * r
+
+    neighbours = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, -1), (-1, 1)]
+    for px, py, cq, cr in zip(x, y, q.tolist(), r.tolist()):
+        cx, cy = centre(cq, cr)
+        own = math.hypot(px - cx, py - cy)
+        assert own <= radius + 1e-9
+        for dq, dr in neighbours:
+            nx, ny = centre(cq + dq, cr + dr)
+            assert own <= math.hypot(px - nx, py - ny) + 1e-9
+
+
+def test_no_points():
+    cell_lat, cell_lng, weights = bin_points([], [], "hex")
+    assert len(cell_lat) == len(cell_lng) == len(weights) == 0
+    with pytest.raises(ValueError):
+        bin_points([1.0], [1.0], "squares")
+
+
+@pytest.mark.parametrize(
+    "value, size",
+    [
+        (None, DEFAULT_CELL_SIZE),
+        ("", DEFAULT_CELL_SIZE),
+        ("250", 250.0),
+        ("250m", 250.0),
+        (" 0.5 KM ", 500.0),
+        ("1", 1.0),
+        ("100km", 100_000.0),
+    ],
+)
+def test_cell_sizes(value, size):
+    assert parse_cell_size(value) == size
+
+
+@pytest.mark.parametrize("value", ["abc", "-5", "10 mi", "0.5", "101km", "1e3"])
+def test_invalid_cell_sizes(value):
+    with pytest.raises(ValueError):
+        parse_cell_size(value)
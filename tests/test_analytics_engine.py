@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from benchmarks.analytics_engine import evaluate_records
+from src.services.analytics_engine import (
+    ANALYTICS_SPECS,
+    AnalyticsEngine,
+    CountBy,
+    CountByYear,
+    Mean,
+    Sum,
+)
+from src.services.columnar_store import ColumnarDataset
+from src.services.data_analytics_service import DataService
+
+SPECS = {
+    "sample": [
+        CountBy("bairro", "BAIRRO"),
+        CountBy("vagas_counts", "VAGAS"),
+        CountBy("missing", "NO_SUCH_FIELD"),
+        CountByYear("years", "DATA"),
+        CountByYear("int_years", "VAGAS"),
+        Sum(("vagas", "total"), "VAGAS", int),
+        Sum(("vagas", "text"), "VAGAS_TEXTO", int),
+        Sum("extensao", "EXTENSAO", float),
+        Sum("missing_sum", "NO_SUCH_FIELD", float),
+        Mean("media", "FAIXAS"),
+        Mean("missing_mean", "NO_SUCH_FIELD"),
+        CountBy("misto", "MISTO"),
+        CountByYear("misto_years", "MISTO"),
+        Mean("misto_media", "MISTO"),
+    ]
+}
+
+FIELDS = [
+    {"id": "BAIRRO", "type": "text"},
+    {"id": "VAGAS", "type": "int"},
+    {"id": "VAGAS_TEXTO", "type": "text"},
+    {"id": "DATA", "type": "text"},
+    {"id": "EXTENSAO", "type": "text"},
+    {"id": "FAIXAS", "type": "text"},
+    {"id": "MISTO", "type": "text"},
+]
+
+RECORDS = [
+    ["SAVASSI", 3, "3", "2019-05-01 00:00:00", "0.1", "2", "2019-01-01"],
+    ["UNIÃO", 1, "10", "2020-01-02", "0.2", "0", 5],
+    [None, 3, "0", None, "0.3", "-1", None],
+    ["SAVASSI ", 7, "4", "", "1e-3", "", "5"],
+    ["", 1, "5", "2019", "12.5", "x", "2020 01"],
+    ["UNIÃO", 2, "6", "2020 01 02", "0.7", "13", "2019"],
+    ["savassi", 3, "7", "-05", "3", None, True],
+]
+
+
+def dataset(records):
+    return ColumnarDataset.from_json({"fields": FIELDS, "records": records})
+
+
+def test_matches_the_row_wise_analytics():
+    engine = AnalyticsEngine(SPECS)
+    data = dataset(RECORDS)
+    expected = evaluate_records(engine, "sample", data.rows())
+    analytics = engine.evaluate("sample", data)
+
+    assert analytics == expected
+    # Same key order (first occurrence) and types in the served JSON
+    assert json.dumps(analytics) == json.dumps(expected)
+    assert analytics["bairro"] == {
+        "SAVASSI": 1,
+        "UNIÃO": 2,
+        None: 1,
+        "SAVASSI ": 1,
+        "": 1,
+        "savassi": 1,
+    }
+    assert analytics["years"] == {"2019": 2, "2020": 2, "": 1}
+
+
+def test_empty_dataset():
+    engine = AnalyticsEngine(SPECS)
+    data = dataset([])
+    assert engine.evaluate("sample", data) == evaluate_records(engine, "sample", [])
+
+
+def test_failing_casts_still_fail():
+    engine = AnalyticsEngine({"sample": [Sum("total", "VAGAS_TEXTO", int)]})
+    data = dataset([["A", 1, "1.5", None, None, None, None]])
+    with pytest.raises(ValueError):
+        engine.evaluate("sample", data)
+
+
+@pytest.mark.parametrize("dataset_name", sorted(ANALYTICS_SPECS))
+def test_matches_the_row_wise_analytics_on_the_datasets(dataset_name):
+    opened = DataService().open_dataset(dataset_name)
+    if opened is None:
+        pytest.skip(f"{dataset_name} is not in data/")
+    data = opened[1]
+    engine = AnalyticsEngine()
+
+    try:
+        expected = evaluate_records(engine, dataset_name, data.rows())
+    except Exception as e:
+        with pytest.raises(type(e)):
+            engine.evaluate(dataset_name, data)
+        return
+    assert json.dumps(engine.evaluate(dataset_name, data)) == json.dumps(expected)
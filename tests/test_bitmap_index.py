@@ -0,0 +1,129 @@
+import random
+
+import numpy as np
+import pytest
+
+from src.services.bitmap_index import (
+    EAGER_CARDINALITY,
+    BitmapIndex,
+    filter_groups,
+    parse_filter,
+    record_matches,
+)
+from src.services.columnar_store import ColumnarDataset
+
+FIELDS = [
+    {"id": "NUMERO_BOLETIM", "type": "text"},
+    {"id": "INDICADOR_FATALIDADE", "type": "text"},
+    {"id": "BAIRRO", "type": "text"},
+    {"id": "TEMPO_PERMANENCIA", "type": "int"},
+    {"id": "Codigo", "type": "text"},
+]
+
+EXPRESSIONS = [
+    "year:2019",
+    "year:2019|2020,fatality:sim",
+    "year:2019|2020,fatality:SIM;bairro:centro",
+    "BAIRRO:Centro|savassi,tempo:2",
+    "bairro:CENTRO;bairro:Savassi;fatalidade:não",
+    "regional:norte",
+    "no_such_field:x;year:2018",
+    "codigo:c7|C100|c3",
+    "CODIGO:c42,fatality:sim|não",
+    "tempo:2|3,Tempo:3",
+    "year:1999",
+]
+
+
+def sample_records(count=203, seed=7):
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        year = rng.choice(["2017", "2018", "2019", "2020"])
+        records.append(
+            [
+                rng.choice([f"{year}-{i:09d}-001", None, "sem ano"]),
+                rng.choice(["SIM", "Não", "sim", "NÃO", None]),
+                rng.choice(["CENTRO", "Centro", "SAVASSI", "Lourdes", "", None]),
+                rng.choice([1, 2, 3, None]),
+                # More distinct values than the bitmaps built up front
+                f"C{rng.randrange(EAGER_CARDINALITY * 2)}",
+            ]
+        )
+    return records
+
+
+@pytest.fixture(scope="module")
+def sample():
+    records = sample_records()
+    dataset = ColumnarDataset.from_json({"fields": FIELDS, "records": records})
+    names = [field["id"] for field in FIELDS]
+    return BitmapIndex(dataset), [dict(zip(names, record)) for record in records]
+
+
+@pytest.mark.parametrize("expression", EXPRESSIONS)
+def test_rows_match_the_records(sample, expression):
+    index, records = sample
+    groups = parse_filter(expression)
+    expected = [i for i, record in enumerate(records) if record_matches(record, groups)]
+
+    assert index.rows(groups).tolist() == expected
+    bits = np.unpackbits(index.evaluate(groups), count=len(records))
+    assert np.flatnonzero(bits).tolist() == expected
+
+
+def test_legacy_filters_are_anded_into_every_group(sample):
+    index, records = sample
+    groups = filter_groups(2019, "sim", parse_filter("bairro:centro;tempo:1"))
+    expected = [i for i, record in enumerate(records) if record_matches(record, groups)]
+    assert expected
+    assert index.rows(groups).tolist() == expected
+    # An empty group matches every row
+    assert len(index.rows([[]])) == len(records)
+    assert index.rows(filter_groups(2019)).tolist() == [
+        i
+        for i, record in enumerate(records)
+        if record_matches(record, [[("year", ["2019"])]])
+    ]
+
+
+def test_missing_values_never_match(sample):
+    index, records = sample
+    assert None not in index.values("bairro")
+    missing = [i for i, record in enumerate(records) if record["BAIRRO"] is None]
+    matched = set(index.rows([[("BAIRRO", ["centro", "savassi", "lourdes"])]]).tolist())
+    assert missing and not matched & set(missing)
+    assert index.rows([[("BAIRRO", ["None"])]]).tolist() == []
+
+
+def test_aliases_and_case():
+    assert parse_filter(" Fatality : sim | não , BAIRRO:Centro ; year:2019") == [
+        [("INDICADOR_FATALIDADE", ["sim", "não"]), ("BAIRRO", ["Centro"])],
+        [("year", ["2019"])],
+    ]
+    assert parse_filter("Regional:norte") == [[("DESCRICAO_REGIONAL", ["norte"])]]
+    assert parse_filter("OUTRO:1") == [[("OUTRO", ["1"])]]
+
+
+@pytest.mark.parametrize("value", [None, "", "   "])
+def test_no_filter(value):
+    assert parse_filter(value) is None
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "bairro",
+        "bairro:",
+        ":centro",
+        "bairro:|",
+        "bairro:centro,",
+        "bairro:centro;",
+        ";bairro:centro",
+        "bairro:centro,,year:2019",
+        " : ",
+    ],
+)
+def test_malformed_filters_are_rejected(value):
+    with pytest.raises(ValueError):
+        parse_filter(value)
@@ -0,0 +1,119 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from src.services.columnar_store import (
+    MANIFEST_FILE,
+    STORE_FORMAT,
+    ColumnarDataset,
+    ColumnarStore,
+)
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+FIELDS = [
+    {"id": "_id", "type": "int"},
+    {"id": "NOME", "type": "text"},
+    {"id": "NUMERO", "type": "text"},
+    {"id": "EXTENSAO", "type": "numeric"},
+    {"id": "ATIVO", "type": "bool"},
+    {"id": "QUANTIDADE", "type": "int"},
+    {"id": "GRANDE", "type": "int"},
+    {"id": "VAZIO", "type": "text"},
+    {"id": "EXTRA", "type": "text"},
+]
+
+RECORDS = [
+    [1, "São João", "10", 32.441, True, 3, 2**70, None, {"a": [1, 2]}],
+    [2, "", 10, 1.0, False, None, 5, None, [1, "b"]],
+    [3, None, "10A", None, None, 0, -(2**64), None, None],
+    [4, "Centro", 10.5, -0.5, True, -7, 1, None, "texto"],
+]
+
+
+def typed(value):
+    """A value with its type, so that 1, 1.0 and True compare unequal"""
+    return json.dumps(value, sort_keys=True)
+
+
+def typed_rows(rows):
+    return [[typed(v) for v in row] for row in rows]
+
+
+def stored(tmp_path, name, dataset):
+    store = ColumnarStore(tmp_path / "store")
+    store.write(name, dataset, None)
+    return store.open(name)
+
+
+def test_records_round_trip_with_their_types(tmp_path):
+    dataset = ColumnarDataset.from_json({"fields": FIELDS, "records": RECORDS})
+    names = [field["id"] for field in FIELDS]
+    kinds = {name: dataset.columns[name].kind for name in names}
+    assert kinds == {
+        "_id": "int",
+        "NOME": "text",
+        "NUMERO": "json",
+        "EXTENSAO": "float",
+        "ATIVO": "json",
+        "QUANTIDADE": "int",
+        "GRANDE": "json",
+        "VAZIO": "text",
+        "EXTRA": "json",
+    }
+
+    read_back = stored(tmp_path, "sample", dataset)
+    rows = [[row[name] for name in names] for row in read_back.rows()]
+    assert typed_rows(rows) == typed_rows(RECORDS)
+
+
+def test_patching_with_other_types_keeps_every_value(tmp_path):
+    names = [field["id"] for field in FIELDS]
+    dataset = ColumnarDataset.from_json({"fields": FIELDS, "records": RECORDS[:2]})
+    # Row 1 is replaced by a record whose values have other types, and a
+    # record is appended
+    updates = ColumnarDataset.from_json({"fields": FIELDS, "records": [RECORDS[2]]})
+    inserts = ColumnarDataset.from_json({"fields": FIELDS, "records": [RECORDS[3]]})
+    patched = dataset.patch([1], updates, (), inserts)
+
+    expected = [RECORDS[0], RECORDS[2], RECORDS[3]]
+    rows = [[row[name] for name in names] for row in patched.rows()]
+    assert typed_rows(rows) == typed_rows(expected)
+
+    appended = dataset.append(inserts)
+    rows = [[row[name] for name in names] for row in appended.rows()]
+    assert typed_rows(rows) == typed_rows(RECORDS[:2] + [RECORDS[3]])
+
+    read_back = stored(tmp_path, "sample", patched)
+    rows = [[row[name] for name in names] for row in read_back.rows()]
+    assert typed_rows(rows) == typed_rows(expected)
+
+
+@pytest.mark.parametrize("stored_format", [None, 1, STORE_FORMAT + 1])
+def test_other_store_formats_are_stale(tmp_path, stored_format):
+    dataset = ColumnarDataset.from_json({"fields": FIELDS, "records": RECORDS})
+    store = ColumnarStore(tmp_path / "store")
+    version = store.write("sample", dataset, None)
+    assert store.open("sample") is not None
+
+    path = tmp_path / "store" / "sample" / version / MANIFEST_FILE
+    manifest = json.loads(path.read_text())
+    assert manifest.pop("format") == STORE_FORMAT
+    if stored_format is not None:
+        manifest["format"] = stored_format
+    path.write_text(json.dumps(manifest))
+    assert ColumnarStore(tmp_path / "store").open("sample") is None
+
+
+@pytest.mark.parametrize(
+    "path", sorted(DATA_DIR.glob("*.json")), ids=lambda path: path.stem
+)
+def test_stored_records_equal_the_json_records(tmp_path, path):
+    with open(path, "r", encoding="utf-8") as f:
+        raw_data = json.load(f)
+    names = [field["id"] for field in raw_data["fields"]]
+
+    read_back = stored(tmp_path, path.stem, ColumnarDataset.from_json(raw_data))
+    rows = [[row[name] for name in names] for row in read_back.rows()]
+    assert typed_rows(rows) == typed_rows(raw_data["records"])
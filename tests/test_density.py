@@ -0,0 +1,126 @@
+import math
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from src.services.density import (
+    EMPTY_TILE,
+    TILE_SIZE,
+    DensityService,
+    encode_png,
+    gaussian_density,
+)
+from src.services.heatmap_service import HeatmapService
+
+# A point in Belo Horizonte, in UTM 23S metres
+ORIGIN = (610_000.0, 7_796_000.0)
+
+
+def decode_png(data):
+    """(height, width, 4) RGBA array of an 8-bit RGBA PNG without filters"""
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks, offset = {}, 8
+    while offset < len(data):
+        (length,) = struct.unpack_from(">I", data, offset)
+        start, end = offset + 4, offset + 8 + length
+        body = data[start:end]
+        (crc,) = struct.unpack_from(">I", data, end)
+        assert zlib.crc32(body) == crc
+        chunks[body[:4]] = body[4:]
+        offset = end + 4
+    assert b"IEND" in chunks
+    width, height, depth, color, _, _, interlace = struct.unpack(
+        ">IIBBBBB", chunks[b"IHDR"]
+    )
+    assert (depth, color, interlace) == (8, 6, 0)
+    scanlines = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8)
+    scanlines = scanlines.reshape(height, width * 4 + 1)
+    assert not scanlines[:, 0].any()
+    return scanlines[:, 1:].reshape(height, width, 4)
+
+
+@pytest.mark.parametrize("bandwidth", [50.0, 150.0, 600.0])
+def test_mass_is_preserved(bandwidth):
+    rng = np.random.default_rng(3)
+    x = ORIGIN[0] + rng.normal(0, 800, 500)
+    y = ORIGIN[1] + rng.normal(0, 400, 500)
+    surface = gaussian_density(x, y, bandwidth)
+
+    hectares = surface.cell_size**2 / 10_000
+    assert float(surface.density.sum(dtype=np.float64)) * hectares == pytest.approx(
+        500, rel=1e-3
+    )
+
+
+def test_missing_coordinates_are_ignored():
+    x = [ORIGIN[0], math.nan, ORIGIN[0] + 100]
+    y = [ORIGIN[1], ORIGIN[1], math.inf]
+    surface = gaussian_density(x, y, 100.0)
+    hectares = surface.cell_size**2 / 10_000
+    assert surface.density.sum() * hectares == pytest.approx(1, rel=1e-3)
+    assert gaussian_density([math.nan], [1.0], 100.0) is None
+
+
+def test_peak_falls_on_the_point():
+    bandwidth = 100.0
+    # A cell size that does not divide the margin, so the point lies inside a cell
+    surface = gaussian_density([ORIGIN[0]], [ORIGIN[1]], bandwidth, cell_size=30.0)
+    row, col = np.unravel_index(np.argmax(surface.density), surface.density.shape)
+    assert col == math.floor((ORIGIN[0] - surface.min_x) / surface.cell_size)
+    assert row == math.floor((ORIGIN[1] - surface.min_y) / surface.cell_size)
+
+    # The value at the point is that of a Gaussian of one point, per hectare
+    peak = 10_000 / (2 * math.pi * bandwidth**2)
+    at_point = surface.sample([ORIGIN[0]], [ORIGIN[1]])[0]
+    assert at_point == pytest.approx(peak, rel=0.05)
+    one_sigma = surface.sample([ORIGIN[0] + bandwidth], [ORIGIN[1]])[0]
+    assert one_sigma == pytest.approx(peak * math.exp(-0.5), rel=0.05)
+
+    left, bottom, right, top = surface.bounds
+    outside = surface.sample(
+        [left - 1, right + 1, ORIGIN[0]], [ORIGIN[1]] * 2 + [top + 1]
+    )
+    assert outside.tolist() == [0.0, 0.0, 0.0]
+
+
+def test_png_decodes_to_its_pixels():
+    rgba = np.random.default_rng(5).integers(
+        0, 256, (TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8
+    )
+    assert np.array_equal(decode_png(encode_png(rgba)), rgba)
+
+    empty = decode_png(EMPTY_TILE)
+    assert empty.shape == (TILE_SIZE, TILE_SIZE, 4)
+    assert not empty.any()
+
+
+def test_tiles_are_256_pixel_pngs():
+    service = DensityService(HeatmapService())
+    opened = service.surface("speed-reducer")
+    if opened is None:
+        pytest.skip("redutor_velocidade is not in data/")
+    _, surface = opened
+
+    # The tile over the densest cell at zoom 13
+    row, col = np.unravel_index(np.argmax(surface.density), surface.density.shape)
+    centre = service.heatmap_service.convert_to_latlon(
+        surface.min_x + (col + 0.5) * surface.cell_size,
+        surface.min_y + (row + 0.5) * surface.cell_size,
+    )
+    lat, lng = centre["lat"], centre["lng"]
+    z = 13
+    x = int((lng + 180) / 360 * 2**z)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * 2**z)
+
+    tile = service.get_tile("speed-reducer", z, x, y)
+    pixels = decode_png(tile)
+    assert pixels.shape == (TILE_SIZE, TILE_SIZE, 4)
+    assert pixels[..., 3].any()
+    assert service.get_tile("speed-reducer", z, x, y) is tile
+    assert decode_png(service.get_tile("speed-reducer", z, 0, 0)).shape == (
+        TILE_SIZE,
+        TILE_SIZE,
+        4,
+    )
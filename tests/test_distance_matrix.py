@@ -0,0 +1,124 @@
+import threading
+from collections import Counter
+
+import numpy as np
+
+from src.services.distance_matrix import (
+    MAX_DESTINATIONS,
+    MAX_ELEMENTS,
+    MAX_ORIGINS,
+    DistanceMatrixPlanner,
+)
+from src.services.route_cache import RouteCache
+
+ORIGINS = [f"Origem {i}" for i in range(60)]
+DESTINATIONS = [f"Destino {j}" for j in range(70)]
+
+
+def cell(origin, destination):
+    """(duration, distance) the fake API answers for a pair"""
+    i, j = int(origin.split()[1]), int(destination.split()[1])
+    return float(i * 1000 + j), float(j * 1000 + i)
+
+
+class FakeClient:
+    """Stands in for googlemaps.Client, recording Distance Matrix requests"""
+
+    def __init__(self, unroutable=()):
+        self.requests = []
+        self.unroutable = set(unroutable)
+        self._lock = threading.Lock()
+
+    def distance_matrix(self, origins, destinations, mode=None):
+        with self._lock:
+            self.requests.append((list(origins), list(destinations), mode))
+        rows = []
+        for origin in origins:
+            elements = []
+            for destination in destinations:
+                if (origin, destination) in self.unroutable:
+                    elements.append({"status": "ZERO_RESULTS"})
+                    continue
+                duration, distance = cell(origin, destination)
+                elements.append(
+                    {
+                        "status": "OK",
+                        "duration": {"value": duration},
+                        "distance": {"value": distance},
+                    }
+                )
+            rows.append({"elements": elements})
+        return {"rows": rows}
+
+    def requested(self):
+        """How many times each (origin, destination) pair was requested"""
+        return Counter(
+            (origin, destination)
+            for origins, destinations, _ in self.requests
+            for origin in origins
+            for destination in destinations
+        )
+
+
+def expected(origins, destinations):
+    cells = np.array([[cell(o, d) for d in destinations] for o in origins])
+    return cells[..., 0], cells[..., 1]
+
+
+def test_every_pair_is_requested_once_within_the_limits():
+    client = FakeClient()
+    planner = DistanceMatrixPlanner(client, RouteCache(maxsize=10_000))
+    matrix = planner.plan(ORIGINS[:53], DESTINATIONS[:61], mode="walking")
+
+    for origins, destinations, mode in client.requests:
+        assert len(origins) <= MAX_ORIGINS
+        assert len(destinations) <= MAX_DESTINATIONS
+        assert len(origins) * len(destinations) <= MAX_ELEMENTS
+        assert mode == "walking"
+    pairs = client.requested()
+    assert set(pairs) == {(o, d) for o in ORIGINS[:53] for d in DESTINATIONS[:61]}
+    assert set(pairs.values()) == {1}
+
+    duration, distance = expected(ORIGINS[:53], DESTINATIONS[:61])
+    assert np.array_equal(matrix["duration"], duration)
+    assert np.array_equal(matrix["distance"], distance)
+    assert matrix["origins"] == ORIGINS[:53]
+
+
+def test_cached_cells_are_not_requested_again():
+    client = FakeClient()
+    planner = DistanceMatrixPlanner(client, RouteCache(maxsize=10_000))
+    planner.plan(ORIGINS[:30], DESTINATIONS[:40])
+    planner.plan(ORIGINS[40:45], DESTINATIONS[50:52])
+
+    client.requests.clear()
+    again = planner.plan(ORIGINS[:30], DESTINATIONS[:40])
+    assert client.requests == []
+    assert np.array_equal(
+        again["duration"], expected(ORIGINS[:30], DESTINATIONS[:40])[0]
+    )
+
+    # A wider matrix only requests the cells outside what was fetched
+    matrix = planner.plan(ORIGINS[:50], DESTINATIONS[:55])
+    cached = {(o, d) for o in ORIGINS[:30] for d in DESTINATIONS[:40]}
+    cached |= {(o, d) for o in ORIGINS[40:45] for d in DESTINATIONS[50:52]}
+    pairs = client.requested()
+    everything = {(o, d) for o in ORIGINS[:50] for d in DESTINATIONS[:55]}
+    assert set(pairs) == everything - cached
+    assert set(pairs.values()) == {1}
+    duration, distance = expected(ORIGINS[:50], DESTINATIONS[:55])
+    assert np.array_equal(matrix["duration"], duration)
+    assert np.array_equal(matrix["distance"], distance)
+
+
+def test_cells_without_a_route_are_nan_and_not_cached():
+    unroutable = (ORIGINS[1], DESTINATIONS[2])
+    client = FakeClient([unroutable])
+    planner = DistanceMatrixPlanner(client, RouteCache(maxsize=10_000))
+    matrix = planner.plan(ORIGINS[:3], DESTINATIONS[:3])
+    assert np.isnan(matrix["duration"][1, 2]) and np.isnan(matrix["distance"][1, 2])
+    assert np.isfinite(np.delete(matrix["duration"].ravel(), 5)).all()
+
+    client.requests.clear()
+    planner.plan(ORIGINS[:3], DESTINATIONS[:3])
+    assert client.requested() == Counter([unroutable])
@@ -0,0 +1,117 @@
+import gzip
+
+import pytest
+from flask import Flask, jsonify
+
+from src.services import http_cache
+from src.services.http_cache import MIN_COMPRESS_SIZE, ResponseCache, make_etag
+
+BODY = {"values": list(range(MIN_COMPRESS_SIZE))}
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    cache = ResponseCache(maxsize=4, max_age=60)
+    app.builds = []
+
+    @app.route("/data/<int:version>")
+    def data(version):
+        def build():
+            app.builds.append(version)
+            return jsonify(BODY)
+
+        return cache.respond(make_etag("data", version), build)
+
+    @app.route("/small")
+    def small():
+        return cache.respond(make_etag("small"), lambda: jsonify({"a": 1}))
+
+    @app.route("/fails")
+    def fails():
+        def build():
+            app.builds.append("fails")
+            return jsonify({"error": "Internal server error"}), 500
+
+        return cache.respond(make_etag("fails"), build)
+
+    return app
+
+
+def test_responses_carry_a_weak_etag_and_cache_headers(app):
+    response = app.test_client().get("/data/1")
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert etag == make_etag("data", 1) and weak
+    assert response.headers["ETag"] == f'W/"{etag}"'
+    assert response.headers["Cache-Control"] == "public, max-age=60"
+    assert response.headers["Vary"] == "Accept, Accept-Encoding"
+    assert response.get_json() == BODY
+
+
+@pytest.mark.parametrize("form", ['W/"{}"', '"{}"', '"other", W/"{}"', "*"])
+def test_matching_if_none_match_is_not_modified(app, form):
+    client = app.test_client()
+    etag = make_etag("data", 1)
+    response = client.get("/data/1", headers={"If-None-Match": form.format(etag)})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.get_etag() == (etag, True)
+    assert "Accept-Encoding" in response.headers["Vary"]
+    # Answered without building the response
+    assert app.builds == []
+
+
+def test_other_etags_get_the_response(app):
+    client = app.test_client()
+    stale = make_etag("data", 1)
+    response = client.get("/data/2", headers={"If-None-Match": f'W/"{stale}"'})
+    assert response.status_code == 200
+    assert response.get_etag() == (make_etag("data", 2), True)
+    client.get("/data/2")
+    assert app.builds == [2]
+
+
+def test_gzip_is_served_when_accepted(app):
+    client = app.test_client()
+    plain = client.get("/data/1", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+
+    response = client.get("/data/1", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == plain.data
+    assert response.get_etag() == plain.get_etag()
+
+    response = client.get("/data/1", headers={"Accept-Encoding": "gzip;q=0.5, br;q=0"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert app.builds == [1]
+
+
+def test_brotli_is_preferred_when_installed(app):
+    brotli = pytest.importorskip("brotli")
+    assert http_cache.brotli is not None
+    client = app.test_client()
+    plain = client.get("/data/1")
+
+    response = client.get("/data/1", headers={"Accept-Encoding": "gzip, deflate, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.data) == plain.data
+
+    response = client.get("/data/1", headers={"Accept-Encoding": "br;q=0.5, gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+def test_small_bodies_are_not_compressed(app):
+    response = app.test_client().get("/small", headers={"Accept-Encoding": "gzip, br"})
+    assert "Content-Encoding" not in response.headers
+    assert response.get_json() == {"a": 1}
+
+
+def test_errors_are_not_cached(app):
+    client = app.test_client()
+    for _ in range(2):
+        response = client.get("/fails")
+        assert response.status_code == 500
+        assert "ETag" not in response.headers
+        assert "Cache-Control" not in response.headers
+    assert app.builds == ["fails", "fails"]
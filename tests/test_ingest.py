@@ -0,0 +1,167 @@
+import json
+import random
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import ingest
+from src.services.data_analytics_service import DataService
+from src.services.proximity import ProximityService
+from src.services.rollup_cube import CubeService, RollupCube
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+# Two proximity pairs, so that both a source and a target get refreshed
+DATASETS = (
+    "redutor_velocidade",
+    "rede_prioritaria_onibus",
+    "estacionamento_rotativo",
+    "posto_venda_rotativo",
+)
+
+
+def shifted(wkt, metres):
+    """The WKT with its first x coordinate moved by metres"""
+    return re.sub(
+        r"(\d+\.\d+) (\d+\.\d+)",
+        lambda m: f"{float(m.group(1)) + metres:.2f} {m.group(2)}",
+        wkt,
+        count=1,
+    )
+
+
+def update(raw, rng, count=7):
+    names = [field["id"] for field in raw["fields"]]
+    for record in rng.sample(raw["records"], count):
+        for i, name in enumerate(names):
+            if name == "GEOMETRIA" and record[i]:
+                record[i] = shifted(record[i], 3.0)
+            elif name != "_id" and isinstance(record[i], str) and rng.random() < 0.5:
+                record[i] += " X"
+
+
+def delete(raw, rng, count=6):
+    for i in sorted(rng.sample(range(len(raw["records"])), count), reverse=True):
+        del raw["records"][i]
+
+
+def insert(raw, rng, count=4):
+    geometry = [field["id"] for field in raw["fields"]].index("GEOMETRIA")
+    top = max(record[0] for record in raw["records"])
+    for k, record in enumerate(rng.sample(raw["records"], count)):
+        record = list(record)
+        record[0] = top + k + 1
+        record[geometry] = shifted(record[geometry], 40.0)
+        raw["records"].append(record)
+
+
+def mixed(raw, rng):
+    update(raw, rng)
+    delete(raw, rng)
+    insert(raw, rng)
+
+
+def reordered(raw, rng):
+    update(raw, rng)
+    raw["records"].reverse()
+
+
+def unchanged(raw, rng):
+    pass
+
+
+def expected_counts(before, after):
+    """Inserted, updated and deleted records between two dumps, by _id"""
+    old = {record[0]: record for record in before["records"]}
+    new = {record[0]: record for record in after["records"]}
+    updated = [i for i in old.keys() & new.keys() if old[i] != new[i]]
+    return len(new.keys() - old.keys()), len(updated), len(old.keys() - new.keys())
+
+
+@pytest.fixture(scope="module")
+def ingested(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp("ingested")
+    for name in DATASETS:
+        shutil.copy2(DATA_DIR / f"{name}.json", data_dir)
+    ingest.ingest(data_dir, list(DATASETS))
+    return data_dir
+
+
+def state(data_dir, name):
+    """Store rows, proximity tables and cube answers of a dataset"""
+    data_service = DataService(data_dir=data_dir)
+    versions = {n: data_service.open_dataset(n)[0] for n in DATASETS}
+    assert versions[name][0] == "store"
+    dataset = data_service.open_dataset(name)[1]
+    result = {
+        "rows": json.dumps(dataset.rows()),
+        "lat": np.asarray(dataset.lat).tolist(),
+        "lng": np.asarray(dataset.lng).tolist(),
+        "geometry_offsets": np.asarray(dataset.geometry_offsets).tolist(),
+        "row_hashes": np.asarray(dataset.row_hashes).tolist(),
+    }
+
+    table_dir = ProximityService(data_service).table_dir
+    for source, target in ingest.NEAREST_TABLES:
+        if name in (source, target) and source in DATASETS and target in DATASETS:
+            with np.load(table_dir / f"{source}__{target}.npz") as table:
+                # The stored table is the one of the current versions
+                tag = [list(versions[source]), list(versions[target])]
+                assert json.loads(str(table["tag"])) == tag
+                result[(source, target)] = (
+                    table["rows"].tolist(),
+                    table["distance"].tolist(),
+                )
+
+    cube_service = CubeService(data_service)
+    with np.load(cube_service.cube_dir / f"{name}.npz") as arrays:
+        assert json.loads(str(arrays["tag"])) == list(versions[name])
+        cube = RollupCube.from_arrays({key: arrays[key] for key in arrays.files})
+    result["dimensions"] = cube.dimensions
+    result["measures"] = cube.measures
+    for dimension in cube.dimensions:
+        result[f"count by {dimension}"] = cube.query([dimension])
+        for measure in cube.measures:
+            result[f"{measure} by {dimension}"] = cube.query(
+                [dimension], "sum", measure
+            )
+    result["count by first two"] = cube.query(cube.dimensions[:2])
+    return result
+
+
+@pytest.mark.parametrize(
+    "name, change",
+    [
+        ("redutor_velocidade", mixed),
+        ("posto_venda_rotativo", mixed),
+        ("rede_prioritaria_onibus", update),
+        ("estacionamento_rotativo", reordered),
+        ("estacionamento_rotativo", unchanged),
+    ],
+    ids=lambda value: getattr(value, "__name__", None),
+)
+def test_refresh_matches_a_full_ingest(ingested, tmp_path, name, change):
+    with open(DATA_DIR / f"{name}.json", "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    before = json.loads(json.dumps(raw))
+    change(raw, random.Random(name))
+    counts = expected_counts(before, raw)
+    dump = tmp_path / "dump.json"
+    with open(dump, "w", encoding="utf-8") as f:
+        json.dump(raw, f)
+
+    refreshed = tmp_path / "refreshed"
+    shutil.copytree(ingested, refreshed)
+    result = ingest.refresh(refreshed, name, dump)
+    assert (result["inserted"], result["updated"], result["deleted"]) == counts
+    assert (refreshed / f"{name}.json").read_bytes() == dump.read_bytes()
+
+    full = tmp_path / "full"
+    shutil.copytree(ingested, full)
+    shutil.copy(dump, full / f"{name}.json")
+    ingest.ingest(full, [name])
+
+    assert state(refreshed, name) == state(full, name)
@@ -0,0 +1,70 @@
+import numpy as np
+import shapely
+
+from src.services.local_routing import RoadGraph
+
+
+def crossing_streets():
+    # Two streets crossing at (500, 500) without a shared vertex there
+    return RoadGraph.from_geometries(
+        shapely.from_wkt(
+            [
+                "LINESTRING (0 500, 1000 500)",
+                "LINESTRING (500 0, 500 1000)",
+            ]
+        )
+    )
+
+
+def node_at(graph, x, y):
+    node, distance = graph.nearest_node(x, y)
+    assert distance == 0
+    return node
+
+
+def test_crossing_lines_share_a_node():
+    graph = crossing_streets()
+    assert graph.node_count == 5
+    node_at(graph, 500, 500)
+
+
+def test_route_between_crossing_lines():
+    graph = crossing_streets()
+    source = node_at(graph, 0, 500)
+    target = node_at(graph, 500, 1000)
+    speed = 10.0
+
+    path = graph.shortest_path(source, target, graph.edge_costs(speed), speed)
+    assert path is not None
+    nodes, edges, seconds = path
+    assert nodes[0] == source and nodes[-1] == target
+    assert node_at(graph, 500, 500) in nodes
+    assert np.isclose(graph.lengths[edges].sum(), 1000)
+    assert np.isclose(seconds, 100)
+
+
+def test_travel_times_reach_every_arm():
+    graph = crossing_streets()
+    speed = 10.0
+    seconds, meters = graph.travel_times(
+        node_at(graph, 0, 500), graph.edge_costs(speed)
+    )
+    assert np.isfinite(seconds).all()
+    assert np.isclose(meters[node_at(graph, 1000, 500)], 1000)
+    assert np.isclose(meters[node_at(graph, 500, 0)], 1000)
+
+
+def test_edge_costs_are_cached_per_speed_and_penalties():
+    graph = crossing_streets()
+    costs = graph.edge_costs(10.0)
+    assert graph.edge_costs(10.0) is costs
+    assert np.allclose(costs, graph.lengths / 10.0)
+    assert graph.edge_costs(5.0) is not costs
+
+    centre = node_at(graph, 500, 500)
+    graph.add_penalties("lights", np.array([500.0]), np.array([500.0]), 15.0)
+    with_lights = graph.edge_costs(10.0, ["lights"])
+    assert with_lights is graph.edge_costs(10.0, ("lights",))
+    into_centre = np.asarray(graph.indices) == centre
+    expected = graph.lengths / 10.0 + np.where(into_centre, 15.0, 0.0)
+    assert np.allclose(with_lights, expected)
@@ -0,0 +1,21 @@
+from src.services.metrics import REGISTRY
+
+
+class FakeCache:
+    def stats(self):
+        return {"size": 2, "hits": 5, "misses": 3}
+
+
+def test_cache_hits_and_misses_are_counters():
+    REGISTRY.register_cache("fake", FakeCache())
+    try:
+        lines = REGISTRY.render().splitlines()
+    finally:
+        REGISTRY.register_cache("fake", None)
+
+    assert "# TYPE smart_cities_cache_hits_total counter" in lines
+    assert "# TYPE smart_cities_cache_misses_total counter" in lines
+    assert 'smart_cities_cache_hits_total{cache="fake"} 5' in lines
+    assert 'smart_cities_cache_misses_total{cache="fake"} 3' in lines
+    assert 'smart_cities_cache_entries{cache="fake"} 2' in lines
+    assert 'smart_cities_cache_hit_ratio{cache="fake"} 0.625' in lines
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+import shapely
+
+from src.services.data_analytics_service import DataService
+from src.services.proximity import ProximityService, parse_geometries
+
+PAIRS = [
+    ("estacionamento_rotativo", "posto_venda_rotativo"),
+    ("redutor_velocidade", "rede_prioritaria_onibus"),
+    ("posto_venda_rotativo", "sinalizacao_semaforica"),
+]
+
+# Source features checked against every target feature
+SAMPLE = 150
+
+
+@pytest.fixture(scope="module")
+def service():
+    return ProximityService(DataService())
+
+
+def brute_force(service, source, target):
+    """(sampled source rows, ids, target ids, distances to every target feature)"""
+    opened = [service.data_service.open_dataset(name) for name in (source, target)]
+    if None in opened:
+        pytest.skip(f"{source} or {target} is not in data/")
+    source_data, target_data = (dataset for _, dataset in opened)
+    rows = np.random.default_rng(11).permutation(len(source_data))[:SAMPLE]
+    rows.sort()
+    geometries = parse_geometries(source_data)[rows]
+    targets = parse_geometries(target_data)
+    distances = shapely.distance(geometries[:, None], targets[None, :])
+    source_ids = source_data.column("_id")
+    return rows, [source_ids[i] for i in rows], target_data.column("_id"), distances
+
+
+@pytest.mark.parametrize("source, target", PAIRS)
+@pytest.mark.parametrize("max_distance", [None, 150.0])
+def test_nearest(service, source, target, max_distance):
+    rows, ids, target_ids, distances = brute_force(service, source, target)
+    result = service.nearest(source, target, max_distance)
+    assert [result["source_ids"][i] for i in rows] == ids
+
+    for k, i in enumerate(rows):
+        found = result["target_ids"][i]
+        closest = np.nanmin(distances[k]) if np.isfinite(distances[k]).any() else None
+        if closest is None or (max_distance is not None and closest > max_distance):
+            assert found is None and result["distance"][i] is None
+            continue
+        assert result["distance"][i] == pytest.approx(closest, abs=0.01)
+        # Ties may pick any of the closest features
+        assert distances[k][target_ids.index(found)] == pytest.approx(closest)
+
+
+@pytest.mark.parametrize("source, target", PAIRS)
+@pytest.mark.parametrize("distance", [50.0, 400.0])
+def test_within_and_count_within(service, source, target, distance):
+    rows, ids, target_ids, distances = brute_force(service, source, target)
+    # Pairs too close to the threshold to compare with rounding are left out
+    borderline = np.abs(distances - distance) < 1e-6
+    assert not borderline.any()
+    close = distances <= distance
+
+    result = service.within(source, target, distance)
+    pairs = {}
+    for s, t, d in zip(result["source_ids"], result["target_ids"], result["distance"]):
+        pairs.setdefault(s, []).append((t, d))
+    for k, source_id in enumerate(ids):
+        expected = [
+            (target_ids[j], round(float(distances[k, j]), 2))
+            for j in np.flatnonzero(close[k])
+        ]
+        assert sorted(pairs.get(source_id, [])) == sorted(expected)
+
+    counts = service.count_within(source, target, distance)
+    assert [counts["count"][i] for i in rows] == close.sum(axis=1).tolist()
+    assert sum(counts["count"]) == len(result["source_ids"])
+
+
+def test_unknown_datasets(service):
+    assert service.nearest("no_such_dataset", "posto_venda_rotativo") is None
+    assert service.within("posto_venda_rotativo", "no_such_dataset", 10.0) is None
+    assert service.count_within("no_such_dataset", "no_such_dataset", 10.0) is None
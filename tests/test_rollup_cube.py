@@ -0,0 +1,226 @@
+import json
+import shutil
+from collections import defaultdict
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import ingest
+from src.services.bitmap_index import boletim_year, normalize, parse_filter
+from src.services.columnar_store import ColumnarDataset
+from src.services.data_analytics_service import DataService
+from src.services.rollup_cube import CUBE_FORMAT, CubeService, RollupCube
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+FIELDS = [
+    {"id": "_id", "type": "int"},
+    {"id": "NUMERO_BOLETIM", "type": "text"},
+    {"id": "INDICADOR_FATALIDADE", "type": "text"},
+    {"id": "BAIRRO", "type": "text"},
+    {"id": "FERIDOS", "type": "int"},
+    {"id": "PESO", "type": "text"},
+    {"id": "DATA_HORA", "type": "text"},
+]
+
+RECORDS = [
+    [1, "2017-001-001", "SIM", "CENTRO", 2, "1.5", "2017-03-01T10:00:00"],
+    [2, "2017-002-001", "NÃO", "CENTRO", 1, "2", "2017-05-01T10:00:00"],
+    [3, "2018-003-001", "NÃO", "SAVASSI", 0, "", "2018-01-01T10:00:00"],
+    [4, "2018-004-001", "NÃO", "", None, "0.25", None],
+    [5, "2019-005-001", "SIM", "LOURDES", 3, "4", "2019-07-01T10:00:00"],
+    [6, "2019-006-001", None, "CENTRO", 1, "1", "2019-08-01T10:00:00"],
+    [7, None, "NÃO", "SAVASSI", 1, "1", "2019-09-01T10:00:00"],
+    [8, "2018-008-001", "SIM", "CENTRO", 5, "3.5", "2018-02-01T10:00:00"],
+    [9, "2017-009-001", "NÃO", "Lourdes", 1, "1", "2017-11-01T10:00:00"],
+    [10, "2019-010-001", "NÃO", "CENTRO", 2, "0.5", "2019-12-01T10:00:00"],
+    [11, "2019-011-001", "SIM", "CENTRO", 1, "1", "2019-12-02T10:00:00"],
+    [12, "2018-012-001", "NÃO", "SAVASSI", 0, "2", "2018-12-02T10:00:00"],
+]
+
+
+def dimension_value(record, dimension, aliases):
+    """What the cube files a record under for a dimension, None if missing"""
+    dimension = aliases.get(dimension.lower(), dimension)
+
+    def field(name):
+        (key,) = [key for key in record if key.lower() == name.lower()]
+        return record[key]
+
+    if dimension.lower() == "year" and "NUMERO_BOLETIM" in record:
+        value = boletim_year(record["NUMERO_BOLETIM"])
+    elif dimension.endswith(".year"):
+        value = field(dimension[:-5])
+        value = value[:4] if value else None
+    else:
+        value = field(dimension)
+    return None if value == "" else value
+
+
+def group_by(records, dimensions, field=None, filters=None, aliases=()):
+    """{(label, ...): count or sum of field} straight from the records"""
+    aliases = dict(aliases)
+    totals = defaultdict(float)
+    for record in records:
+        if filters is not None and not any(
+            all(
+                dimension_value(record, name, aliases) is not None
+                and normalize(dimension_value(record, name, aliases))
+                in {normalize(v) for v in values}
+                for name, values in group
+            )
+            for group in filters
+        ):
+            continue
+        key = tuple(dimension_value(record, name, aliases) for name in dimensions)
+        value = record[field] if field else 1
+        totals[key] += 0.0 if value is None or value == "" else float(value)
+    return dict(totals)
+
+
+def answer(cube, dimensions, field=None, filters=None):
+    rows = cube.query(dimensions, "sum" if field else "count", field, filters)
+    values = [row["value"] for row in rows]
+    assert values == sorted(values, reverse=True)
+    return {tuple(row[name] for name in dimensions): row["value"] for row in rows}
+
+
+def check(cube, records, dimensions, field=None, filters=None):
+    expected = group_by(records, dimensions, field, filters, cube.aliases)
+    assert answer(cube, dimensions, field, filters) == pytest.approx(expected)
+
+
+@pytest.fixture(scope="module")
+def sample():
+    dataset = ColumnarDataset.from_json({"fields": FIELDS, "records": RECORDS})
+    return RollupCube.from_dataset(dataset), dataset.rows()
+
+
+def test_dimensions_and_measures(sample):
+    cube, _ = sample
+    assert cube.dimensions == [
+        "year",
+        "INDICADOR_FATALIDADE",
+        "BAIRRO",
+        "FERIDOS",
+        "DATA_HORA.year",
+    ]
+    assert cube.measures == ["FERIDOS", "PESO"]
+    # PESO has too many distinct values to be a dimension, and NUMERO_BOLETIM
+    # gives the year, so the date field is no alias of it
+    assert cube.aliases == {}
+
+
+@pytest.mark.parametrize(
+    "dimensions",
+    [
+        [],
+        ["year"],
+        ["YEAR"],
+        ["bairro"],
+        ["DATA_HORA.year"],
+        ["year", "INDICADOR_FATALIDADE"],
+        ["BAIRRO", "year", "INDICADOR_FATALIDADE"],
+        ["INDICADOR_FATALIDADE", "feridos", "BAIRRO", "data_hora.year"],
+    ],
+)
+@pytest.mark.parametrize("field", [None, "FERIDOS", "peso"])
+def test_queries_match_a_group_by(sample, dimensions, field):
+    cube, records = sample
+    measure = cube.measure(field) if field else None
+    expected = group_by(records, dimensions, measure)
+    assert answer(cube, dimensions, field) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "year:2019",
+        "year:2018|2019,INDICADOR_FATALIDADE:sim",
+        "bairro:centro;bairro:lourdes",
+        "bairro:centro,year:2017;INDICADOR_FATALIDADE:não,bairro:savassi",
+        "year:1999",
+    ],
+)
+@pytest.mark.parametrize("dimensions", [[], ["year"], ["BAIRRO", "FERIDOS"]])
+def test_filtered_queries_match_a_group_by(sample, expression, dimensions):
+    cube, records = sample
+    filters = parse_filter(expression)
+    check(cube, records, dimensions, None, filters)
+    check(cube, records, dimensions, "PESO", filters)
+
+
+def test_ties_are_ordered_by_label(sample):
+    cube, _ = sample
+    rows = cube.query(["INDICADOR_FATALIDADE"])
+    assert [row["INDICADOR_FATALIDADE"] for row in rows] == ["NÃO", "SIM", None]
+
+
+def test_unknown_names_are_rejected(sample):
+    cube, _ = sample
+    with pytest.raises(ValueError):
+        cube.query(["NO_SUCH_FIELD"])
+    with pytest.raises(ValueError):
+        cube.query(["year", "YEAR"])
+    with pytest.raises(ValueError):
+        cube.query([], "sum", "BAIRRO")
+
+
+def test_arrays_round_trip(sample):
+    cube, records = sample
+    arrays = cube.to_arrays()
+    copy = RollupCube.from_arrays(arrays)
+    assert copy.cuboids.keys() == cube.cuboids.keys()
+    for dimensions in (["year"], ["BAIRRO", "FERIDOS"], cube.dimensions):
+        assert copy.query(dimensions) == cube.query(dimensions)
+        assert copy.query(dimensions, "sum", "PESO") == cube.query(
+            dimensions, "sum", "PESO"
+        )
+
+    meta = json.loads(str(arrays["meta"]))
+    meta["format"] = CUBE_FORMAT + 1
+    with pytest.raises(ValueError):
+        RollupCube.from_arrays({**arrays, "meta": np.array(json.dumps(meta))})
+
+
+@pytest.fixture(scope="module")
+def ingested(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp("cubes")
+    names = ["redutor_velocidade", "estacionamento_rotativo"]
+    for name in names:
+        shutil.copy2(DATA_DIR / f"{name}.json", data_dir)
+    ingest.ingest(data_dir, names)
+    return data_dir
+
+
+@pytest.mark.parametrize("name", ["redutor_velocidade", "estacionamento_rotativo"])
+def test_stored_cubes_answer_like_the_records(ingested, monkeypatch, name):
+    data_service = DataService(data_dir=ingested)
+    records = data_service.open_dataset(name)[1].rows()
+    # The cube written at ingest is read back, not rebuilt
+    monkeypatch.setattr(RollupCube, "from_dataset", None)
+    cube_service = CubeService(data_service)
+    cube = cube_service.cube(name)
+
+    for dimension in cube.dimensions:
+        check(cube, records, [dimension])
+        for measure in cube.measures:
+            check(cube, records, [dimension], measure)
+    for dimensions in combinations(cube.dimensions[:4], 2):
+        check(cube, records, list(dimensions))
+    if "year" in cube.aliases:
+        check(cube, records, ["year"])
+        check(cube, records, ["BAIRRO"], None, parse_filter("year:2019|2020"))
+
+    result = cube_service.query(
+        name, ["BAIRRO"], "count", parse_filter("bairro:centro")
+    )
+    assert result["rows"] == cube.query(
+        ["BAIRRO"], "count", None, [[("BAIRRO", ["centro"])]]
+    )
+    assert result["dimensions"] == cube.dimensions
+    assert cube_service.query("no_such_dataset") is None
+    with pytest.raises(ValueError):
+        cube_service.query(name, [], "avg:BAIRRO")
@@ -0,0 +1,132 @@
+import threading
+import time
+
+from src.services.google_maps_api import GoogleMapsService
+from src.services.route_cache import RouteCache
+
+
+class FakeClient:
+    """Stands in for googlemaps.Client, counting Directions calls"""
+
+    def __init__(self, gate=None):
+        self.calls = 0
+        self.gate = gate
+        self._lock = threading.Lock()
+
+    def directions(self, origin, destination, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(timeout=5)
+        return [{"summary": f"{origin} -> {destination}", "legs": [{}]}]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def service(cache, gate=None):
+    return GoogleMapsService(client=FakeClient(gate), route_cache=cache)
+
+
+def test_identical_requests_hit_the_cache():
+    maps = service(RouteCache())
+    first = maps.get_route("Praça Sete", "Savassi", "driving")
+    # Case and spacing do not change the key
+    second = maps.get_route("  praça   sete", "SAVASSI", "Driving")
+
+    assert second == first
+    assert maps.client.calls == 1
+    stats = maps.route_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_entries_expire_after_the_ttl():
+    clock = FakeClock()
+    maps = service(RouteCache(ttl=60, clock=clock))
+    maps.get_route("Praça Sete", "Savassi", "driving")
+
+    clock.now += 59
+    maps.get_route("Praça Sete", "Savassi", "driving")
+    assert maps.client.calls == 1
+
+    clock.now += 2
+    maps.get_route("Praça Sete", "Savassi", "driving")
+    assert maps.client.calls == 2
+    assert maps.route_cache.stats()["misses"] == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    maps = service(RouteCache(maxsize=2))
+    maps.get_route("A", "B", "driving")
+    maps.get_route("C", "D", "driving")
+    # Touch A -> B so that C -> D is the least recently used
+    maps.get_route("A", "B", "driving")
+    maps.get_route("E", "F", "driving")
+    assert maps.client.calls == 3
+    assert maps.route_cache.stats()["size"] == 2
+
+    maps.get_route("A", "B", "driving")
+    assert maps.client.calls == 3
+    maps.get_route("C", "D", "driving")
+    assert maps.client.calls == 4
+
+
+def test_routes_persist_across_instances(tmp_path):
+    db_path = tmp_path / "routes.sqlite"
+    clock = FakeClock()
+    first = service(RouteCache(ttl=60, db_path=db_path, clock=clock))
+    route = first.get_route("Praça Sete", "Savassi", "driving", ["Mercado Central"])
+
+    second = service(RouteCache(ttl=60, db_path=db_path, clock=clock))
+    again = second.get_route("Praça Sete", "Savassi", "driving", ["Mercado Central"])
+    assert again == route
+    assert second.client.calls == 0
+    assert second.route_cache.stats()["hits"] == 1
+
+    # Expired rows are not served from the database either
+    clock.now += 61
+    third = service(RouteCache(ttl=60, db_path=db_path, clock=clock))
+    third.get_route("Praça Sete", "Savassi", "driving", ["Mercado Central"])
+    assert third.client.calls == 1
+
+
+def test_concurrent_identical_requests_share_one_call():
+    gate = threading.Event()
+    maps = service(RouteCache(), gate)
+    callers = 8
+    results = []
+
+    def request():
+        results.append(maps.get_route("Praça Sete", "Savassi", "driving"))
+
+    threads = [threading.Thread(target=request) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    # Hold the upstream call until every other caller waits on it
+    deadline = time.monotonic() + 5
+    while maps.route_cache.stats()["coalesced"] < callers - 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    gate.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert maps.client.calls == 1
+    assert len(results) == callers
+    assert all(result == results[0] for result in results)
+    stats = maps.route_cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, callers - 1, 0)
+
+
+def test_missing_routes_are_not_cached():
+    maps = service(RouteCache())
+    maps.client.directions = lambda *args, **kwargs: []
+    assert maps.get_route("A", "B", "driving") is None
+    assert maps.get_route("A", "B", "driving") is None
+    assert maps.route_cache.stats()["misses"] == 2
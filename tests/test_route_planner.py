@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+
+from src.main.app import create_app
+from src.services.route_planner import DEFAULT_MAX_STOPS, RoutePlanner, split_itinerary
+from src.services.wire_format import decode_polyline, encode_polyline
+
+# Stops placed along a meridian, one polyline point per stop
+STOPS = [f"Stop {i}" for i in range(60)]
+
+
+def position(address):
+    return round(-19.9 + STOPS.index(address) * 0.001, 5), -43.9
+
+
+class FakeMaps:
+    """Stands in for GoogleMapsService, answering like the Directions API"""
+
+    def __init__(self, failing_modes=()):
+        self.failing_modes = set(failing_modes)
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get_route(self, origin, destination, mode, waypoints=None):
+        with self._lock:
+            self.requests.append((origin, destination, mode, waypoints))
+        if mode in self.failing_modes:
+            raise RuntimeError(f"{mode} is down")
+        stops = [origin, *(waypoints or []), destination]
+        lat, lng = zip(*(position(stop) for stop in stops))
+        return {
+            "legs": [
+                {
+                    "start_address": start,
+                    "end_address": end,
+                    "distance": {"text": "1.0 km", "value": 1000},
+                    "duration": {"text": "2 mins", "value": 120},
+                }
+                for start, end in zip(stops[:-1], stops[1:])
+            ],
+            "overview_polyline": {"points": encode_polyline(lat, lng)},
+        }
+
+
+def test_split_at_the_waypoint_limit():
+    parts = split_itinerary(STOPS[:60], "driving")
+    assert [len(part) for part in parts] == [DEFAULT_MAX_STOPS, 27, 8]
+    # Consecutive parts share their joint stop and cover every hop once
+    for before, after in zip(parts[:-1], parts[1:]):
+        assert before[-1] == after[0]
+    assert sum(len(part) - 1 for part in parts) == 59
+
+    assert split_itinerary(STOPS[:27], "driving") == [STOPS[:27]]
+    assert split_itinerary(STOPS[:1], "driving") == []
+
+
+def test_transit_is_split_into_single_hops():
+    parts = split_itinerary(STOPS[:4], "transit")
+    assert parts == [STOPS[0:2], STOPS[1:3], STOPS[2:4]]
+
+
+def test_legs_are_assembled_in_itinerary_order():
+    maps = FakeMaps()
+    planner = RoutePlanner(maps, max_workers=4)
+    result = planner.plan(STOPS[:6], "transit")
+
+    assert len(maps.requests) == 5
+    route = result["route"]
+    assert [(s["start"], s["end"]) for s in route["segments"]] == list(
+        zip(STOPS[:5], STOPS[1:6])
+    )
+    assert route["total_distance_km"] == 5.0
+    assert route["total_duration_mins"] == 10.0
+
+
+def test_join_polylines_keeps_order_and_drops_joints():
+    parts = split_itinerary(STOPS[:60], "driving")
+    maps = FakeMaps()
+    result = RoutePlanner(maps).plan(STOPS[:60], "driving")
+
+    assert len(maps.requests) == len(parts)
+    lat, lng = decode_polyline(result["polyline"])
+    expected = [position(stop) for stop in STOPS[:60]]
+    assert list(zip(lat, lng)) == expected
+
+
+def test_a_failed_mode_does_not_break_the_comparison():
+    maps = FakeMaps(failing_modes={"transit"})
+    planner = RoutePlanner(maps)
+    results = planner.compare(STOPS[:3], ["driving", "transit", "walking"])
+
+    assert results["transit"] is None
+    for mode in ("driving", "walking"):
+        segments = results[mode]["route"]["segments"]
+        assert [s["mode"] for s in segments] == [mode, mode]
+
+
+@pytest.mark.parametrize(
+    "modes", [[["driving"]], [{"a": 1}], ["bogus"], ["driving", None], "driving", []]
+)
+def test_invalid_modes_are_rejected(monkeypatch, modes):
+    from src.main.routes import routes
+
+    maps = FakeMaps()
+    monkeypatch.setattr(routes, "route_planner", RoutePlanner(maps))
+    client = create_app().test_client()
+    response = client.post(
+        "/calculate_route", json={"addresses": STOPS[:2], "modes": modes}
+    )
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    assert maps.requests == []
+
+
+def test_modes_are_compared(monkeypatch):
+    from src.main.routes import routes
+
+    monkeypatch.setattr(routes, "route_planner", RoutePlanner(FakeMaps(["transit"])))
+    client = create_app().test_client()
+    response = client.post(
+        "/calculate_route",
+        json={"addresses": STOPS[:3], "modes": ["walking", "transit", "walking"]},
+    )
+    assert response.status_code == 200
+    routes = response.get_json()["routes"]
+    assert sorted(routes) == ["transit", "walking"]
+    assert routes["transit"] == {"error": "Could not calculate route"}
+    assert "error" not in routes["walking"]
@@ -0,0 +1,26 @@
+import pytest
+
+from src.main.app import create_app
+
+
+@pytest.fixture(scope="module")
+def client():
+    return create_app().test_client()
+
+
+@pytest.mark.parametrize("zoom", ["abc", "1.5", "", "23", "-1"])
+def test_invalid_zoom_is_rejected(client, zoom):
+    response = client.get(
+        "/get_heatmap_data", query_string={"type": "speed-reducer", "zoom": zoom}
+    )
+    assert response.status_code == 400
+    assert "zoom" in response.get_json()["error"].lower()
+
+
+def test_zoom_sizes_the_cells(client):
+    response = client.get(
+        "/get_heatmap_data",
+        query_string={"type": "speed-reducer", "agg": "grid", "zoom": "12"},
+    )
+    assert response.status_code == 200
+    assert response.get_json()["cells"]
@@ -0,0 +1,45 @@
+import pickle
+
+from src.main.app import create_app, load_snapshot, save_snapshot
+from src.services.data_analytics_service import DataService
+
+UNPICKLED = []
+
+
+class Tripwire:
+    """Records being unpickled"""
+
+    def __reduce__(self):
+        return UNPICKLED.append, ("unpickled",)
+
+
+def test_analytics_round_trip():
+    source = DataService()
+    assert source.load_dataset("posto_venda_rotativo", per_page=1) is not None
+    entries = source.analytics_snapshot()
+    assert [key for key, _, _ in entries] == ["posto_venda_rotativo"]
+
+    target = DataService()
+    target.restore_analytics(entries)
+    assert target.analytics_snapshot() == entries
+
+
+def test_snapshot_is_saved_and_loaded(tmp_path):
+    from src.main.routes.routes import data_service
+
+    app = create_app()
+    data_service.load_dataset("posto_venda_rotativo", per_page=1)
+    path = tmp_path / "caches.snapshot"
+    save_snapshot(app, path)
+    assert load_snapshot(app, path)
+
+
+def test_other_formats_are_not_unpickled(tmp_path):
+    app = create_app()
+    path = tmp_path / "caches.snapshot"
+    with open(path, "wb") as f:
+        pickle.dump({"format": 1, "caches": Tripwire()}, f)
+
+    assert not load_snapshot(app, path)
+    assert UNPICKLED == []
+    assert not load_snapshot(app, tmp_path / "missing.snapshot")
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from src.services.spatial_index import FeatureIndex, feature_bounds, parse_bbox
+
+
+def sample_features(count=400, seed=9):
+    """Vertices of features with 0 to 6 vertices each, and their offsets"""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(0, 7, count)
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    start_lat = np.repeat(rng.uniform(-20.0, -19.8, count), sizes)
+    start_lng = np.repeat(rng.uniform(-44.1, -43.8, count), sizes)
+    lat = start_lat + rng.normal(0, 0.002, offsets[-1])
+    lng = start_lng + rng.normal(0, 0.002, offsets[-1])
+    return lat, lng, offsets
+
+
+def brute_force(lat, lng, offsets, bbox):
+    min_lat, min_lng, max_lat, max_lng = bbox
+    found = []
+    for i in range(len(offsets) - 1):
+        start, end = offsets[i], offsets[i + 1]
+        a, b = lat[start:end], lng[start:end]
+        if len(a) and (
+            a.min() <= max_lat
+            and a.max() >= min_lat
+            and b.min() <= max_lng
+            and b.max() >= min_lng
+        ):
+            found.append(i)
+    return found
+
+
+def test_bbox_queries_match_brute_force():
+    lat, lng, offsets = sample_features()
+    index = FeatureIndex(lat, lng, offsets)
+    assert len(index) == np.count_nonzero(np.diff(offsets))
+
+    rng = np.random.default_rng(10)
+    for _ in range(200):
+        min_lat, max_lat = np.sort(rng.uniform(-20.02, -19.78, 2))
+        min_lng, max_lng = np.sort(rng.uniform(-44.12, -43.78, 2))
+        bbox = (min_lat, min_lng, max_lat, max_lng)
+        assert index.query(bbox).tolist() == brute_force(lat, lng, offsets, bbox)
+
+    # A single vertex touched by a degenerate box
+    i = int(np.flatnonzero(np.diff(offsets))[0])
+    point = (lat[offsets[i]], lng[offsets[i]])
+    assert i in index.query(point + point).tolist()
+    assert index.query((10.0, 10.0, 11.0, 11.0)).tolist() == []
+
+
+def test_feature_bounds():
+    lat = np.array([1.0, 3.0, 2.0, 5.0])
+    lng = np.array([10.0, 8.0, 9.0, 7.0])
+    features, min_lat, min_lng, max_lat, max_lng = feature_bounds(
+        lat, lng, [0, 0, 2, 2, 3, 4]
+    )
+    assert features.tolist() == [1, 3, 4]
+    assert min_lat.tolist() == [1.0, 2.0, 5.0]
+    assert max_lat.tolist() == [3.0, 2.0, 5.0]
+    assert min_lng.tolist() == [8.0, 9.0, 7.0]
+    assert max_lng.tolist() == [10.0, 9.0, 7.0]
+
+    empty = FeatureIndex([], [], [0, 0])
+    assert len(empty) == 0
+    assert empty.query((0.0, 0.0, 1.0, 1.0)).tolist() == []
+
+
+def test_parse_bbox():
+    assert parse_bbox("-19.95,-43.99, -19.90 ,-43.90") == (
+        -19.95,
+        -43.99,
+        -19.90,
+        -43.90,
+    )
+    assert parse_bbox("1,2,1,2") == (1.0, 2.0, 1.0, 2.0)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        "",
+        "1,2,3",
+        "1,2,3,4,5",
+        "a,2,3,4",
+        "1,2,nan,4",
+        "1,2,inf,4",
+        "3,2,1,4",
+        "1,4,3,2",
+    ],
+)
+def test_invalid_bboxes(value):
+    with pytest.raises(ValueError):
+        parse_bbox(value)
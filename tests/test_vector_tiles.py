@@ -0,0 +1,53 @@
+import json
+import shutil
+from pathlib import Path
+
+import ingest
+from src.services.heatmap_service import HeatmapService
+from src.services.vector_tiles import TileService
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+NAME = "redutor_velocidade"
+
+
+def tile_service(data_dir):
+    return TileService(HeatmapService(data_dir=data_dir), [NAME])
+
+
+def first_tile(service, z=12):
+    _, layer = service.layer(NAME)
+    x, y = next(iter(layer.covering_tiles(z)))
+    return z, x, y
+
+
+def pyramids(service):
+    return sorted(path.name for path in (service.tile_dir / NAME).iterdir())
+
+
+def test_pyramids_of_older_versions_are_dropped(tmp_path):
+    shutil.copy2(DATA_DIR / f"{NAME}.json", tmp_path)
+    ingest.ingest(tmp_path, [NAME])
+    service = tile_service(tmp_path)
+    z, x, y = first_tile(service)
+    assert service.get_tile(NAME, z, x, y)
+    (first,) = pyramids(service)
+
+    # A pyramid left by another version goes when the current one is served
+    (service.tile_dir / NAME / "0123456789abcdef").mkdir()
+    service = tile_service(tmp_path)
+    assert service.get_tile(NAME, z, x + 1, y) is not None
+    assert pyramids(service) == [first]
+
+    with open(DATA_DIR / f"{NAME}.json", "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    del raw["records"][0]
+    dump = tmp_path / "dump.json"
+    with open(dump, "w", encoding="utf-8") as f:
+        json.dump(raw, f)
+    ingest.refresh(tmp_path, NAME, dump)
+    assert pyramids(service) == []
+
+    service = tile_service(tmp_path)
+    assert service.get_tile(NAME, z, x, y)
+    (second,) = pyramids(service)
+    assert second != first
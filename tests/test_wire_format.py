@@ -0,0 +1,87 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from src.services.wire_format import (
+    decode_polyline,
+    encode_layer,
+    encode_polyline,
+    pack_binary,
+)
+
+# The worked example of Google's encoded polyline algorithm
+GOOGLE_POLYLINE = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+GOOGLE_POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+
+
+def test_google_sample():
+    lat, lng = zip(*GOOGLE_POINTS)
+    assert encode_polyline(np.array(lat), np.array(lng)) == GOOGLE_POLYLINE
+
+    lat, lng = decode_polyline(GOOGLE_POLYLINE)
+    assert np.allclose(np.stack([lat, lng], axis=1), GOOGLE_POINTS, atol=1e-9)
+
+
+@pytest.mark.parametrize("precision", [5, 6])
+def test_round_trip(precision):
+    rng = np.random.default_rng(4)
+    lat = np.round(rng.uniform(-90, 90, 1000), precision)
+    lng = np.round(rng.uniform(-180, 180, 1000), precision)
+    # Repeated points and tiny steps give zero and one-chunk deltas
+    lat[10:20], lng[10:20] = lat[9], lng[9]
+    lat[30] = lat[29] + 10**-precision
+
+    encoded = encode_polyline(lat, lng, precision)
+    decoded_lat, decoded_lng = decode_polyline(encoded, precision)
+    assert np.allclose(decoded_lat, lat, atol=10**-precision / 2)
+    assert np.allclose(decoded_lng, lng, atol=10**-precision / 2)
+
+
+def test_empty_polyline():
+    assert encode_polyline(np.empty(0), np.empty(0)) == ""
+    lat, lng = decode_polyline("")
+    assert len(lat) == len(lng) == 0
+
+
+def unpack_binary(data, weighted=False):
+    (length,) = struct.unpack_from("<I", data, 0)
+    header = json.loads(data[4:][:length].decode("utf-8"))
+    columns = np.frombuffer(data, dtype="<f4", offset=4 + length)
+    return length, header, columns.reshape(3 if weighted else 2, -1)
+
+
+@pytest.mark.parametrize("weights", [None, [1, 2, 5]])
+def test_pack_binary_layout(weights):
+    lat, lng = np.array([-19.9, -19.8, -19.7]), np.array([-43.9, -43.95, -44.0])
+    # Multi-byte characters: the padding counts bytes, not characters
+    header = {"count": 3, "details": {"BAIRRO": ["São João", "Ç", None]}}
+    data = pack_binary(lat, lng, header, weights)
+
+    length, decoded, columns = unpack_binary(data, weights is not None)
+    assert length % 4 == 0
+    assert decoded == header
+    compact = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    assert data[4:][:length] == compact + b" " * (length - len(compact))
+    assert length - len(compact) < 4
+    assert len(data) == 4 + length + 4 * 3 * len(columns)
+    assert np.array_equal(columns[0], lat.astype(np.float32))
+    assert np.array_equal(columns[1], lng.astype(np.float32))
+    if weights is not None:
+        assert columns[2].tolist() == weights
+
+
+def test_binary_layer_header():
+    lat, lng = np.array([-19.9, -19.8]), np.array([-43.9, -43.95])
+    data = encode_layer(
+        "binary", lat, lng, [{"id": 1}, {"id": 2}], np.array([3, 4]), {"total": 7}
+    )
+    _, header, columns = unpack_binary(data, weighted=True)
+    assert header == {
+        "count": 2,
+        "weighted": True,
+        "details": {"id": [1, 2]},
+        "total": 7,
+    }
+    assert columns[2].tolist() == [3, 4]
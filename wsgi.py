@@ -0,0 +1,18 @@
+import gc
+import os
+from src.main.app import create_app, load_snapshot, save_snapshot, warm_caches
+
+app = create_app()
+
+# BOOT_SNAPSHOT names a file of pre-built caches: loaded at boot when it
+# exists, written after warming the caches when it does not
+snapshot = os.getenv("BOOT_SNAPSHOT")
+if not (snapshot and load_snapshot(app, snapshot)):
+    if os.getenv("PRELOAD_DATA", "true").lower() not in ("0", "false", "no"):
+        warm_caches(app)
+        if snapshot:
+            save_snapshot(app, snapshot)
+
+# Keep the warmed objects out of the cyclic collector so its passes in the
+# workers don't write to (and so un-share) the pages inherited from the master
+gc.freeze()